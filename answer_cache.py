@@ -0,0 +1,73 @@
+""" Cache of answers to opening questions, shared by every worker through the state backend
+
+Only the first question of a conversation is cached since later answers depend
+on the history. A hit also restores the course the classifier picked. Keys
+include the corpus version, the collections the aliases point at, so answers
+from before a reindex or restore stop being served once the aliases switch.
+"""
+import re
+import json
+import time
+import hashlib
+from qdrant import schema
+
+NOT_WORD = re.compile(r"[^a-z0-9 ]+")
+
+
+def normalize_question(question):
+    """ Lowercase, no punctuation, single spaces, so "Office hours?" and "office hours" share an entry """
+    return " ".join(NOT_WORD.sub(" ", question.lower()).split())
+
+
+class CorpusVersion:
+    """ Callable returning the collections the aliases point at, looked up at most every refresh_seconds.
+    The last known version is kept while qdrant can't be reached, None until one is known """
+
+    def __init__(self, client, aliases, refresh_seconds=30):
+        self.client = client
+        self.aliases = aliases
+        self.refresh_seconds = refresh_seconds
+        self.value = None
+        self.checked = 0.0
+
+    def __call__(self):
+        if self.value is None or time.monotonic() - self.checked > self.refresh_seconds:
+            try:
+                self.value = ",".join(schema.alias_target(self.client, alias) or alias for alias in self.aliases)
+            except Exception as error:
+                print(f"corpus version lookup failed: {error}")
+            self.checked = time.monotonic()
+        return self.value
+
+
+class AnswerCache:
+    def __init__(self, backend, ttl=86400, corpus_version=None):
+        self.backend = backend
+        self.ttl = ttl
+        self.corpus_version = corpus_version
+
+    def key(self, question):
+        """ Backend key of a question, None while the corpus version is unknown """
+        text = normalize_question(question)
+        if self.corpus_version is not None:
+            version = self.corpus_version()
+            if version is None:
+                return None
+            text = f"{version}\n{text}"
+        digest = hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+        return f"answer:{digest}"
+
+    def get(self, question):
+        """ Returns {"answer", "course"} or None, and counts hits and misses """
+        if not self.ttl:
+            return None
+        key = self.key(question)
+        blob = None if key is None else self.backend.get(key)
+        self.backend.incr("stats:answer_cache:hits" if blob else "stats:answer_cache:misses")
+        return None if blob is None else json.loads(blob)
+
+    def put(self, question, answer, course):
+        key = self.key(question) if self.ttl else None
+        if key is not None:
+            self.backend.set(key, json.dumps({"answer": answer, "course": course}).encode("utf-8"),
+                             self.ttl)
@@ -0,0 +1,104 @@
+""" Throughput of the gunicorn launcher at 1, 2, 4 and 8 worker processes
+
+For each worker count gunicorn is started on a spare port and /readyz is polled
+until a worker is ready; --settle seconds later, so the rest have warmed up too,
+--clients concurrent sessions post the questions below for --seconds. Reports requests/s and latency percentiles per worker count.
+Questions go through the whole pipeline, OpenAI included, so this costs tokens;
+after the first question of a session answers are not cached. Run it from this
+folder with state_backend set to sqlite or redis and rate_limit_per_minute = 0.
+
+    python bench_workers.py
+    python bench_workers.py --workers 1 4 --clients 32 --seconds 60
+"""
+import sys
+import time
+import argparse
+import subprocess
+import urllib.error
+import urllib.parse
+import urllib.request
+import http.cookiejar
+from concurrent.futures import ThreadPoolExecutor
+
+QUESTIONS = [
+    "How many credits is COMP 690?",
+    "When are the office hours for COMP 893?",
+    "How do I register my internship in Handshake?",
+    "How many hours do I need to work for the internship?",
+    "What are the weekly assignments?",
+]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def wait_ready(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/readyz", timeout=5) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def client(url, stop_at, offset):
+    """ One session asking QUESTIONS round robin until stop_at, returns (latencies, errors) """
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    opener.open(url + "/", timeout=30).read()
+    latencies, errors = [], 0
+    n = offset
+    while time.monotonic() < stop_at:
+        data = urllib.parse.urlencode({"message": QUESTIONS[n % len(QUESTIONS)]}).encode()
+        n += 1
+        start = time.perf_counter()
+        try:
+            opener.open(url + "/llm_response", data=data, timeout=120).read()
+            latencies.append(time.perf_counter() - start)
+        except (urllib.error.URLError, OSError):
+            errors += 1
+    return latencies, errors
+
+
+def run(workers, args):
+    url = f"http://127.0.0.1:{args.port}"
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "--workers", str(workers), "--bind",
+                               f"127.0.0.1:{args.port}", "--max-requests", "0", args.app],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not wait_ready(url, args.start_timeout):
+            raise RuntimeError(f"gunicorn with {workers} workers wasn't ready after {args.start_timeout}s")
+        # give the other workers time to finish their own warm-up
+        time.sleep(args.settle)
+        start = time.monotonic()
+        with ThreadPoolExecutor(args.clients) as pool:
+            results = list(pool.map(lambda i: client(url, start + args.seconds, i), range(args.clients)))
+        elapsed = time.monotonic() - start
+    finally:
+        server.terminate()
+        server.wait()
+    latencies = [latency for result in results for latency in result[0]]
+    return len(latencies) / elapsed, latencies, sum(result[1] for result in results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs = "*", type = int, default = [1, 2, 4, 8], help = "worker counts to compare")
+    parser.add_argument("--clients", type = int, default = 16, help = "concurrent sessions")
+    parser.add_argument("--seconds", type = float, default = 30, help = "load duration per worker count")
+    parser.add_argument("--port", type = int, default = 18960, help = "port for the benchmarked server")
+    parser.add_argument("--app", default = "wsgi:app", help = "wsgi application to serve")
+    parser.add_argument("--start-timeout", type = float, default = 120, help = "seconds to wait for /readyz")
+    parser.add_argument("--settle", type = float, default = 5, help = "seconds to wait after the first worker is ready")
+    args = parser.parse_args()
+
+    print(f"{'workers':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for workers in args.workers:
+        rate, latencies, errors = run(workers, args)
+        print(f"{workers:>7}{rate:>9.1f}{percentile(latencies, 0.5) * 1000:>9.0f}"
+              f"{percentile(latencies, 0.95) * 1000:>9.0f}{percentile(latencies, 0.99) * 1000:>9.0f}{errors:>8}")
@@ -1,52 +1,136 @@
-import os
 import time
-import csv
-import PyPDF2
+# everything imported here is needed to serve, imports only used by some setups happen where they are used
+IMPORT_START = time.perf_counter()
+import os
 import configparser
 from qdrant_client import QdrantClient
-from qdrant import qdrantsearch
-from fastembed import TextEmbedding
-from flask import Flask, render_template, request, redirect, session, make_response
+from qdrant import qdrantsearch, schema, embedding
+import state_backend
+import session_store
+import answer_cache
+import history
+import request_log
+import metrics
+import tracing
+import token_usage
+import profiler
+import memory_stats
+import startup
+import health
+from flask import Flask, render_template, request, session, make_response, Response, jsonify
 from openai import OpenAI
-from itertools import chain
-from datetime import datetime 
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
 
 config = configparser.ConfigParser()
 config.read("config.txt")
 
 app = Flask(__name__)
 app.secret_key = "comp690"
+# set by main() once startup and warm-up are done, /readyz fails until then
+readiness = None
 
 @app.route("/")
 def hello_world():
-    session['history'] = [prompt]
-    session['course'] = ""
+    if 'sid' not in session:
+        session['sid'] = session_store.new_session_id()
+    conversations.reset(session['sid'])
     return render_template("chatbotUI.html")
 
+def load_conversation():
+    """ Conversation for the request's session id, a new one if it expired or never existed """
+    if 'sid' not in session:
+        session['sid'] = session_store.new_session_id()
+    conversation = conversations.get(session['sid'])
+    if conversation is None:
+        conversation = session_store.new_conversation()
+    return conversation
+
+def allow_request(session_id):
+    """ Per-session rate limit, counted in the shared state backend so it holds across workers """
+    if not rate_limit:
+        return True
+    window = int(time.time() // 60)
+    return state.incr(f"rate:{session_id}:{window}", ttl=60) <= rate_limit
+
 @app.route('/llm_response', methods=['POST', 'PUT'])
+@profiler.on_demand
+@tracing.traced("handle_post")
 def handle_post():
     if request.method == 'POST':
-        if 'history' not in session:
-            session['history'] = [prompt]
-            session['course'] = ""
+        conversation = load_conversation()
+        if not allow_request(session['sid']):
+            metrics.REQUESTS.labels("rate_limited").inc()
+            tracing.set_attribute("chatbot.rate_limited", True)
+            return make_response("You're sending messages too quickly, please wait a moment.", 429)
 
         message = request.form['message']
-        session['history'].append( {"role": "user", "content": f"{message}"})
+        conversation['history'].append( {"role": "user", "content": f"{message}"})
 
-        response = make_response(get_response(session))
+        metrics.IN_FLIGHT.inc()
+        try:
+            answer = get_response(conversation)
+        except Exception:
+            metrics.REQUESTS.labels("error").inc()
+            raise
+        finally:
+            metrics.IN_FLIGHT.dec()
+        response = make_response(answer)
         response.mimetype = "text/plain"
-        session['history'].append( {"role": "assistant", "content": f"{response}"})
+        conversation['history'].append( {"role": "assistant", "content": f"{answer}"})
+        conversations.put(session['sid'], conversation)
+        history_manager.schedule_summary(session['sid'], conversation)
         return response
     elif request.method == 'PUT':
-        session['history'] = [prompt]
-        session['course'] = ""
+        load_conversation()
+        conversations.reset(session['sid'])
         response = "all good"
         return response
 
-def answer_question(messages, chunks):
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/healthz')
+def healthz():
+    return Response("ok\n", mimetype="text/plain")
+
+@app.route('/readyz')
+def readyz():
+    if readiness is None:
+        return jsonify({"ready": False, "starting": True}), 503
+    ready, body = readiness.report()
+    return jsonify(body), 200 if ready else 503
+
+@app.route('/debug/memory', methods=['GET', 'DELETE'])
+def memory_endpoint():
+    """ Operator only: GET starts tracemalloc or diffs against the previous snapshot, DELETE stops it.
+    The snapshots are this process's, so under gunicorn this needs workers = 1 """
+    if not profiler.operator_request("X-Operator-Token"):
+        return make_response("Not Found", 404)
+    if request.method == 'DELETE':
+        text = snapshots.stop()
+    else:
+        text = snapshots.take(request.args.get("top", 25, type=int))
+    return Response(f"worker {os.getpid()}\n{text}", mimetype="text/plain")
+
+def chat_completion(call, messages, conversation, model="gpt-4o-mini"):
+    """ OpenAI chat call in its own span, which records the model, token usage and retries the client made.
+    The usage is added to the session and daily token totals """
+    with tracing.span(f"openai.{call}", {"llm.model": model, "llm.messages": len(messages)}) as span:
+        raw = open_client.chat.completions.with_raw_response.create(model = model, messages = messages)
+        response = raw.parse()
+        span.set_attribute("openai.retries", raw.retries_taken)
+        counts = accounting.record(session['sid'], conversation.get('course'), model, response)
+        span.set_attribute("llm.prompt_tokens", counts["prompt"])
+        span.set_attribute("llm.completion_tokens", counts["completion"])
+        span.set_attribute("llm.cached_tokens", counts["cached"])
+    metrics.count_tokens(call, counts)
+    return response
+
+@tracing.traced("answer_question")
+def answer_question(messages, chunks, conversation, model="gpt-4o-mini"):
     history = messages.copy()
-    loc_chunks = chunks.copy()
-    loc_chunks = [mes.payload.values() for x in chunks for mes in x]    
+    loc_chunks = [schema.payload_text(mes.payload) for x in chunks for mes in x]
     
     for payload in loc_chunks:
         history.append({"role": "system", "content": f"""context:
@@ -54,17 +138,36 @@ def answer_question(messages, chunks):
         """})
        # print(payload)
 
-    response = open_client.chat.completions.create(model = "gpt-4o-mini", messages = history)
+    response = chat_completion("answer", history, conversation, model)
     return response
 
 def main():
+    load()
+    connect()
+
+def load(embed_threads=None):
+    """ Everything the workers can share: settings, prompt, embedding model and any artifacts index.
+    The gunicorn launcher runs this once before forking """
     global qdrant_client
-    global openai_key
-    global open_client
     global embed_model
     global prompt
     global data_dir
+    global faq_source
+    global rate_limit
+    global answer_model
+    global degraded_model
+    global degraded_chunks
+    global snapshots
+    global startup_timer
+    startup_timer = startup.StartupTimer(IMPORT_SECONDS)
     data_dir=config.get("settings", "data_dir")
+    profiler.configure(config)
+    snapshots = memory_stats.Snapshots()
+    faq_source = config.get("settings", "faq_source", fallback="")
+    rate_limit = config.getint("settings", "rate_limit_per_minute", fallback=0)
+    answer_model = config.get("settings", "answer_model", fallback="gpt-4o-mini")
+    degraded_model = config.get("settings", "degraded_model", fallback="gpt-4o-mini")
+    degraded_chunks = config.getint("settings", "degraded_chunks", fallback=5)
 
     prompt = {"role": "system", "content": f"""
 You are a friendly, knowledgeable chatbot designed to assist students with,questions about their internship experience,
@@ -108,79 +211,187 @@ Recognize and interpret common misspellings or different phrasings, responding t
 10. Maintain a Friendly, Natural Tone:
 Ensure your responses feel like a conversation with a professor or teaching assistant—approachable, professional, and helpful.
 """ }
+
+    embedding.set_affinity(embedding.parse_cpus(config.get("settings", "cpu_affinity", fallback="")))
+    if embed_threads is None:
+        embed_threads = config.getint("settings", "embed_threads", fallback=0) or None
+    embed_service_socket = config.get("settings", "embed_service", fallback="")
+    with startup_timer.phase("embedding model"), memory_stats.measure("embedding_model"):
+        if embed_service_socket:
+            # the model lives in qdrant/embed_service.py, shared by every worker
+            from qdrant import embed_service
+            embed_model = embed_service.EmbeddingClient(embed_service_socket)
+            embedding.check_dimension(embed_model)
+        else:
+            embed_model = embedding.make_model(config.get("settings", "embed_model_dir", fallback=""),
+                                               int8=config.getboolean("settings", "embed_int8", fallback=False),
+                                               threads=embed_threads)
+            batch_ms = config.getfloat("settings", "embed_batch_ms", fallback=0)
+            if batch_ms:
+                # concurrent questions in this worker share one inference
+                embed_model = embedding.EmbeddingBatcher(embed_model, config.getint("settings", "embed_batch_max", fallback=32),
+                                                         batch_ms, metrics.observe_embed_batch)
+    qdrant_client = None
+    artifacts_dir = config.get("settings", "artifacts_dir", fallback="")
+    if artifacts_dir:
+        # serve from an in-process index built from exported artifacts, no qdrant server needed
+        from qdrant import artifacts
+        qdrant_client = QdrantClient(":memory:")
+        with startup_timer.phase("artifacts index"), memory_stats.measure("qdrant_index"):
+            artifacts.load_artifacts(qdrant_client, artifacts_dir, model_name=embedding.model_id(embed_model))
+    if embed_service_socket:
+        # the checks above connected from this process; under gunicorn that is the master, whose
+        # connection every worker would inherit while the service kept its shared memory block
+        embed_model.close()
+
+def connect():
+    """ Connections and background threads, which don't survive a fork, so every worker runs this itself """
+    global qdrant_client
+    global openai_key
+    global open_client
+    global state
+    global conversations
+    global answers
+    global history_manager
+    global accounting
+    global response_log
+    global rag_log
+    global readiness
+    response_log = request_log.make_writer(config, "log.jsonl", "jsonl")
+    rag_log = request_log.make_writer(config, "raglog.csv")
+    tracing.configure(config)
+    metrics.add_collector(lambda: [(metrics.DROPPED_LOG_ROWS.labels("log.jsonl"), response_log.dropped),
+                                   (metrics.DROPPED_LOG_ROWS.labels("raglog.csv"), rag_log.dropped)])
+    if metrics.shared():
+        metrics.start_refresh()
+    with startup_timer.phase("state backend"):
+        state = state_backend.make_backend(config)
+    conversations = session_store.make_store(config, state)
+    accounting = token_usage.make_accounting(config, state)
+
     openai_key = config.get("settings", "openai_key")
-    open_client = OpenAI(api_key = openai_key)
+    with startup_timer.phase("openai client"):
+        open_client = OpenAI(api_key = openai_key)
+
+    history_manager = history.HistoryManager(open_client, conversations,
+                                             config.get("settings", "summary_model", fallback="gpt-4o-mini"),
+                                             config.getint("settings", "history_turns", fallback=6),
+                                             config.getint("settings", "history_tokens", fallback=1500),
+                                             accounting)
+
+    if not config.get("settings", "artifacts_dir", fallback=""):
+        with startup_timer.phase("qdrant client"):
+            qdrant_client = QdrantClient(host=config.get("settings", "qdrant_host"), port=6333)
+    answers = answer_cache.AnswerCache(state, config.getint("settings", "answer_cache_ttl", fallback=86400),
+                                       answer_cache.CorpusVersion(qdrant_client, schema.COLLECTIONS))
+
+    try:
+        for name in schema.COLLECTIONS:
+            embedding.check_collection(qdrant_client, name, embed_model)
+    except ValueError:
+        raise
+    except Exception as error:
+        # qdrant may come up after the bot, /readyz keeps checking
+        print(f"embedding model check skipped: {error}")
 
-    qdrant_client = QdrantClient(host=config.get("settings", "qdrant_host"), port=6333)
-    embed_model = TextEmbedding()
+    if config.getboolean("settings", "warm_up", fallback=True):
+        startup.warm_up(startup_timer, embed_model, qdrant_client, open_client, schema.COLLECTIONS)
+    print(startup_timer.report(config.getfloat("settings", "import_budget_seconds", fallback=0)))
+    readiness = health.Readiness(embed_model, qdrant_client, open_client, schema.COLLECTIONS, startup_timer,
+                                 config.getfloat("settings", "openai_probe_seconds", fallback=30),
+                                 config.getfloat("settings", "openai_probe_timeout", fallback=2))
 
-def get_response(session):
-    messages = session['history']
+def get_response(conversation):
+    window, history_stats = history_manager.window(conversation)
+    messages = [prompt] + window
     question = messages[-1]['content']
 
-    t_in = time.time()
-    #print(messages)
-    if session['course'] == "":
-        chunks = get_context(session, question)
-    chunks = get_rag(session, question)
+    t_in = time.perf_counter()
+    timings = {}
+    # opening questions don't depend on history, so their answers can be shared
+    first_question = len(conversation['history']) == 1
+    if first_question:
+        cached = answers.get(question)
+        metrics.ANSWER_CACHE.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            conversation['course'] = cached['course']
+            tracing.set_attribute("chatbot.cache_hit", True)
+            timings['total'] = time.perf_counter() - t_in
+            metrics.STAGE_SECONDS.labels("total").observe(timings['total'])
+            metrics.REQUESTS.labels("cache_hit").inc()
+            response_log.write(request_log.make_record(question, cached['course'], [], timings, cache_hit=True))
+            return cached['answer']
 
-    answer = answer_question(messages, chunks)
-    response = answer.choices[0].message.content
-    t_fin = time.time()
+    # past the session token limit: cheaper model, fewer chunks and no classifier call
+    degraded = accounting.over_limit(session['sid'])
+    if degraded:
+        metrics.DEGRADED.inc()
+        tracing.set_attribute("chatbot.degraded", True)
 
-    resp_time = t_fin - t_in
-    chunks = [mes.payload.values() for x in chunks for mes in x]    
+    if conversation['course'] == "" and not degraded:
+        with metrics.track(timings, 'classify'):
+            get_context(conversation, question)
+    with metrics.track(timings, 'embed'), tracing.span("embed_query"):
+        query_vector = qdrantsearch.embed_query(question, embed_model)
+    with metrics.track(timings, 'search'):
+        chunks = get_rag(conversation, question, query_vector, degraded_chunks if degraded else 15)
 
-    if session['course']:
-        fields=[question, chunks, answer, resp_time, session['course'], datetime.now()]
-    else:
-            fields=[question, chunks, answer, resp_time, "none", datetime.now()]
-    with open(data_dir + 'log.csv', 'a+', newline='', encoding="utf-8") as log:
-        writer = csv.writer(log)
-        writer.writerow(fields)
+    with metrics.track(timings, 'llm'):
+        answer = answer_question(messages, chunks, conversation, degraded_model if degraded else answer_model)
+    response = answer.choices[0].message.content
+    timings['total'] = time.perf_counter() - t_in
+    metrics.STAGE_SECONDS.labels("total").observe(timings['total'])
+    metrics.REQUESTS.labels("answered").inc()
+    tracing.set_attribute("chatbot.course", str(conversation['course']) or "none")
+
+    response_log.write(request_log.make_record(question, conversation['course'], chunks, timings, answer,
+                                               saved_tokens = history_stats['saved_tokens']))
+    # a degraded answer is cheaper than what the next asker is owed, so it isn't shared
+    if first_question and not degraded:
+        answers.put(question, response, conversation['course'])
     return response
 
-def get_rag(session, question):
-    chunks = []
-    if session['course'] == "":
-        chunks.append(qdrantsearch.search_db(qdrant_client, question, embed_model, "default"))
+@tracing.traced("get_rag")
+def get_rag(conversation, question, query_vector=None, limit=15):
+    if conversation['course'] == "":
+        searches = [("default", faq_source)]
     else:
-        chunks.append(qdrantsearch.search_db(qdrant_client, question, embed_model, "default"))
-        print(session['course'])
-        chunks.append(qdrantsearch.search_db(qdrant_client, question, embed_model, session['course']))
+        searches = [("default", None), (str(conversation['course']), None)]
+    chunks = []
+    for collection, source in searches:
+        with tracing.span("search_db", {"db.system": "qdrant", "db.collection": collection,
+                                        "db.source_filter": source or ""}) as span:
+            result = qdrantsearch.search_db(qdrant_client, question, embed_model, collection, source, query_vector, limit)
+            span.set_attribute("db.hits", len(result))
+        chunks.append(result)
     return chunks
 
 
 
-def get_context(messages, question):
-    messages = session["history"].copy()
-    messages[0] = {"role": "system", "content": f"""
+@tracing.traced("get_context")
+def get_context(conversation, question):
+    messages = [{"role": "system", "content": f"""
     You are a bot that categorizes questions. Given the ENTIRE chat history from the user,
     determine if they are asking about Comp 893, or Comp 690. 
                    
     Respond with only "Comp 893", or "Comp 690". If you are unsure, respond with "not sure"
 
     """
-    }
-    response = open_client.chat.completions.create(model = "gpt-4o-mini", messages = messages)
+    }] + history_manager.window(conversation)[0]
+    response = chat_completion("classify", messages, conversation)
     course = response.choices[0].message.content
 
     match course:
         case "Comp 893":
-            #chunks = qdrantsearch.search_db(qdrant_client, question, embed_model, "893")
-            session['course'] = 893
+            conversation['course'] = 893
         case "Comp 690":
-            #chunks = qdrantsearch.search_db(qdrant_client, question, embed_model, "690")
-            session['course'] = 690
+            conversation['course'] = 690
         case _:
-            #chunks = qdrantsearch.search_db(qdrant_client, question, embed_model, "default")
-            session['course'] = ""
-
-    fields=[question, course, session['course']]
-    with open(data_dir + 'raglog.csv', 'a+', newline='', encoding="utf-8") as log:
-        writer = csv.writer(log)
-        writer.writerow(fields)
-    return session['course']
+            conversation['course'] = ""
+
+    fields=[question, course, conversation['course']]
+    rag_log.write(fields)
+    return conversation['course']
 
 if __name__ == "__main__":
     main()
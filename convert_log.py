@@ -0,0 +1,71 @@
+""" One-time conversion of the old log.csv into the compact request log schema
+
+Old rows hold the chunk text and the repr of the whole completion. The
+model and token usage are parsed back out of that repr; chunk ids and per-stage
+timings were never recorded, so chunks is empty and only total_s is set.
+The output is jsonl, or parquet when the file name ends in .parquet.
+
+    python convert_log.py chatbot_data/log.csv chatbot_data/log-old.jsonl
+    python convert_log.py chatbot_data/log.csv chatbot_data/log-old.parquet
+"""
+import re
+import csv
+import json
+import argparse
+import request_log
+
+USAGE_FIELDS = ["prompt_tokens", "completion_tokens", "cached_tokens"]
+
+
+def repr_value(pattern, text):
+    match = re.search(pattern, text)
+    return match.group(1) if match else None
+
+
+def convert_row(row):
+    """ Record for one old row: question, chunks, answer repr, resp_time, course, datetime[, saved_tokens] """
+    answer = row[2]
+    record = {
+        "ts": row[5].replace(" ", "T")[:23],
+        "question": row[0],
+        "course": None if row[4] == "none" else row[4],
+        "cache_hit": answer == "answer cache hit",
+        "chunks": [],
+        "model": repr_value(r"model='([^']+)'", answer),
+        "saved_tokens": int(row[6]) if len(row) > 6 and row[6] else 0,
+    }
+    for field in USAGE_FIELDS:
+        value = repr_value(rf"\b{field}=(\d+)", answer)
+        record[field] = int(value) if value is not None else None
+    for stage in request_log.STAGES:
+        record[f"{stage}_s"] = None
+    record["total_s"] = round(float(row[3]), 4)
+    return record
+
+
+def convert_log(csv_path, out_path):
+    """ Converts every readable row, returns (converted, skipped) """
+    records = []
+    skipped = 0
+    with open(csv_path, newline="", encoding="utf-8") as file:
+        for row in csv.reader(file):
+            try:
+                records.append(convert_row(row))
+            except (IndexError, ValueError):
+                skipped += 1
+    if out_path.endswith(".parquet"):
+        request_log.write_parquet(records, out_path)
+    else:
+        with open(out_path, "w", encoding="utf-8") as file:
+            for record in records:
+                file.write(json.dumps(record, separators=(",", ":")) + "\n")
+    return len(records), skipped
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv", help = "old log.csv")
+    parser.add_argument("out", help = "output .jsonl or .parquet file")
+    args = parser.parse_args()
+    converted, skipped = convert_log(args.csv, args.out)
+    print(f"converted {converted} rows, skipped {skipped} unreadable rows")
@@ -0,0 +1,77 @@
+""" gunicorn settings for serving the bot with several worker processes, run from this folder
+
+    gunicorn
+    gunicorn --workers 4
+
+preload_app imports wsgi.py once in the master, which loads the embedding model,
+prompt and any artifacts index; workers are forked from it and share those pages
+copy-on-write instead of each loading their own model. The OpenAI and qdrant
+clients, state backend connections, log and trace writers and the history
+summariser thread don't survive a fork, so post_fork has every worker create its
+own. With cpu_affinity set every worker is pinned to one of its cpus, the least
+used one when it is forked, so replacements fill the cpu a retired worker left.
+Workers are replaced after max_requests (plus up to 10% jitter so they don't
+all restart together) and get graceful_timeout seconds to finish their requests.
+With metrics_dir set, prometheus_client multiprocess mode is switched on here,
+before wsgi.py is imported, so every process records its metrics there.
+Settings come from config.txt, command line options override them.
+"""
+import os
+import configparser
+
+# not "config", gunicorn takes that name for its own setting
+chatbot_config = configparser.ConfigParser()
+chatbot_config.read("config.txt")
+
+wsgi_app = "wsgi:app"
+bind = f"{chatbot_config.get('settings', 'bot_ip')}:{chatbot_config.get('settings', 'bot_port')}"
+preload_app = True
+worker_class = "gthread"
+workers = chatbot_config.getint("settings", "workers", fallback=1)
+threads = chatbot_config.getint("settings", "worker_threads", fallback=4)
+max_requests = chatbot_config.getint("settings", "max_requests", fallback=1000)
+max_requests_jitter = max_requests // 10
+graceful_timeout = chatbot_config.getint("settings", "graceful_timeout", fallback=30)
+# an answer waits on OpenAI, don't kill workers for slow completions
+timeout = 120
+
+metrics_dir = chatbot_config.get("settings", "metrics_dir", fallback="")
+if metrics_dir:
+    # totals of workers from an earlier run aren't this run's; cleared before any metric exists
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith(".db"):
+            os.remove(os.path.join(metrics_dir, name))
+    # read when prometheus_client is imported
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = metrics_dir
+
+
+def when_ready(server):
+    if server.cfg.workers > 1 and chatbot_config.get("settings", "state_backend", fallback="memory") == "memory":
+        server.log.warning("state_backend is memory: every worker keeps its own sessions, set sqlite or redis "
+                           "so a conversation survives landing on another worker")
+    if server.cfg.workers > 1 and not metrics_dir:
+        server.log.warning("metrics_dir is not set: /metrics shows whichever worker answers the scrape, "
+                           "set it so the workers' metrics are summed")
+
+
+def pre_fork(server, worker):
+    # chosen in the master, which knows the other workers' cpus; the worker inherits the attribute
+    from qdrant import embedding
+    cpus = embedding.parse_cpus(chatbot_config.get("settings", "cpu_affinity", fallback=""))
+    if cpus:
+        used = [getattr(other, "cpu", None) for other in server.WORKERS.values()]
+        worker.cpu = min(cpus, key=used.count)
+
+
+def child_exit(server, worker):
+    if metrics_dir:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    import chatbot_fat
+    if getattr(worker, "cpu", None) is not None:
+        chatbot_fat.embedding.set_affinity([worker.cpu])
+    chatbot_fat.connect()
@@ -0,0 +1,84 @@
+""" Liveness and readiness checks for load balancers
+
+/healthz only says the worker process answers. /readyz says whether the worker
+should get traffic: startup and warm-up are done, the embedding model embeds,
+every collection exists with VECTOR_SIZE vectors made by the model variant the
+bot embeds with, and the OpenAI API answered.
+The OpenAI probe is cached for openai_probe_seconds, however often the balancer
+asks, and runs with a short timeout and no retries. Every check reports the
+latency it last observed, which also goes to /metrics.
+"""
+import time
+import threading
+import metrics
+from qdrant import qdrantsearch, schema, embedding
+
+DEPENDENCY_SECONDS = metrics.Gauge("chatbot_dependency_seconds", "Last observed latency of a readiness probe", ["dependency"],
+                                   multiprocess_mode="livemax")
+DEPENDENCY_UP = metrics.Gauge("chatbot_dependency_up", "1 when the dependency passed its last readiness probe", ["dependency"],
+                              multiprocess_mode="livemin")
+
+
+def probe(dependency, check):
+    """ Runs check(), returns {"ok", "seconds"} plus "error" or whatever check returned """
+    start = time.perf_counter()
+    try:
+        result = {"ok": True, **(check() or {})}
+    except Exception as error:
+        result = {"ok": False, "error": f"{type(error).__name__}: {error}"}
+    result["seconds"] = round(time.perf_counter() - start, 4)
+    DEPENDENCY_SECONDS.labels(dependency).set(result["seconds"])
+    DEPENDENCY_UP.labels(dependency).set(1 if result["ok"] else 0)
+    return result
+
+
+class Readiness:
+    def __init__(self, embed_model, qdrant_client, open_client, collections, startup_timer=None,
+                 openai_probe_seconds=30, openai_timeout=2.0):
+        self.embed_model = embed_model
+        self.qdrant_client = qdrant_client
+        self.open_client = open_client
+        self.collections = collections
+        self.startup_timer = startup_timer
+        self.openai_probe_seconds = openai_probe_seconds
+        self.openai_timeout = openai_timeout
+        self.openai_result = None
+        self.openai_checked = 0.0
+        self.openai_lock = threading.Lock()
+
+    def check_model(self):
+        return {"dimension": len(qdrantsearch.embed_query("ready", self.embed_model))}
+
+    def check_qdrant(self):
+        sizes = {}
+        for name in self.collections:
+            info = self.qdrant_client.get_collection(schema.alias_target(self.qdrant_client, name) or name)
+            sizes[name] = info.config.params.vectors.size
+            if sizes[name] != schema.VECTOR_SIZE:
+                raise ValueError(f"{name} holds {sizes[name]} dimension vectors, expected {schema.VECTOR_SIZE}")
+            embedding.check_collection(self.qdrant_client, name, self.embed_model)
+        return {"collections": sizes, "embedding": embedding.model_id(self.embed_model)}
+
+    def check_openai(self):
+        self.open_client.with_options(timeout = self.openai_timeout, max_retries = 0).models.list()
+
+    def openai(self):
+        """ The last OpenAI probe, redone at most every openai_probe_seconds """
+        with self.openai_lock:
+            age = time.monotonic() - self.openai_checked
+            if self.openai_result is None or age >= self.openai_probe_seconds:
+                self.openai_result = probe("openai", self.check_openai)
+                self.openai_checked = time.monotonic()
+                age = 0.0
+            return {**self.openai_result, "age_seconds": round(age, 1)}
+
+    def report(self):
+        """ (ready, body) for /readyz """
+        checks = {"embedding_model": probe("embedding_model", self.check_model),
+                  "qdrant": probe("qdrant", self.check_qdrant),
+                  "openai": self.openai()}
+        body = {"ready": all(check["ok"] for check in checks.values()), "checks": checks}
+        if self.startup_timer is not None:
+            body["startup_seconds"] = round(self.startup_timer.total(), 2)
+            body["startup_failures"] = dict(self.startup_timer.failures)
+        return body["ready"], body
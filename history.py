@@ -0,0 +1,96 @@
+""" Token-budgeted conversation window with a rolling summary of older turns
+
+Only the last history_turns messages that fit in history_tokens are sent to the
+model verbatim. Older messages are folded into a running summary by a background
+thread after the response has been returned, so summarizing never adds latency
+to a request.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from qdrant import schema
+
+SUMMARY_PROMPT = """Summarize this conversation between a student and the internship chatbot in a few sentences.
+Keep the course being discussed, facts the student gave about themselves and any open questions.
+Start from the existing summary if there is one."""
+
+
+def message_tokens(message):
+    # a few tokens of overhead per message for role and separators
+    return schema.estimate_tokens(message["content"]) + 4
+
+
+class HistoryManager:
+    def __init__(self, open_client, store, model="gpt-4o-mini", max_turns=6, token_budget=1500, accounting=None):
+        self.open_client = open_client
+        self.accounting = accounting
+        self.store = store
+        self.model = model
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-summary")
+        self.pending = set()
+        self.lock = threading.Lock()
+
+    def window_start(self, history):
+        """ Index of the oldest message kept verbatim, the newest message is always kept """
+        start = len(history)
+        tokens = 0
+        while start > 0 and len(history) - start < self.max_turns:
+            tokens += message_tokens(history[start - 1])
+            if tokens > self.token_budget and start < len(history):
+                break
+            start -= 1
+        return start
+
+    def window(self, conversation):
+        """ Returns (messages, stats): the summary plus the recent turns, and the tokens saved """
+        history = conversation["history"]
+        start = max(self.window_start(history), conversation.get("summarized", 0))
+        messages = []
+        if conversation.get("summary"):
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation: {conversation['summary']}"})
+        messages += history[start:]
+
+        full_tokens = sum(message_tokens(message) for message in history)
+        sent_tokens = sum(message_tokens(message) for message in messages)
+        stats = {"history_tokens": full_tokens, "sent_tokens": sent_tokens, "saved_tokens": full_tokens - sent_tokens}
+        return messages, stats
+
+    def schedule_summary(self, session_id, conversation):
+        """ Folds messages that fell out of the window into the summary, off the request path """
+        if self.window_start(conversation["history"]) <= conversation.get("summarized", 0):
+            return
+        with self.lock:
+            if session_id in self.pending:
+                return
+            self.pending.add(session_id)
+        self.executor.submit(self._summarize, session_id)
+
+    def _summarize(self, session_id):
+        try:
+            conversation = self.store.get(session_id)
+            if conversation is None:
+                return
+            summarized = conversation.get("summarized", 0)
+            end = self.window_start(conversation["history"])
+            if end <= summarized:
+                return
+            messages = [{"role": "system", "content": SUMMARY_PROMPT}]
+            if conversation.get("summary"):
+                messages.append({"role": "system", "content": f"Existing summary: {conversation['summary']}"})
+            messages += conversation["history"][summarized:end]
+            response = self.open_client.chat.completions.create(model = self.model, messages = messages)
+            summary = response.choices[0].message.content
+
+            if self.accounting:
+                self.accounting.record(session_id, conversation["course"], self.model, response)
+            # the summary has its own key, turns stored meanwhile are kept; drop it if the session was reset
+            latest = self.store.get(session_id)
+            if latest is None or latest.get("summarized", 0) != summarized or len(latest["history"]) < end:
+                return
+            self.store.put_summary(session_id, summary, end)
+        except Exception as error:
+            print(f"history summary failed for {session_id}: {error}")
+        finally:
+            with self.lock:
+                self.pending.discard(session_id)
@@ -0,0 +1,224 @@
+""" Streaming report over the chatbot logs, in constant memory however big they are
+
+Reads the request log in any of its formats (old log.csv, log.jsonl, rotated
+.jsonl.gz or .parquet files) and raglog.csv, one row at a time, and reports:
+    resp_time p50/p90/p99 by course and by hour of day, and per pipeline stage
+    the most repeated questions (space-saving counters)
+    the share of requests answered from the answer cache, and the share a cache
+    keeping every answer would get (distinct questions counted with a hyperloglog)
+    the classifier label distribution from raglog.csv
+
+    python log_stats.py chatbot_data/log.csv chatbot_data/log.jsonl* chatbot_data/raglog.csv
+    python log_stats.py chatbot_data/log.jsonl --top 50
+"""
+import os
+import sys
+import csv
+import math
+import argparse
+from collections import Counter
+import mmh3
+import request_log
+import convert_log
+import answer_cache
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+
+class LatencyHistogram:
+    """ Log-spaced buckets, quantiles are within about 1% of the exact value """
+    def __init__(self, gamma=1.02, smallest=0.001):
+        self.gamma = gamma
+        self.smallest = smallest
+        self.buckets = Counter()
+        self.count = 0
+
+    def add(self, seconds):
+        index = 0 if seconds <= self.smallest else math.ceil(math.log(seconds / self.smallest, self.gamma))
+        self.buckets[index] += 1
+        self.count += 1
+
+    def quantile(self, q):
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return self.smallest * self.gamma ** (index - 0.5) if index else self.smallest
+        return None
+
+
+class SpaceSaving:
+    """ Top-k heavy hitters in k counters, counts overestimate by at most the smallest counter """
+    def __init__(self, k=100):
+        self.k = k
+        self.counts = {}
+
+    def add(self, item):
+        if item in self.counts:
+            self.counts[item] += 1
+        elif len(self.counts) < self.k:
+            self.counts[item] = 1
+        else:
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(smallest) + 1
+
+    def top(self, n):
+        return sorted(self.counts.items(), key=lambda item: -item[1])[:n]
+
+
+class HyperLogLog:
+    """ Distinct count in 2**precision registers, about 1.6% standard error at precision 12 """
+    def __init__(self, precision=12):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        hashed = mmh3.hash64(item, signed=False)[0]
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small range correction, linear counting
+            return m * math.log(m / zeros)
+        return estimate
+
+
+class LogStats:
+    def __init__(self, top_k=100):
+        self.by_course = {}
+        self.by_hour = {}
+        self.by_stage = {}
+        self.questions = SpaceSaving(top_k)
+        self.distinct = HyperLogLog()
+        self.requests = 0
+        self.cache_lookups = 0
+        self.cache_hits = 0
+        self.labels = Counter()
+
+    def add_record(self, record):
+        """ One request in the compact schema of request_log.make_record """
+        self.requests += 1
+        question = answer_cache.normalize_question(record["question"])
+        self.questions.add(question)
+        self.distinct.add(question)
+        if record.get("cache_hit") is not None:
+            self.cache_lookups += 1
+            self.cache_hits += bool(record["cache_hit"])
+        total = record.get("total_s")
+        if total is not None:
+            self.by_course.setdefault(record.get("course") or "none", LatencyHistogram()).add(total)
+            if record.get("ts"):
+                self.by_hour.setdefault(int(record["ts"][11:13]), LatencyHistogram()).add(total)
+        for stage in request_log.STAGES:
+            seconds = record.get(f"{stage}_s")
+            if seconds is not None:
+                self.by_stage.setdefault(stage, LatencyHistogram()).add(seconds)
+
+    def add_rag_row(self, row):
+        """ One raglog.csv row: question, classifier answer, course picked """
+        self.labels[row[1]] += 1
+
+    def report(self, top=20):
+        quantiles = lambda histograms: {key: [histogram.quantile(q) for q in QUANTILES] + [histogram.count]
+                                        for key, histogram in sorted(histograms.items())}
+        distinct = min(self.distinct.count(), self.requests)
+        return {
+            "requests": self.requests,
+            "by_course": quantiles(self.by_course),
+            "by_hour": quantiles(self.by_hour),
+            "by_stage": quantiles(self.by_stage),
+            "top_questions": self.questions.top(top),
+            "distinct_questions": round(distinct),
+            "cache_hit_rate": self.cache_hits / self.cache_lookups if self.cache_lookups else None,
+            "repeat_rate": 1 - distinct / self.requests if self.requests else None,
+            "labels": self.labels.most_common(),
+        }
+
+
+def iter_parquet(path):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=1024):
+        yield from batch.to_pylist()
+
+
+def iter_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        yield from csv.reader(file)
+
+
+def read_file(stats, path):
+    """ Feeds one log file into stats, the format is picked from the file name """
+    name = os.path.basename(path)
+    if name.startswith("raglog"):
+        for row in iter_csv(path):
+            if len(row) >= 2:
+                stats.add_rag_row(row)
+    elif ".jsonl" in name:
+        for record in request_log.iter_jsonl(path):
+            stats.add_record(record)
+    elif name.endswith(".parquet"):
+        for record in iter_parquet(path):
+            stats.add_record(record)
+    elif name.endswith(".csv"):
+        for row in iter_csv(path):
+            try:
+                record = convert_log.convert_row(row)
+            except (IndexError, ValueError):
+                continue
+            stats.add_record(record)
+    else:
+        raise ValueError(f"don't know how to read {path}")
+
+
+def format_seconds(seconds):
+    if seconds is None:
+        return "-"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+
+def print_report(report):
+    print(f"{report['requests']} requests, ~{report['distinct_questions']} distinct questions")
+    for title, key in [("course", "by_course"), ("hour", "by_hour"), ("stage", "by_stage")]:
+        if not report[key]:
+            continue
+        print(f"\nresp_time by {title}:    p50     p90     p99   count")
+        for group, (p50, p90, p99, count) in report[key].items():
+            print(f"  {str(group):<14}{format_seconds(p50):>8}{format_seconds(p90):>8}{format_seconds(p99):>8}{count:>8}")
+
+    print("\ntop questions:")
+    for question, count in report["top_questions"]:
+        print(f"  {count:>6}  {question}")
+
+    print()
+    if report["cache_hit_rate"] is not None:
+        print(f"answered from the answer cache: {report['cache_hit_rate']:.1%}")
+    if report["repeat_rate"] is not None:
+        print(f"repeated questions (hit rate of a cache keeping every answer): {report['repeat_rate']:.1%}")
+
+    if report["labels"]:
+        total = sum(count for _, count in report["labels"])
+        print("\nclassifier labels:")
+        for label, count in report["labels"]:
+            print(f"  {count:>6} {count / total:>6.1%}  {label}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs = "+", help = "log files, in any of the formats above")
+    parser.add_argument("--top", type = int, default = 20, help = "how many repeated questions to show")
+    args = parser.parse_args()
+
+    # old log.csv rows hold whole chunks and completions
+    csv.field_size_limit(sys.maxsize)
+    stats = LogStats(top_k = max(100, args.top * 5))
+    for path in args.files:
+        read_file(stats, path)
+    print_report(stats.report(args.top))
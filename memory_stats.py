@@ -0,0 +1,111 @@
+""" Memory footprint of a bot worker, for /metrics and for chasing leaks
+
+Process RSS (current and peak) and Python heap figures are read on every
+/metrics scrape. onnxruntime does not report its arena, so the RSS growth while
+the embedding model loads is recorded instead and stands in for it, as do the
+other big components measured with measure().
+
+Snapshots does tracemalloc snapshots for the operator endpoint: the first
+call starts tracing and takes a baseline, every later call reports the top
+allocation growth since the previous snapshot. Tracing slows the worker
+down, stop it when done. Each worker traces its own memory.
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+import metrics
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+RSS = metrics.Gauge("chatbot_memory_rss_bytes", "Resident set size of this worker", multiprocess_mode="liveall")
+PEAK_RSS = metrics.Gauge("chatbot_memory_peak_rss_bytes", "Peak resident set size of this worker",
+                         multiprocess_mode="liveall")
+HEAP_BLOCKS = metrics.Gauge("chatbot_python_allocated_blocks", "Memory blocks currently allocated by the Python allocator",
+                            multiprocess_mode="liveall")
+GC_COLLECTIONS = metrics.Gauge("chatbot_python_gc_collections", "Garbage collections run, by generation", ["generation"],
+                               multiprocess_mode="liveall")
+TRACED = metrics.Gauge("chatbot_tracemalloc_traced_bytes", "Python memory traced by tracemalloc, 0 when it is off",
+                       multiprocess_mode="liveall")
+COMPONENT_RSS = metrics.Gauge("chatbot_component_rss_bytes",
+                              "RSS growth while a component loaded, the embedding model stands in for the onnx arena",
+                              ["component"], multiprocess_mode="liveall")
+UPTIME = metrics.Gauge("chatbot_uptime_seconds", "Seconds since this worker started", multiprocess_mode="liveall")
+STARTED = time.time()
+
+
+def rss_bytes():
+    """ Current RSS from /proc on linux, the peak RSS elsewhere """
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+@contextmanager
+def measure(component):
+    """ Records how much RSS grew while the block ran """
+    before = rss_bytes()
+    try:
+        yield
+    finally:
+        COMPONENT_RSS.labels(component).set(max(rss_bytes() - before, 0))
+
+
+def collect():
+    """ Registry collector, runs on every scrape """
+    values = [(RSS, rss_bytes()), (PEAK_RSS, peak_rss_bytes()), (HEAP_BLOCKS, sys.getallocatedblocks()),
+              (TRACED, tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else 0),
+              (UPTIME, time.time() - STARTED)]
+    values += [(GC_COLLECTIONS.labels(generation), stats["collections"]) for generation, stats in enumerate(gc.get_stats())]
+    return values
+
+
+metrics.add_collector(collect)
+
+
+class Snapshots:
+    FILTERS = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+
+    def __init__(self, frames=10):
+        self.frames = frames
+        self.previous = None
+
+    def take(self, top=25):
+        """ Starts tracing with a baseline, or reports the growth since the previous snapshot, as text """
+        if not tracemalloc.is_tracing() or self.previous is None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(self.frames)
+            self.previous = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+            return "tracemalloc started, baseline taken; call again to see what grew\n"
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(self.FILTERS)
+        differences = snapshot.compare_to(self.previous, "lineno")
+        self.previous = snapshot
+        current, peak = tracemalloc.get_traced_memory()
+        lines = [f"traced {current / 1e6:.1f} MB (peak {peak / 1e6:.1f} MB), rss {rss_bytes() / 1e6:.1f} MB",
+                 f"top {top} allocation changes since the previous snapshot:"]
+        lines += [str(difference) for difference in differences[:top]]
+        return "\n".join(lines) + "\n"
+
+    def stop(self):
+        self.previous = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return "tracemalloc stopped\n"
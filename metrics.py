@@ -0,0 +1,107 @@
+""" Prometheus metrics of the bot, kept with prometheus_client
+
+Counters, gauges and histograms, optionally labelled. Recording a value costs a
+lock, so everything stays on in production.
+
+Values are per process. gunicorn workers share one port, so a scrape lands on
+any one of them; with metrics_dir set gunicorn.conf.py points
+PROMETHEUS_MULTIPROC_DIR at it before the bot is imported, every process
+records into files there and /metrics renders the aggregate over all of them
+(prometheus_client multiprocess mode). Counters and histograms of workers that
+have exited are kept, so totals never go backwards when a worker is replaced.
+Gauges say per metric how workers combine (multiprocess_mode): those of one
+worker, like its memory, get a pid label and go when it exits.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+import request_log
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CONTENT_TYPE = prometheus_client.CONTENT_TYPE_LATEST
+MULTIPROC_ENV = "PROMETHEUS_MULTIPROC_DIR"
+REGISTRY = prometheus_client.REGISTRY
+# multiprocess mode only sees what a worker has recorded, so collectors refresh this often in every worker
+REFRESH_SECONDS = 5
+COLLECTORS = []
+
+
+def add_collector(collect):
+    """ collect() is called on every scrape and returns extra metrics as [(metric, value), ...] """
+    COLLECTORS.append(collect)
+
+
+def collect():
+    for collect in COLLECTORS:
+        try:
+            for metric, value in collect():
+                metric.set(value)
+        except Exception as error:
+            print(f"metrics collector failed: {error}")
+
+
+def shared():
+    """ True in multiprocess mode, see the module docstring """
+    return bool(os.environ.get(MULTIPROC_ENV))
+
+
+def render(registry=REGISTRY):
+    """ The metrics in the text format, summed over every process in multiprocess mode """
+    collect()
+    if shared() and registry is REGISTRY:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return prometheus_client.generate_latest(registry)
+
+
+def start_refresh(interval=REFRESH_SECONDS):
+    """ Runs the collectors of this process every interval, for scrapes that land on another worker """
+    def run():
+        while True:
+            time.sleep(interval)
+            collect()
+    threading.Thread(target=run, name="metrics-refresh", daemon=True).start()
+
+
+STAGE_SECONDS = Histogram("chatbot_stage_seconds", "Seconds spent in each stage of answering a message", ["stage"],
+                          buckets=LATENCY_BUCKETS)
+REQUESTS = Counter("chatbot_requests_total", "Messages handled by outcome", ["outcome"])
+ERRORS = Counter("chatbot_errors_total", "Exceptions raised by each stage", ["stage"])
+IN_FLIGHT = Gauge("chatbot_requests_in_flight", "Messages being answered right now", multiprocess_mode="livesum")
+ANSWER_CACHE = Counter("chatbot_answer_cache_total", "Answer cache lookups by result", ["result"])
+TOKENS = Counter("chatbot_tokens_total", "OpenAI tokens used by call and kind", ["call", "kind"])
+DEGRADED = Counter("chatbot_degraded_total", "Messages answered on the cheaper path after the session token limit")
+DROPPED_LOG_ROWS = Gauge("chatbot_log_rows_dropped", "Log rows dropped because the writer fell behind", ["log"],
+                         multiprocess_mode="livesum")
+EMBED_BATCH_SIZE = Histogram("chatbot_embed_batch_size", "Texts embedded together by the embedding batcher",
+                             buckets=(1, 2, 4, 8, 16, 32, 64))
+EMBED_BATCH_WAIT = Histogram("chatbot_embed_batch_wait_seconds", "Seconds questions waited for their embedding batch",
+                             buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05))
+
+
+@contextmanager
+def track(timings, stage):
+    """ Times the block into timings[stage] (see request_log.timed), observes it and counts errors """
+    try:
+        with request_log.timed(timings, stage):
+            yield
+    except Exception:
+        ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(timings[stage])
+
+
+def count_tokens(call, counts):
+    """ Adds token counts (see token_usage.usage_counts) to chatbot_tokens_total """
+    for kind, count in counts.items():
+        TOKENS.labels(call, kind).inc(count)
+
+
+def observe_embed_batch(size, wait_seconds, run_seconds):
+    """ on_batch callback of the embedding batcher """
+    EMBED_BATCH_SIZE.observe(size)
+    EMBED_BATCH_WAIT.observe(wait_seconds)
@@ -0,0 +1,97 @@
+""" On-demand sampling profiler for single requests
+
+A /llm_response request sent with the header X-Profile: <operator_token> is
+profiled: a background thread samples the request thread's stack every
+profile_interval seconds and the samples are written to data_dir/profiles as
+collapsed stacks ("frame;frame;frame count" lines), which flamegraph.pl,
+speedscope and inferno read. Samples are wall clock, so time spent waiting on
+qdrant or OpenAI shows up as well as CPU in the embedding model. Without the
+header a request only pays for one header lookup.
+"""
+import os
+import sys
+import hmac
+import time
+import threading
+import functools
+from collections import Counter
+from flask import request, make_response
+
+HEADER = "X-Profile"
+settings = {"token": "", "interval": 0.005, "out_dir": "./chatbot_data/profiles"}
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class SamplingProfiler:
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopping.set()
+        self.thread.join()
+        self.seconds = time.perf_counter() - self.start
+
+    def _run(self):
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_name(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def dump(self, out_dir):
+        """ Writes the collapsed stacks to a new file in out_dir and returns its path """
+        os.makedirs(out_dir, exist_ok=True)
+        path = os.path.join(out_dir, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self.thread_id}.folded")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(self.collapsed())
+        return path
+
+
+def operator_request(header=HEADER):
+    """ True when the request carries operator_token in header, never when no token is configured """
+    token = settings["token"]
+    # as bytes, compare_digest refuses str holding non-ascii characters
+    return bool(token) and hmac.compare_digest(request.headers.get(header, "").encode(), token.encode())
+
+
+def on_demand(function):
+    """ Profiles the decorated view when the request carries the operator token """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not operator_request():
+            return function(*args, **kwargs)
+        with SamplingProfiler(interval=settings["interval"]) as profile:
+            response = make_response(function(*args, **kwargs))
+        path = profile.dump(settings["out_dir"])
+        print(f"profiled {request.path}: {profile.samples} samples over {profile.seconds:.2f}s in {path}")
+        response.headers["X-Profile-File"] = os.path.basename(path)
+        return response
+    return wrapper
+
+
+def configure(config):
+    settings["token"] = config.get("settings", "operator_token", fallback="")
+    settings["interval"] = config.getfloat("settings", "profile_interval", fallback=0.005)
+    settings["out_dir"] = os.path.join(config.get("settings", "data_dir"), "profiles")
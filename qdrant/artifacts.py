@@ -0,0 +1,163 @@
+""" Export collections to precomputed embedding artifacts and bulk load them back
+
+An artifact directory holds a manifest.json with the embedding model id (name
+and variant, see embedding.model_id), dimension and distance, and per collection a vectors.npy (float32, opened
+memory-mapped on load) plus a payloads.jsonl with one {"id", "payload"} line
+per vector row. Loading never touches the embedding model.
+
+    python artifacts.py export ../artifacts
+    python artifacts.py load ../artifacts
+    python artifacts.py load ../artifacts --path ./qdrant_local
+"""
+import os
+import json
+import time
+import argparse
+import numpy as np
+from  qdrant_client import QdrantClient, models
+try:
+    from qdrant import schema, embedding
+except ImportError:
+    import schema
+    import embedding
+
+FORMAT_VERSION = 1
+DEFAULT_MODEL = embedding.MODEL_NAME
+BATCH_SIZE = 512
+
+
+def export_collection(client, collection, out_dir):
+    """ Writes one collection's vectors and payloads, returns (count, dim, distance) """
+    info = client.get_collection(collection)
+    dim = info.config.params.vectors.size
+    distance = info.config.params.vectors.distance
+    count = client.count(collection, exact=True).count
+
+    os.makedirs(os.path.join(out_dir, collection), exist_ok=True)
+    vectors = np.lib.format.open_memmap(os.path.join(out_dir, collection, "vectors.npy"),
+                                        mode="w+", dtype=np.float32, shape=(count, dim))
+    row = 0
+    offset = None
+    with open(os.path.join(out_dir, collection, "payloads.jsonl"), "w", encoding="utf-8") as file:
+        while row < count:
+            points, offset = client.scroll(collection_name = collection, limit = BATCH_SIZE, offset = offset,
+                                           with_payload = True, with_vectors = True)
+            for point in points:
+                if row == count:
+                    break
+                vectors[row] = point.vector
+                file.write(json.dumps({"id": point.id, "payload": point.payload}, separators=(",", ":")) + "\n")
+                row += 1
+            if offset is None:
+                break
+    vectors.flush()
+    del vectors
+    return row, dim, distance
+
+
+def export_artifacts(client, collections, out_dir, model_name=None):
+    """ Exports collections and writes the manifest, the model defaults to the one the collections record """
+    if model_name is None:
+        stored = {embedding.stored_model(client, collection) for collection in collections} - {None}
+        if len(stored) > 1:
+            raise ValueError(f"collections were embedded with different models: {', '.join(sorted(stored))}")
+        model_name = stored.pop() if stored else DEFAULT_MODEL
+    manifest = {"format": FORMAT_VERSION, "model": model_name, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "collections": {}}
+    for collection in collections:
+        count, dim, distance = export_collection(client, collection, out_dir)
+        manifest["dim"] = dim
+        manifest["distance"] = str(distance.value if hasattr(distance, "value") else distance)
+        manifest["collections"][collection] = {"count": count,
+                                               "vectors": f"{collection}/vectors.npy",
+                                               "payloads": f"{collection}/payloads.jsonl"}
+    with open(os.path.join(out_dir, "manifest.json"), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def read_manifest(art_dir, model_name=None):
+    """ Reads the manifest, raises ValueError if it was built with a different model """
+    with open(os.path.join(art_dir, "manifest.json"), encoding="utf-8") as file:
+        manifest = json.load(file)
+    if manifest.get("format") != FORMAT_VERSION:
+        raise ValueError(f"unsupported artifact format {manifest.get('format')}")
+    if model_name and manifest["model"] != model_name:
+        raise ValueError(f"artifacts were embedded with {manifest['model']}, not {model_name}")
+    return manifest
+
+
+def payload_batches(path, batch_size):
+    """ Yields (ids, payloads) batches from a payloads.jsonl file """
+    ids, payloads = [], []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            record = json.loads(line)
+            ids.append(record["id"])
+            payloads.append(record["payload"])
+            if len(ids) == batch_size:
+                yield ids, payloads
+                ids, payloads = [], []
+    if ids:
+        yield ids, payloads
+
+
+def upsert_vectors(client, art_dir, files, collection, batch_size=BATCH_SIZE):
+    """ Bulk upserts one exported collection's files into an existing collection, returns points loaded """
+    vectors = np.load(os.path.join(art_dir, files["vectors"]), mmap_mode="r")
+    row = 0
+    for ids, payloads in payload_batches(os.path.join(art_dir, files["payloads"]), batch_size):
+        client.upsert(collection_name = collection,
+                      points = models.Batch(ids=ids, vectors=vectors[row:row + len(ids)].tolist(),
+                                            payloads=payloads))
+        row += len(ids)
+    return row
+
+
+def load_artifacts(client, art_dir, collections=None, model_name=None, batch_size=BATCH_SIZE):
+    """ Creates missing collections and bulk upserts the artifact vectors, returns points loaded """
+    manifest = read_manifest(art_dir, model_name)
+    distance = models.Distance(manifest["distance"])
+    loaded = 0
+    for collection, files in manifest["collections"].items():
+        if collections and collection not in collections:
+            continue
+        if schema.collection_exists(client, collection):
+            size = client.get_collection(collection).config.params.vectors.size
+            if size != manifest["dim"]:
+                raise ValueError(f"collection {collection} has dimension {size}, artifacts have {manifest['dim']}")
+        else:
+            versioned = schema.versioned_name(collection, time.strftime("%Y%m%d%H%M%S"))
+            client.create_collection(collection_name = versioned,
+                                     vectors_config = models.VectorParams(size=manifest["dim"], distance=distance))
+            schema.create_payload_indexes(client, versioned)
+            schema.point_aliases(client, {collection: versioned})
+
+        loaded += upsert_vectors(client, art_dir, files, collection, batch_size)
+    return loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices = ["export", "load"])
+    parser.add_argument("dir", help = "artifact directory")
+    parser.add_argument("--collections", nargs = "*", default = None,
+                        help = "collections to export or load, defaults to all of them")
+    parser.add_argument("--host", default = "localhost", help = "qdrant server host")
+    parser.add_argument("--path", default = None, help = "use an embedded qdrant stored in this folder instead of a server")
+    parser.add_argument("--model", default = None,
+                        help = "embedding model id the collections were built with, e.g. BAAI/bge-small-en-v1.5:int8; "
+                               "export defaults to what the collections record, load then checks nothing")
+    args = parser.parse_args()
+
+    client = QdrantClient(path = args.path) if args.path else QdrantClient(host = args.host)
+    start = time.perf_counter()
+    if args.command == "export":
+        manifest = export_artifacts(client, args.collections or schema.COLLECTIONS, args.dir, args.model)
+        total = sum(entry["count"] for entry in manifest["collections"].values())
+        print(f"exported {total} points from {len(manifest['collections'])} collections "
+              f"in {time.perf_counter() - start:.2f}s")
+    else:
+        total = load_artifacts(client, args.dir, args.collections, args.model)
+        print(f"loaded {total} points in {time.perf_counter() - start:.2f}s")
+    client.close()
@@ -0,0 +1,66 @@
+""" Query embedding with and without the in-process batcher under concurrent threads
+
+--threads threads embed single questions for --seconds, like gthread workers
+answering at once, first straight on the model and then through an
+EmbeddingBatcher. Reports queries/s and latency percentiles for both, and for the
+batcher the batch size distribution and how long calls waited for their batch.
+
+    python bench_batcher.py
+    python bench_batcher.py --threads 1 4 8 16 --wait-ms 2 5 --model-dir /models
+"""
+import time
+import argparse
+import threading
+import embedding
+
+QUESTIONS = ["How many credits is COMP 690?", "When are the office hours for COMP 893?",
+             "How do I register my internship in Handshake?", "What are the weekly assignments?"]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def load(embed_model, threads, seconds):
+    """ (queries/s, latencies) of threads embedding one question at a time """
+    latencies = []
+    stop_at = time.perf_counter() + seconds
+
+    def ask(offset):
+        n = offset
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            next(embed_model.embed([QUESTIONS[n % len(QUESTIONS)]]))
+            latencies.append(time.perf_counter() - start)
+            n += 1
+
+    workers = [threading.Thread(target=ask, args=(i,)) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return len(latencies) / seconds, latencies
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", nargs = "*", type = int, default = [1, 4, 8, 16], help = "concurrent queries")
+    parser.add_argument("--wait-ms", nargs = "*", type = float, default = [2.0], help = "batcher waits to compare")
+    parser.add_argument("--max-batch", type = int, default = 32, help = "batcher batch limit")
+    parser.add_argument("--seconds", type = float, default = 10, help = "load duration per run")
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    args = parser.parse_args()
+
+    embed_model = embedding.make_model(args.model_dir)
+    print(f"{'threads':>7}  {'mode':<14}{'queries/s':>10}{'p50 ms':>8}{'p95 ms':>8}{'wait ms':>9}  batch sizes")
+    for threads in args.threads:
+        rate, latencies = load(embed_model, threads, args.seconds)
+        print(f"{threads:>7}  {'model':<14}{rate:>10.1f}{percentile(latencies, 0.5) * 1000:>8.1f}"
+              f"{percentile(latencies, 0.95) * 1000:>8.1f}")
+        for wait_ms in args.wait_ms:
+            batcher = embedding.EmbeddingBatcher(embed_model, args.max_batch, wait_ms)
+            rate, latencies = load(batcher, threads, args.seconds)
+            stats = batcher.stats()
+            print(f"{threads:>7}  {f'batch {wait_ms:g}ms':<14}{rate:>10.1f}{percentile(latencies, 0.5) * 1000:>8.1f}"
+                  f"{percentile(latencies, 0.95) * 1000:>8.1f}{stats['mean_wait'] * 1000:>9.2f}  {stats['sizes']}")
@@ -0,0 +1,113 @@
+""" Memory per worker and queries/s, each worker with its own model against the embedding service
+
+Starts --workers processes that each embed single questions from --threads threads
+for --seconds, the way search_db does under gthread workers. In "local" mode every
+process loads the model, in "service" mode they use embed_service.py, started here
+with the same model. RSS is read from /proc after the model or client is set up
+and again after the load.
+
+    python bench_embed_service.py
+    python bench_embed_service.py --workers 1 2 4 8 --threads 4 --model-dir /models
+"""
+import os
+import time
+import argparse
+import threading
+import multiprocessing
+import embedding
+import embed_service
+
+QUESTIONS = ["How many credits is COMP 690?", "When are the office hours for COMP 893?",
+             "How do I register my internship in Handshake?", "What are the weekly assignments?"]
+
+
+def rss_mb(pid="self"):
+    with open(f"/proc/{pid}/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+
+
+def worker(mode, args, start_at, results):
+    embed_model = embedding.make_model(args.model_dir) if mode == "local" else embed_service.EmbeddingClient(args.socket)
+    next(embed_model.embed(["warm up"]))
+    loaded = rss_mb()
+    counts = []
+
+    def load():
+        n = 0
+        while time.time() < start_at:
+            time.sleep(0.001)
+        while time.time() < start_at + args.seconds:
+            next(embed_model.embed([QUESTIONS[n % len(QUESTIONS)]]))
+            n += 1
+        counts.append(n)
+
+    threads = [threading.Thread(target=load) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((loaded, rss_mb(), sum(counts)))
+
+
+def serve(args):
+    embed_service.EmbedServer(embedding.make_model(args.model_dir), args.socket, args.max_batch, args.wait_ms).serve_forever()
+
+
+def wait_for_service(socket_path, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            client = embed_service.EmbeddingClient(socket_path)
+            client.model_name
+            client.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run(mode, workers, args):
+    """ (mean worker RSS MB after loading, after the run, service RSS MB, queries/s) """
+    server = None
+    if mode == "service":
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = multiprocessing.Process(target=serve, args=(args,), daemon=True)
+        server.start()
+        wait_for_service(args.socket, args.startup)
+    results = multiprocessing.Queue()
+    start_at = time.time() + args.startup
+    processes = [multiprocessing.Process(target=worker, args=(mode, args, start_at, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    stats = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    service_mb = 0.0
+    if server is not None:
+        service_mb = rss_mb(server.pid)
+        server.terminate()
+        server.join()
+    return (sum(stat[0] for stat in stats) / workers, sum(stat[1] for stat in stats) / workers, service_mb,
+            sum(stat[2] for stat in stats) / args.seconds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", nargs = "*", type = int, default = [1, 2, 4], help = "worker process counts")
+    parser.add_argument("--threads", type = int, default = 4, help = "concurrent queries per worker")
+    parser.add_argument("--seconds", type = float, default = 10, help = "load duration")
+    parser.add_argument("--startup", type = float, default = 20, help = "seconds allowed for the workers to load")
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    parser.add_argument("--socket", default = "/tmp/chatbot-embed-bench.sock", help = "socket for the benchmarked service")
+    parser.add_argument("--max-batch", type = int, default = 32, help = "service batch limit")
+    parser.add_argument("--wait-ms", type = float, default = 2.0, help = "service batch wait")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'workers':>8}{'worker MB':>11}{'after MB':>10}{'service MB':>12}{'total MB':>10}{'queries/s':>11}")
+    for workers in args.workers:
+        for mode in ["local", "service"]:
+            loaded, after, service_mb, rate = run(mode, workers, args)
+            print(f"{mode:<8}{workers:>8}{loaded:>11.0f}{after:>10.0f}{service_mb:>12.0f}"
+                  f"{after * workers + service_mb:>10.0f}{rate:>11.1f}")
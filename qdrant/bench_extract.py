@@ -0,0 +1,71 @@
+""" Benchmarks the pdf extraction backends over our syllabi and the sample test pdf
+
+Reports pages/s for each backend and text fidelity against PyPDF2, which is what
+the current collections were built with. For sample_pdf.pdf fidelity is also
+checked against its known text.
+"""
+import os
+import sys
+import glob
+import time
+import difflib
+import extract
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "..", "tests", "sample_test_docs", "sample_pdf.pdf")
+SAMPLE_TEXT = ("This is a sample PDF. It contains some text for testing purposes. "
+               "Each line is predictable and easy to verify.")
+REPEATS = 3
+
+
+def similarity(text_a, text_b):
+    """ Word level similarity of two texts, 1.0 means the same words in the same order """
+    return difflib.SequenceMatcher(None, text_a.split(), text_b.split(), autojunk=False).ratio()
+
+
+def time_backend(backend, pdf_path):
+    """ Best of REPEATS uncached extractions, returns (seconds, pages) """
+    best = None
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        pages = extract.extract_pages(pdf_path, backend, cache_dir=None)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, pages
+
+
+def main(pdf_paths):
+    reference = {path: extract.extract_pages(path, extract.DEFAULT_BACKEND, cache_dir=None)
+                 for path in pdf_paths}
+
+    print(f"{'backend':<10} {'pdf':<40} {'pages':>5} {'pages/s':>9} {'fidelity':>9}")
+    for backend in extract.BACKENDS:
+        total_pages, total_time = 0, 0.0
+        for path in pdf_paths:
+            try:
+                elapsed, pages = time_backend(backend, path)
+            except ImportError:
+                print(f"{backend:<10} not installed, skipping")
+                break
+            text = "".join(pages)
+            if os.path.abspath(path) == os.path.abspath(SAMPLE_PDF):
+                fidelity = similarity(text, SAMPLE_TEXT)
+            else:
+                fidelity = similarity(text, "".join(reference[path]))
+            total_pages += len(pages)
+            total_time += elapsed
+            print(f"{backend:<10} {os.path.basename(path):<40} {len(pages):>5} "
+                  f"{len(pages) / elapsed:>9.1f} {fidelity:>9.3f}")
+        if total_time:
+            print(f"{backend:<10} {'all':<40} {total_pages:>5} {total_pages / total_time:>9.1f}")
+
+    # the cache turns a re-run into a hash and a json read
+    path = pdf_paths[0]
+    extract.extract_pages(path)
+    start = time.perf_counter()
+    extract.extract_pages(path)
+    print(f"cached re-read of {os.path.basename(path)}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(os.path.dirname(__file__), "*.pdf"))) + [SAMPLE_PDF]
+    main(paths)
@@ -0,0 +1,150 @@
+""" Query latency, ingestion throughput and recall of the embedding model by onnx threads, workers and int8
+
+Query matrix: for every --workers count and --threads value, that many processes
+each load the model with that many onnxruntime threads and embed single questions
+for --seconds, the way gunicorn workers do. With --pin each worker is kept on its
+own cpu, as cpu_affinity in config.txt does. Reports queries/s over all workers
+and latency percentiles, for the model as downloaded and for its int8 copy.
+
+Ingestion: the chunks of the corpus pdfs are embedded in one go, in process and
+with each --parallel process count, and chunks/s reported.
+
+Recall: the corpus chunks and QUESTIONS plus --sample chunks as queries are embedded
+by both models; recall@k is the share of the downloaded model's top k chunks that
+are also in the top k found with int8 vectors, along with the mean cosine of the two
+vectors of a text. Two int8 cases are measured: a collection reindexed with int8
+(int8 queries and chunks), and int8 queries against chunks stored by the downloaded
+model, which the bot refuses (embedding.check_collection) and this shows why. The
+int8 copy has to exist, see embedding.py quantize.
+
+    python bench_onnx.py --model-dir /models
+    python bench_onnx.py --model-dir /models --workers 1 4 --threads 1 2 4 --pin --parallel 2 4
+"""
+import os
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import extract
+import normalize
+import load_pdf
+import reindex
+import embedding
+
+QUESTIONS = ["How many credits is COMP 690?", "When are the office hours for COMP 893?",
+             "How do I register my internship in Handshake?", "What are the weekly assignments?",
+             "How many hours do I need to work for the internship?", "Can I do my internship remotely?"]
+VARIANTS = {"model": False, "int8": True}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)] if values else 0.0
+
+
+def corpus_chunks(pdfs):
+    chunks = []
+    for pdf in pdfs:
+        pages = load_pdf.get_pages(load_pdf.path_from_name(pdf), extract.DEFAULT_BACKEND, extract.CACHE_DIR)
+        chunks += load_pdf.split_pages(normalize.normalize_pages(pages)[0])
+    return chunks
+
+
+def worker(args, int8, threads, cpu, start_at, results):
+    embedding.set_affinity([cpu] if cpu is not None else [])
+    embed_model = embedding.make_model(args.model_dir, int8 = int8, threads = threads)
+    next(embed_model.embed(["warm up"]))
+    latencies = []
+    n = 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    while time.time() < start_at + args.seconds:
+        start = time.perf_counter()
+        next(embed_model.embed([QUESTIONS[n % len(QUESTIONS)]]))
+        latencies.append(time.perf_counter() - start)
+        n += 1
+    results.put(latencies)
+
+
+def query_load(args, int8, workers, threads):
+    """ (queries/s, latencies) of workers processes each embedding one question at a time """
+    cpus = sorted(os.sched_getaffinity(0)) if args.pin else [None]
+    results = multiprocessing.Queue()
+    start_at = time.time() + args.startup
+    processes = [multiprocessing.Process(target=worker, args=(args, int8, threads, cpus[i % len(cpus)], start_at, results))
+                 for i in range(workers)]
+    for process in processes:
+        process.start()
+    latencies = [latency for _ in processes for latency in results.get()]
+    for process in processes:
+        process.join()
+    return len(latencies) / args.seconds, latencies
+
+
+def ingest_rate(embed_model, chunks, parallel):
+    start = time.perf_counter()
+    count = len(list(embedding.embed_documents(embed_model, chunks, parallel)))
+    return count / (time.perf_counter() - start)
+
+
+def normalized(vectors):
+    vectors = np.array(list(vectors), dtype = np.float32)
+    return vectors / np.linalg.norm(vectors, axis = 1, keepdims = True)
+
+
+def top_k(queries, docs, k):
+    return np.argsort(-(queries @ docs.T), axis = 1)[:, :k]
+
+
+def overlap(expected, found, k):
+    return float(np.mean([len(set(want) & set(got)) / k for want, got in zip(expected, found)]))
+
+
+def recall(reference, variant, chunks, queries, k):
+    """ {"reindexed": recall@k with variant queries and chunks, "stored": variant queries against reference
+    chunks, "cosine": mean cosine between the two vectors of a chunk}, recall against reference alone """
+    docs, variant_docs = normalized(reference.embed(chunks)), normalized(variant.embed(chunks))
+    asked, variant_asked = normalized(reference.embed(queries)), normalized(variant.embed(queries))
+    expected = top_k(asked, docs, k)
+    return {"reindexed": overlap(expected, top_k(variant_asked, variant_docs, k), k),
+            "stored": overlap(expected, top_k(variant_asked, docs, k), k),
+            "cosine": float(np.mean(np.sum(docs * variant_docs, axis = 1)))}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    parser.add_argument("--workers", nargs = "*", type = int, default = [1, 2, 4], help = "worker process counts")
+    parser.add_argument("--threads", nargs = "*", type = int, default = [1, 2, 4], help = "onnxruntime threads per worker")
+    parser.add_argument("--pin", action = "store_true", help = "pin each worker to one cpu, round robin")
+    parser.add_argument("--seconds", type = float, default = 10, help = "load duration per run")
+    parser.add_argument("--startup", type = float, default = 10, help = "seconds allowed for the workers to load")
+    parser.add_argument("--parallel", nargs = "*", type = int, default = [2, 4], help = "ingestion process counts")
+    parser.add_argument("--pdfs", nargs = "*", default = None, help = "pdfs to ingest, defaults to all in corpus.txt")
+    parser.add_argument("--k", type = int, default = 5, help = "chunks per search for recall")
+    parser.add_argument("--sample", type = int, default = 50, help = "chunks also used as queries for recall")
+    args = parser.parse_args()
+
+    pdfs = args.pdfs or sorted({pdf for entry in reindex.read_corpus().values() for pdf in entry["pdfs"]})
+    chunks = corpus_chunks(pdfs)
+    print(f"{len(chunks)} chunks from {', '.join(pdfs)}, {os.cpu_count()} cpus")
+
+    print(f"\n{'variant':<8}{'workers':>8}{'threads':>8}{'queries/s':>11}{'p50 ms':>8}{'p95 ms':>8}")
+    for variant, int8 in VARIANTS.items():
+        for workers in args.workers:
+            for threads in args.threads:
+                rate, latencies = query_load(args, int8, workers, threads)
+                print(f"{variant:<8}{workers:>8}{threads:>8}{rate:>11.1f}{percentile(latencies, 0.5) * 1000:>8.1f}"
+                      f"{percentile(latencies, 0.95) * 1000:>8.1f}")
+
+    models = {variant: embedding.make_model(args.model_dir, int8 = int8) for variant, int8 in VARIANTS.items()}
+    print(f"\n{'variant':<8}{'parallel':>9}{'chunks/s':>10}")
+    for variant, embed_model in models.items():
+        for parallel in [None] + args.parallel:
+            print(f"{variant:<8}{parallel if parallel is not None else '-':>9}{ingest_rate(embed_model, chunks, parallel):>10.1f}")
+
+    queries = QUESTIONS + chunks[::max(len(chunks) // args.sample, 1)][:args.sample]
+    result = recall(models["model"], models["int8"], chunks, queries, args.k)
+    print(f"\nint8 against the downloaded model over {len(queries)} queries, mean chunk cosine {result['cosine']:.4f}")
+    print(f"  recall@{args.k} reindexed with int8:           {result['reindexed']:.3f}")
+    print(f"  recall@{args.k} int8 queries on stored chunks:  {result['stored']:.3f}")
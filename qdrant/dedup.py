@@ -0,0 +1,78 @@
+""" Near-duplicate chunk detection with MinHash signatures and LSH banding
+
+Each chunk is turned into word shingles, hashed once with mmh3 and permuted
+NUM_PERM times with numpy to build its MinHash signature. Signatures are split
+into BANDS bands, chunks sharing any band are candidates, and candidates whose
+estimated jaccard similarity reaches THRESHOLD are duplicates.
+"""
+import numpy as np
+import mmh3
+
+SHINGLE_WORDS = 3
+NUM_PERM = 64
+BANDS = 16
+THRESHOLD = 0.8
+
+# mersenne prime for the (a * x + b) % p permutations, fixed seed so signatures are stable
+PRIME = (1 << 61) - 1
+_rng = np.random.RandomState(690)
+PERM_A = _rng.randint(1, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+PERM_B = _rng.randint(0, 1 << 31, size=NUM_PERM, dtype=np.uint64)
+
+
+def shingles(text):
+    """ Set of lowercase word k-shingles, short texts become a single shingle """
+    words = text.lower().split()
+    if len(words) <= SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(text):
+    """ MinHash signature of a text as a uint64 array of NUM_PERM values """
+    hashes = np.array([mmh3.hash(shingle, signed=False) for shingle in shingles(text)], dtype=np.uint64)
+    return ((np.outer(PERM_A, hashes) + PERM_B[:, None]) % PRIME).min(axis=1)
+
+
+def similarity(sig_a, sig_b):
+    """ Estimated jaccard similarity of two signatures """
+    return float(np.mean(sig_a == sig_b))
+
+
+class MinHashIndex:
+    """ LSH index of chunk signatures, finds the first stored chunk a new one duplicates """
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self.rows = NUM_PERM // BANDS
+        self.buckets = [{} for _ in range(BANDS)]
+        self.signatures = {}
+
+    def _bands(self, sig):
+        for band in range(BANDS):
+            yield band, sig[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key, text):
+        """ Stores a chunk under key """
+        sig = signature(text)
+        self.signatures[key] = sig
+        for band, bucket in self._bands(sig):
+            self.buckets[band].setdefault(bucket, []).append(key)
+
+    def query(self, text):
+        """ Returns the key of the most similar stored chunk above the threshold, or None """
+        sig = signature(text)
+        best, best_score = None, self.threshold - 1e-9
+        seen = set()
+        for band, bucket in self._bands(sig):
+            for key in self.buckets[band].get(bucket, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                score = similarity(sig, self.signatures[key])
+                if score > best_score:
+                    best, best_score = key, score
+        return best
+
+    def __len__(self):
+        return len(self.signatures)
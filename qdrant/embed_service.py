@@ -0,0 +1,216 @@
+""" Embedding sidecar: one process holds the model, bot workers embed through it
+
+Every bot worker normally loads its own onnx session, so memory grows with the
+worker count, and each question is embedded on its own. With embed_service set
+in config.txt the workers load no model; they send their texts to this process
+over a Unix socket. Texts arriving from any worker within wait_ms of each other
+are embedded in one batch, up to max_batch texts.
+
+Vectors don't go back through the socket: every connection gets a shared memory
+block the server writes the float32 vectors into, and the reply only says how
+many are there. Workers map the block from /dev/shm, so this is linux only, as
+the bot's docker image is.
+
+Protocol, little endian: on connect the server sends
+    uint32 dimension, uint32 slots, uint16 length + shared memory name, uint16 length + model id (embedding.model_id)
+then per request the client sends
+    uint32 count, count * (uint32 length + utf-8 text), count <= slots
+and the server answers with int32 count, or -1 followed by uint16 length + an error message.
+
+    python embed_service.py /tmp/chatbot-embed.sock
+    python embed_service.py /tmp/chatbot-embed.sock --model-dir /models --max-batch 64 --wait-ms 3
+    python embed_service.py /tmp/chatbot-embed.sock --model-dir /models --int8 --threads 2 --cpus 6-7
+"""
+import os
+import sys
+import mmap
+import socket
+import signal
+import struct
+import argparse
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+try:
+    from qdrant import schema, embedding
+except ImportError:
+    import schema
+    import embedding
+
+SLOTS = 64
+
+
+def recv_exact(conn, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = conn.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("embedding service connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def send_string(conn, text):
+    data = text.encode("utf-8")
+    conn.sendall(struct.pack("<H", len(data)) + data)
+
+
+def recv_string(conn):
+    return recv_exact(conn, struct.unpack("<H", recv_exact(conn, 2))[0]).decode("utf-8")
+
+
+def attach(name):
+    """ Maps a block the server made, read only. SharedMemory(name) would register it with this
+    process's resource tracker, which unlinks it when the worker exits and clashes with the server's own """
+    with open(os.path.join("/dev/shm", name.lstrip("/")), "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class EmbedServer:
+    def __init__(self, embed_model, socket_path, max_batch=32, wait_ms=2.0, dim=schema.VECTOR_SIZE):
+        self.embed_model = embed_model
+        self.batcher = embedding.EmbeddingBatcher(embed_model, max_batch, wait_ms)
+        self.socket_path = socket_path
+        self.dim = dim
+        self.listener = None
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.socket_path)
+        self.listener.listen(128)
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                # closed by shutdown()
+                return
+            threading.Thread(target=self._serve, args=(conn,), name="embed-conn", daemon=True).start()
+
+    def shutdown(self):
+        if self.listener is not None:
+            self.listener.close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def _serve(self, conn):
+        buffer = shared_memory.SharedMemory(create=True, size=SLOTS * self.dim * 4)
+        vectors = None
+        try:
+            vectors = np.ndarray((SLOTS, self.dim), dtype=np.float32, buffer=buffer.buf)
+            conn.sendall(struct.pack("<II", self.dim, SLOTS))
+            send_string(conn, buffer.name)
+            send_string(conn, embedding.model_id(self.embed_model))
+            while True:
+                count = struct.unpack("<I", recv_exact(conn, 4))[0]
+                texts = [recv_exact(conn, struct.unpack("<I", recv_exact(conn, 4))[0]).decode("utf-8")
+                         for _ in range(count)]
+                try:
+                    if count > SLOTS:
+                        raise ValueError(f"at most {SLOTS} texts per request")
+                    vectors[:count] = list(self.batcher.embed(texts))
+                except Exception as error:
+                    conn.sendall(struct.pack("<i", -1))
+                    send_string(conn, f"{type(error).__name__}: {error}")
+                    continue
+                conn.sendall(struct.pack("<i", count))
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            del vectors
+            conn.close()
+            buffer.close()
+            buffer.unlink()
+
+
+class EmbeddingClient:
+    """ Stands in for TextEmbedding in the bot workers, embedding through the service.
+    Every thread gets its own connection and shared memory block """
+
+    def __init__(self, socket_path, timeout=30):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    @property
+    def model_id(self):
+        # asked of the service on first use, building a client opens no connection to inherit across a fork
+        return self._connection()[3]
+
+    @property
+    def model_name(self):
+        return self.model_id.removesuffix(embedding.INT8_SUFFIX)
+
+    def _connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None or connection[4] != os.getpid():
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(self.timeout)
+            conn.connect(self.socket_path)
+            dim, slots = struct.unpack("<II", recv_exact(conn, 8))
+            buffer = attach(recv_string(conn))
+            vectors = np.frombuffer(buffer, dtype=np.float32, count=slots * dim).reshape(slots, dim)
+            connection = (conn, buffer, vectors, recv_string(conn), os.getpid())
+            self.local.connection = connection
+        return connection
+
+    def close(self):
+        """ Closes this thread's connection, the service then frees its shared memory block """
+        connection = getattr(self.local, "connection", None)
+        self.local.connection = None
+        if connection is not None:
+            connection[0].close()
+
+    def embed(self, documents, batch_size=None, **kwargs):
+        if isinstance(documents, str):
+            documents = [documents]
+        documents = list(documents)
+        slots = len(self._connection()[2])
+        for start in range(0, len(documents), slots):
+            # copied before yielding, a later request from this thread reuses the block
+            yield from self._request(documents[start:start + slots])
+
+    def _request(self, texts):
+        conn, _, vectors, _, _ = self._connection()
+        request = [struct.pack("<I", len(texts))]
+        for text in texts:
+            data = text.encode("utf-8")
+            request += [struct.pack("<I", len(data)), data]
+        try:
+            conn.sendall(b"".join(request))
+            count = struct.unpack("<i", recv_exact(conn, 4))[0]
+            if count < 0:
+                raise RuntimeError(f"embedding service: {recv_string(conn)}")
+        except (ConnectionError, OSError):
+            # the stream may be half read, the next call starts over on a new connection
+            self.local.connection = None
+            conn.close()
+            raise
+        return vectors[:count].copy()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("socket", help = "unix socket path, embed_service in config.txt")
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    parser.add_argument("--max-batch", type = int, default = 32, help = "most texts embedded in one batch")
+    parser.add_argument("--wait-ms", type = float, default = 2.0, help = "how long a batch waits for more texts")
+    parser.add_argument("--int8", action = "store_true", help = "serve the int8 copy of the model (embedding.py quantize)")
+    parser.add_argument("--threads", type = int, default = None, help = "onnxruntime threads, defaults to every core")
+    parser.add_argument("--cpus", default = "", help = "cpus to run on, e.g. 6-7, keeps the service off the workers' cpus")
+    args = parser.parse_args()
+
+    embedding.set_affinity(embedding.parse_cpus(args.cpus))
+    embed_model = embedding.make_model(args.model_dir, int8 = args.int8, threads = args.threads)
+    server = EmbedServer(embed_model, args.socket, args.max_batch, args.wait_ms)
+    print(f"embedding on {args.socket}, batches of up to {args.max_batch} texts within {args.wait_ms}ms")
+    # docker stop sends SIGTERM, clean up the socket the same as for ctrl-c
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        print(f"batches: {server.batcher.stats()}")
@@ -0,0 +1,313 @@
+""" One place that builds the embedding model, from a local model folder when one is set
+
+fastembed downloads its model into a cache on first use, so a fresh container
+pays for the download at startup and can't start at all without network access.
+With a model folder (embed_model_dir in config.txt, --model-dir for the scripts,
+or the EMBED_MODEL_DIR environment variable the Dockerfile sets) the model is
+read from that folder and the network is never touched. The Dockerfile fills
+the folder at build time with the download command below.
+
+Every model is checked to make VECTOR_SIZE vectors before it is used, a model
+that doesn't match the collections would otherwise only fail at search time.
+
+quantize writes a copy of the model with int8 weights to <model folder>/int8,
+which make_model(int8=True) loads instead; bench_onnx.py measures what it costs
+in recall. Its vectors are close to the original model's but not the same, so
+every stored point records which variant made it (model_id) and the bot refuses
+collections of the other one (check_collection). threads caps the onnxruntime
+threads of one session, by default it takes every core, which several workers on
+one host then fight over.
+
+    python embedding.py download /models
+    python embedding.py quantize /models
+    python embedding.py check /models
+    python embedding.py coldstart /models
+"""
+import os
+import time
+import queue
+import shutil
+import argparse
+import tempfile
+import threading
+from collections import Counter
+from  qdrant_client import models
+try:
+    from qdrant import schema
+except ImportError:
+    import schema
+
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
+MODEL_DIR_ENV = "EMBED_MODEL_DIR"
+INT8_DIR = "int8"
+INT8_SUFFIX = ":int8"
+
+
+def model_dir_setting(model_dir=""):
+    """ The configured model folder, else the environment's, "" for fastembed's own cache """
+    return model_dir or os.environ.get(MODEL_DIR_ENV, "")
+
+
+def int8_dir(model_dir):
+    return os.path.join(model_dir, INT8_DIR)
+
+
+def make_model(model_dir="", model_name=MODEL_NAME, int8=False, **kwargs):
+    """ TextEmbedding read only from model_dir when there is one, or from its int8 copy,
+    checked against the collection size. kwargs go to TextEmbedding, e.g. threads """
+    from fastembed import TextEmbedding
+    model_dir = model_dir_setting(model_dir)
+    if int8:
+        if not model_dir:
+            raise ValueError("the int8 model is made from a model folder, set one and run qdrant/embedding.py quantize on it")
+        model_dir = int8_dir(model_dir)
+    if model_dir:
+        # fastembed retries a missing model for ~40s before giving up, fail straight away instead
+        if not os.path.isdir(model_dir) or not os.listdir(model_dir):
+            raise FileNotFoundError(f"no embedding model in {model_dir}, run qdrant/embedding.py download {model_dir}")
+        embed_model = TextEmbedding(model_name, cache_dir = model_dir, local_files_only = True, **kwargs)
+    else:
+        embed_model = TextEmbedding(model_name, **kwargs)
+    embed_model.model_id = model_name + (INT8_SUFFIX if int8 else "")
+    check_dimension(embed_model)
+    return embed_model
+
+
+def model_id(embed_model):
+    """ Model name plus variant, what a collection's points record in schema.EMBEDDING """
+    return getattr(embed_model, "model_id", embed_model.model_name)
+
+
+def stored_model(client, collection, exclude_source=None):
+    """ model_id the vectors of collection were made with, None for an empty or missing collection """
+    if not schema.collection_exists(client, collection):
+        return None
+    scroll_filter = None
+    if exclude_source is not None:
+        scroll_filter = models.Filter(must_not = [models.FieldCondition(key = schema.SOURCE,
+                                                                        match = models.MatchValue(value = exclude_source))])
+    points, _ = client.scroll(collection_name = collection, scroll_filter = scroll_filter, limit = 1,
+                              with_payload = True, with_vectors = False)
+    return points[0].payload.get(schema.EMBEDDING, MODEL_NAME) if points else None
+
+
+def check_collection(client, collection, embed_model, exclude_source=None):
+    """ ValueError when collection holds vectors of another model or variant than embed_model makes """
+    stored = stored_model(client, collection, exclude_source)
+    if stored is not None and stored != model_id(embed_model):
+        raise ValueError(f"{collection} holds vectors made with {stored}, not {model_id(embed_model)}; "
+                         f"use the same model and variant (embed_int8, --int8) for loading and serving")
+    return stored
+
+
+def check_dimension(embed_model, size=schema.VECTOR_SIZE):
+    """ Vector length of embed_model, ValueError when it is not what the collections hold """
+    dim = len(next(embed_model.embed(["dimension check"])))
+    if dim != size:
+        raise ValueError(f"{embed_model.model_name} makes {dim} dimension vectors, the collections hold {size}")
+    return dim
+
+
+class EmbeddingBatcher:
+    """ Stands in for an embedding model shared by threads: texts from concurrent embed() calls
+    are collected for up to wait_ms, or until max_batch texts, and embedded in one inference.
+    A batch only waits while other calls are on their way, a lone caller never waits.
+    on_batch(size, wait_seconds, run_seconds) is called after every batch """
+
+    def __init__(self, embed_model, max_batch=32, wait_ms=2.0, on_batch=None):
+        self.embed_model = embed_model
+        self.model_name = embed_model.model_name
+        self.model_id = model_id(embed_model)
+        self.max_batch = max_batch
+        self.wait = wait_ms / 1000
+        self.on_batch = on_batch
+        self.sizes = Counter()
+        self.calls = 0
+        self.waited = 0.0
+        self.ran = 0.0
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.pid = None
+
+    def _start(self):
+        # started on first use, in the process that uses it: a thread started before a fork isn't in the child
+        with self.lock:
+            if self.pid != os.getpid():
+                self.jobs = queue.Queue()
+                threading.Thread(target=self._run, name="embed-batcher", daemon=True).start()
+                self.pid = os.getpid()
+
+    def embed(self, documents, batch_size=None, **kwargs):
+        """ Same vectors as embed_model.embed(documents), computed in the shared batches """
+        if isinstance(documents, str):
+            documents = [documents]
+        if self.pid != os.getpid():
+            self._start()
+        job = {"texts": list(documents), "queued": time.perf_counter(), "done": threading.Event()}
+        with self.lock:
+            self.pending += 1
+        self.jobs.put(job)
+        job["done"].wait()
+        if "error" in job:
+            raise job["error"]
+        yield from job["vectors"]
+
+    def _run(self):
+        while True:
+            batch = [self.jobs.get()]
+            count = len(batch[0]["texts"])
+            deadline = time.monotonic() + self.wait
+            # pending counts calls not answered yet, more than in the batch means more are queued
+            while count < self.max_batch and len(batch) < self.pending:
+                try:
+                    job = self.jobs.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                batch.append(job)
+                count += len(job["texts"])
+            texts = [text for job in batch for text in job["texts"]]
+            start = time.perf_counter()
+            try:
+                vectors = list(self.embed_model.embed(texts, batch_size=len(texts)))
+            except Exception as error:
+                vectors = None
+                for job in batch:
+                    job["error"] = error
+            ran = time.perf_counter() - start
+            waited = sum(start - job["queued"] for job in batch) / len(batch)
+            self.sizes[len(texts)] += 1
+            self.calls += len(batch)
+            self.waited += waited * len(batch)
+            self.ran += ran
+            with self.lock:
+                self.pending -= len(batch)
+            first = 0
+            for job in batch:
+                if vectors is not None:
+                    job["vectors"] = vectors[first:first + len(job["texts"])]
+                first += len(job["texts"])
+                job["done"].set()
+            if self.on_batch is not None:
+                # the thread serves every later call, a failing callback must not end it
+                try:
+                    self.on_batch(len(texts), waited, ran)
+                except Exception as error:
+                    print(f"embedding batch callback failed: {error}")
+
+    def stats(self):
+        """ Batch size distribution {size: batches}, mean seconds a call waited for its batch to start,
+        mean seconds an inference took """
+        batches = sum(self.sizes.values())
+        return {"sizes": dict(sorted(self.sizes.items())), "mean_wait": self.waited / self.calls if self.calls else 0.0,
+                "mean_run": self.ran / batches if batches else 0.0}
+
+
+def embed_documents(embed_model, documents, parallel=None):
+    """ embed_model.embed(documents), spread over parallel processes when set (0 for one per core) """
+    if parallel is None:
+        return embed_model.embed(documents)
+    # the processes load the model again from its name and folder only, keep them offline as well
+    local_files_only = getattr(getattr(embed_model, "model", None), "_local_files_only", False)
+    return embed_model.embed(documents, parallel = parallel, local_files_only = local_files_only)
+
+
+def parse_cpus(spec):
+    """ CPU numbers of a list like "0-3,6", [] for an empty one """
+    cpus = []
+    for part in spec.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, dash, last = part.partition("-")
+        if not first.isdigit() or (dash and not last.isdigit()) or int(last or first) < int(first):
+            raise ValueError(f"bad cpu list {spec!r}, expected something like 0-3,6")
+        cpus += [cpu for cpu in range(int(first), int(last or first) + 1) if cpu not in cpus]
+    return cpus
+
+
+def set_affinity(cpus):
+    """ Keeps this process, and the threads and processes it starts, on cpus; nothing for [] """
+    if not cpus:
+        return
+    if not hasattr(os, "sched_setaffinity"):
+        print("cpu affinity is only supported on linux, ignored")
+        return
+    os.sched_setaffinity(0, cpus)
+
+
+def download(model_dir, model_name=MODEL_NAME):
+    """ Fetches the model into model_dir, for the image build """
+    from fastembed import TextEmbedding
+    check_dimension(TextEmbedding(model_name, cache_dir = model_dir))
+
+
+def quantize(model_dir):
+    """ Copies the model in model_dir to model_dir/int8 with every onnx file's weights quantized to int8,
+    activations are quantized per batch at run time. Returns the files quantized """
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    target = int8_dir(model_dir)
+    shutil.rmtree(target, ignore_errors = True)
+    # the huggingface cache links snapshot files to blobs, keep the links so the weights aren't copied twice
+    shutil.copytree(model_dir, target, symlinks = True, ignore = shutil.ignore_patterns(INT8_DIR))
+    quantized = []
+    for root, _, files in os.walk(target):
+        for name in files:
+            if not name.endswith(".onnx"):
+                continue
+            path = os.path.join(root, name)
+            source = os.path.realpath(path)
+            quantize_dynamic(source, path + ".tmp", weight_type = QuantType.QInt8)
+            os.replace(path + ".tmp", path)
+            # a link to the copied blob leaves that blob unused, an absolute link points at the original model
+            if source != path and os.path.commonpath([source, os.path.realpath(target)]) == os.path.realpath(target):
+                os.remove(source)
+            quantized.append(path)
+    if not quantized:
+        raise FileNotFoundError(f"no onnx model in {model_dir}, run qdrant/embedding.py download {model_dir} first")
+    return quantized
+
+
+def time_load(model_dir, model_name=MODEL_NAME, **kwargs):
+    start = time.perf_counter()
+    make_model(model_dir, model_name, **kwargs)
+    return time.perf_counter() - start
+
+
+def cold_start(model_dir, model_name=MODEL_NAME):
+    """ Seconds to a working model from model_dir, and from an empty cache (download included, None offline) """
+    baked = time_load(model_dir, model_name)
+    scratch = tempfile.mkdtemp(prefix = "fastembed_cold_")
+    try:
+        start = time.perf_counter()
+        download(scratch, model_name)
+        fresh = time.perf_counter() - start
+    except Exception as error:
+        print(f"download from an empty cache failed: {error}")
+        fresh = None
+    finally:
+        shutil.rmtree(scratch, ignore_errors = True)
+    return baked, fresh
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices = ["download", "quantize", "check", "coldstart"])
+    parser.add_argument("model_dir", help = "model folder")
+    parser.add_argument("--model", default = MODEL_NAME, help = "fastembed model name")
+    parser.add_argument("--int8", action = "store_true", help = "check the quantized copy")
+    args = parser.parse_args()
+
+    if args.command == "download":
+        download(args.model_dir, args.model)
+        print(f"{args.model} saved in {args.model_dir}")
+    elif args.command == "quantize":
+        for path in quantize(args.model_dir):
+            print(f"quantized {path}")
+        print(f"{args.model} int8 copy loads in {time_load(args.model_dir, args.model, int8 = True):.2f}s")
+    elif args.command == "check":
+        print(f"{args.model} loads from {args.model_dir} in {time_load(args.model_dir, args.model, int8 = args.int8):.2f}s "
+              f"and makes {schema.VECTOR_SIZE} dimension vectors")
+    else:
+        baked, fresh = cold_start(args.model_dir, args.model)
+        print(f"from {args.model_dir}: {baked:.2f}s")
+        if fresh is not None:
+            print(f"from an empty cache: {fresh:.2f}s, {fresh - baked:.2f}s saved per cold start")
@@ -0,0 +1,94 @@
+""" PDF text extraction backends and an on-disk per-page text cache
+
+PyPDF2 is the default backend. pypdfium2 and pdfminer.six are optional and only
+imported when selected, install them with pip to use them.
+"""
+import os
+import json
+import hashlib
+
+DEFAULT_BACKEND = "pypdf2"
+CACHE_DIR = os.path.join(os.path.dirname(__file__), "extract_cache")
+# bump when extraction changes so old cache entries are not reused
+CACHE_VERSION = 1
+
+
+def pypdf2_pages(pdf_path):
+    """ Extracts page texts with PyPDF2 """
+    import PyPDF2
+    pages = []
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page in reader.pages:
+            pages.append(page.extract_text() or "")
+    return pages
+
+
+def pypdfium2_pages(pdf_path):
+    """ Extracts page texts with pypdfium2 (pdfium bindings, much faster) """
+    import pypdfium2
+    pages = []
+    pdf = pypdfium2.PdfDocument(pdf_path)
+    try:
+        for page in pdf:
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_range().replace("\r\n", "\n"))
+            textpage.close()
+            page.close()
+    finally:
+        pdf.close()
+    return pages
+
+
+def pdfminer_pages(pdf_path):
+    """ Extracts page texts with pdfminer.six """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTTextContainer
+    pages = []
+    for layout in extract_pages(pdf_path):
+        pages.append("".join(element.get_text() for element in layout
+                             if isinstance(element, LTTextContainer)))
+    return pages
+
+
+BACKENDS = {
+    "pypdf2": pypdf2_pages,
+    "pypdfium2": pypdfium2_pages,
+    "pdfminer": pdfminer_pages,
+}
+
+
+def file_hash(pdf_path):
+    """ sha256 of the file contents """
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_path(pdf_path, backend, cache_dir):
+    """ Cache file for a pdf, keyed by content hash so renamed or edited files are handled """
+    return os.path.join(cache_dir, f"{file_hash(pdf_path)}-{backend}-v{CACHE_VERSION}.json")
+
+
+def extract_pages(pdf_path, backend=DEFAULT_BACKEND, cache_dir=CACHE_DIR):
+    """ Returns the list of page texts of a pdf, cached on disk unless cache_dir is None """
+    if backend not in BACKENDS:
+        raise ValueError(f"unknown pdf backend {backend}, choose from {', '.join(BACKENDS)}")
+
+    if cache_dir is None:
+        return BACKENDS[backend](pdf_path)
+
+    path = cache_path(pdf_path, backend, cache_dir)
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)
+
+    pages = BACKENDS[backend](pdf_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding="utf-8") as file:
+        json.dump(pages, file)
+    os.replace(tmp_path, path)
+    return pages
@@ -1,22 +1,33 @@
-""" Script to load pdf into qdrant vector database, needs pdf name as command line argument """
+""" Script to load pdf into qdrant vector database, needs pdf name and collection as command line arguments """
 import os
-import sys
-import PyPDF2
+import re
+import time
+import uuid
+import bisect
+import argparse
 from  qdrant_client import QdrantClient, models
-from fastembed import TextEmbedding
 from langchain.text_splitter import CharacterTextSplitter
+import schema
+import extract
+import normalize
+import dedup
+import embedding
 
 CHUNK_SIZE = 300
+CHUNK_OVERLAP = 100
+# collections every search also hits, so a chunk already stored there is dropped from the target
+DEDUP_AGAINST = ["default"]
 
-def get_docs(pdf_path):
+# short all caps lines like "COURSE SCHEDULE" are treated as section headings
+HEADING = re.compile(r"^[A-Z][A-Z0-9 &/,:()\-]{3,60}$")
+
+def get_pages(pdf_path, backend=extract.DEFAULT_BACKEND, cache_dir=extract.CACHE_DIR):
+    """ Converts pdf into a list of page texts"""
+    return extract.extract_pages(pdf_path, backend, cache_dir)
+
+def get_docs(pdf_path, backend=extract.DEFAULT_BACKEND, cache_dir=extract.CACHE_DIR):
     """ Converts pdf into string of text"""
-    text = ""
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            text += page.extract_text() or ""
-    return text
+    return "".join(get_pages(pdf_path, backend, cache_dir))
 
 def path_from_name(file_name):
     """Converts name to file path """
@@ -25,28 +36,182 @@ def path_from_name(file_name):
 
     return file_path
 
-path = path_from_name(sys.argv[1])
-collect = sys.argv[2]
+def course_from_collection(collection):
+    """ Course collections are named after the course number, everything else is general """
+    return collection if collection.isdigit() else ""
+
+def point_id(source, index):
+    """ Stable point id per source and chunk, so loading a second pdf doesn't overwrite the first """
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{source}#{index}"))
+
+def find_headings(docs):
+    """ Returns sorted start offsets and titles of heading lines in the document """
+    offsets, titles = [], []
+    start = 0
+    for line in docs.splitlines(keepends=True):
+        if HEADING.match(line.strip()):
+            offsets.append(start)
+            titles.append(line.strip())
+        start += len(line)
+    return offsets, titles
+
+def build_payloads(chunks, pages, source, course, corpus_version):
+    """ Locates each chunk in the document and builds its payload """
+    docs = "".join(pages)
+    page_starts = []
+    offset = 0
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page)
+    head_offsets, head_titles = find_headings(docs)
+
+    payloads = []
+    search_from = 0
+    for section in chunks:
+        char_start = docs.find(section, search_from)
+        if char_start == -1:
+            # splitter strips whitespace at the edges, fall back to a search from the top
+            char_start = max(docs.find(section), 0)
+        char_end = char_start + len(section)
+        search_from = char_start + 1
+
+        page = max(bisect.bisect_right(page_starts, char_start), 1)
+        heading = bisect.bisect_right(head_offsets, char_start) - 1
+        title = head_titles[heading] if heading >= 0 else ""
+
+        payloads.append(schema.make_payload(section, source, page, course, title,
+                                            char_start, char_end, corpus_version))
+    return payloads
+
+def scroll_points(client, collection):
+    """ Yields every point of a collection with its payload """
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name = collection, limit = 256, offset = offset,
+                                       with_payload = True, with_vectors = False)
+        yield from points
+        if offset is None:
+            break
+
+def dedup_chunks(client, chunks, payloads, collection, source, against, deferred=None, alias=None):
+    """ Drops chunks that near-duplicate an earlier chunk of this pdf or a stored chunk in the
+    target or against collections, the kept copy records where the dropped ones came from,
+    under alias when the target is a versioned build that alias will point at.
+    With deferred, refs for kept copies in the against collections are collected there as
+    {(collection, point id): refs} instead of written, for the caller to write once it is safe.
+    Returns the indices of the chunks to keep """
+    index = dedup.MinHashIndex()
+    stored = {}
+    for name in dict.fromkeys([collection] + list(against)):
+        if not schema.collection_exists(client, name):
+            continue
+        for point in scroll_points(client, name):
+            if name == collection and point.payload.get(schema.SOURCE) == source:
+                # about to be replaced by this load
+                continue
+            stored[(name, point.id)] = point.payload
+            index.add((name, point.id), schema.payload_text(point.payload))
+
+    kept = []
+    updates = {}
+    for chunk_index, text in enumerate(chunks):
+        match = index.query(text)
+        ref = schema.duplicate_ref(payloads[chunk_index], alias or collection)
+        if match is None:
+            index.add((None, chunk_index), text)
+            kept.append(chunk_index)
+            continue
+        if match[0] is None:
+            refs = payloads[match[1]][schema.DUPLICATES]
+        else:
+            earlier = deferred.get(match) if deferred is not None else None
+            refs = updates.setdefault(match, list(earlier or stored[match].get(schema.DUPLICATES, [])))
+        if ref not in refs:
+            refs.append(ref)
+
+    for (name, stored_id), refs in updates.items():
+        if deferred is not None and name != collection:
+            deferred[(name, stored_id)] = refs
+            continue
+        client.set_payload(collection_name = name, payload = {schema.DUPLICATES: refs}, points = [stored_id])
+    return kept
+
+def split_pages(pages):
+    text_splitter = CharacterTextSplitter( separator = "\n", chunk_size = CHUNK_SIZE,
+                                          chunk_overlap = CHUNK_OVERLAP, length_function=len)
+    return text_splitter.split_text("".join(pages))
+
+def load_pdf(client, embed_model, pdf_path, collection, course, corpus_version,
+             backend=extract.DEFAULT_BACKEND, cache_dir=extract.CACHE_DIR, normalize_text=True,
+             dedup_against=DEDUP_AGAINST, parallel=None, deferred=None, alias=None):
+    """ Splits, embeds and upserts one pdf, returns the number of chunks stored.
+    parallel embeds in that many processes, 0 for one per core; deferred and alias are passed to dedup_chunks """
+    source = os.path.basename(pdf_path)
+    pages = get_pages(pdf_path, backend, cache_dir)
+    if normalize_text:
+        pages, stats = normalize.normalize_pages(pages)
+        print(f"{source}: normalization removed {stats['chars_removed']} of {stats['chars_before']} chars, "
+              f"~{stats['tokens_removed']} of {stats['tokens_before']} tokens")
+
+    chunks = split_pages(pages)
+    if not chunks:
+        return 0
 
-docs = get_docs(path)
+    # a collection holds vectors of one model variant, searches with another would quietly match poorly
+    embedding.check_collection(client, collection, embed_model, exclude_source = source)
+    pl_text = build_payloads(chunks, pages, source, course, corpus_version)
+    for payload in pl_text:
+        payload[schema.EMBEDDING] = embedding.model_id(embed_model)
+    kept = list(range(len(chunks)))
+    if dedup_against is not None:
+        kept = dedup_chunks(client, chunks, pl_text, collection, source, dedup_against, deferred, alias)
+        print(f"{source}: dedup removed {len(chunks) - len(kept)} of {len(chunks)} chunks")
 
-text_splitter = CharacterTextSplitter( separator = "\n", chunk_size = CHUNK_SIZE,
-                                      chunk_overlap = 100, length_function=len)
+    embeds = embedding.embed_documents(embed_model, [chunks[index] for index in kept], parallel)
 
-chunks = text_splitter.split_text(docs)
+    embeds = models.Batch( ids=[point_id(source, index) for index in kept],
+                           vectors = list(embeds), payloads = [pl_text[index] for index in kept])
 
-client = QdrantClient( host='localhost' )
-embed_model = TextEmbedding()
+    # clear points left by an earlier load of this pdf so dropped or shorter chunk lists don't linger
+    client.delete(collection_name = collection, points_selector = models.FilterSelector(
+        filter = models.Filter(must = [models.FieldCondition(key = schema.SOURCE,
+                                                             match = models.MatchValue(value = source))])))
+    client.upsert(collection_name = collection,
+                  points = embeds
+                 )
+    return len(kept)
 
-embeds = embed_model.embed(chunks)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument("pdf", help = "pdf file name, relative to this folder")
+    parser.add_argument("collection", help = "qdrant collection to load into")
+    parser.add_argument("--course", default = None,
+                        help = "course the pdf belongs to, defaults to the collection name if numeric")
+    parser.add_argument("--corpus-version", default = time.strftime("%Y%m%d"),
+                        help = "version tag stored with every chunk")
+    parser.add_argument("--backend", default = extract.DEFAULT_BACKEND, choices = list(extract.BACKENDS),
+                        help = "pdf text extraction backend")
+    parser.add_argument("--no-cache", action = "store_true",
+                        help = "always re-extract instead of using the page text cache")
+    parser.add_argument("--no-normalize", action = "store_true",
+                        help = "keep the extracted text as is, without whitespace/hyphen/header cleanup")
+    parser.add_argument("--dedup-against", nargs = "*", default = DEDUP_AGAINST,
+                        help = "collections to check for near-duplicates besides the target collection")
+    parser.add_argument("--no-dedup", action = "store_true", help = "store every chunk, even near-duplicates")
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    parser.add_argument("--int8", action = "store_true", help = "embed with the int8 copy of the model (embedding.py quantize)")
+    parser.add_argument("--threads", type = int, default = None, help = "onnxruntime threads, defaults to every core")
+    parser.add_argument("--parallel", type = int, default = None,
+                        help = "embed in this many processes, 0 for one per core; large pdfs only")
+    args = parser.parse_args()
 
-pl_text = []
-for index, section in enumerate(chunks):
-    payload = {str(index) : section}
-    pl_text.append(payload)
+    course = args.course if args.course is not None else course_from_collection(args.collection)
 
-embeds = models.Batch( ids=range(0, len(chunks)), vectors = list(embeds), payloads = pl_text)
+    client = QdrantClient( host='localhost' )
+    embed_model = embedding.make_model(args.model_dir, int8 = args.int8, threads = args.threads)
 
-client.upsert(collection_name = collect,
-              points = embeds
-             )
\ No newline at end of file
+    count = load_pdf(client, embed_model, path_from_name(args.pdf), args.collection,
+                     course, args.corpus_version, args.backend,
+                     None if args.no_cache else extract.CACHE_DIR, not args.no_normalize,
+                     None if args.no_dedup else args.dedup_against, args.parallel)
+    print(f"loaded {count} chunks from {args.pdf} into {args.collection}")
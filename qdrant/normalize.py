@@ -0,0 +1,83 @@
+""" Text normalization between pdf extraction and chunking
+
+Removes text that costs embedding and prompt tokens without carrying meaning:
+page headers/footers repeated on every page, hyphenation across line breaks and
+runs of whitespace. Newlines are kept since the splitter chunks on them.
+"""
+import re
+from collections import Counter
+try:
+    from qdrant import schema
+except ImportError:
+    import schema
+
+# how many lines at the top and bottom of a page are checked for headers/footers
+EDGE_LINES = 3
+# a line must repeat on at least this share of pages to count as a header/footer
+REPEAT_SHARE = 0.5
+
+SPACES = re.compile(r"[ \t\f\v\u00a0]+")
+SPACE_AROUND_NEWLINE = re.compile(r" ?\n ?")
+BLANK_LINES = re.compile(r"\n{2,}")
+HYPHEN_BREAK = re.compile(r"([a-z])-\n([a-z])")
+DIGITS = re.compile(r"\d+")
+
+
+def line_key(line):
+    """ Compares lines ignoring spacing and numbers, so "Page 2" and "Page 3" match """
+    return DIGITS.sub("#", " ".join(line.split())).lower()
+
+
+def edge_keys(page):
+    """ Keys of the first and last non-empty lines of a page """
+    lines = [line for line in page.splitlines() if line.strip()]
+    return {line_key(line) for line in lines[:EDGE_LINES] + lines[-EDGE_LINES:]}
+
+
+def strip_repeated_lines(pages):
+    """ Drops header/footer lines that show up at the edges of most pages """
+    if len(pages) < 2:
+        return pages
+    counts = Counter(key for page in pages for key in edge_keys(page))
+    needed = max(2, len(pages) * REPEAT_SHARE)
+    repeated = {key for key, count in counts.items() if count >= needed and key}
+
+    cleaned = []
+    for page in pages:
+        lines = page.splitlines(keepends=True)
+        content = [index for index, line in enumerate(lines) if line.strip()]
+        edges = set(content[:EDGE_LINES] + content[-EDGE_LINES:])
+        cleaned.append("".join(line for index, line in enumerate(lines)
+                               if index not in edges or line_key(line) not in repeated))
+    return cleaned
+
+
+def fix_hyphenation(text):
+    """ Joins words split with a hyphen at a line break, "intern-\\nship" -> "internship" """
+    return HYPHEN_BREAK.sub(r"\1\2", text)
+
+
+def collapse_whitespace(text):
+    """ Collapses runs of spaces and blank lines, keeps single newlines """
+    text = SPACES.sub(" ", text)
+    text = SPACE_AROUND_NEWLINE.sub("\n", text)
+    text = BLANK_LINES.sub("\n", text)
+    return text.strip()
+
+
+def normalize_pages(pages):
+    """ Normalizes page texts, returns (pages, stats) with the characters and tokens removed """
+    before = "".join(pages)
+    pages = strip_repeated_lines(pages)
+    pages = [fix_hyphenation(collapse_whitespace(page)) for page in pages]
+    # keep a line break between pages so the splitter can still cut there
+    pages = [page if page.endswith("\n") or not page else page + "\n" for page in pages]
+    after = "".join(pages)
+
+    stats = {
+        "chars_before": len(before),
+        "chars_removed": len(before) - len(after),
+        "tokens_before": schema.estimate_tokens(before),
+        "tokens_removed": schema.estimate_tokens(before) - schema.estimate_tokens(after),
+    }
+    return pages, stats
@@ -1,18 +1,37 @@
 from  qdrant_client import QdrantClient, models
-from fastembed import TextEmbedding
+try:
+    from qdrant import schema
+except ImportError:
+    import schema
 
 
-def search_db(client, q_text, embed_model, collection_name="internship2024"):
-    """" query vector DB, returns http.models.models object"""
+def embed_query(q_text, embed_model):
+    return next(embed_model.embed([q_text]))
+
+
+def search_db(client, q_text, embed_model, collection_name="internship2024", source=None, query_vector=None, limit=15):
+    """" query vector DB, returns http.models.models object
+    source limits the search to chunks from one pdf, e.g. "chatbox.pdf"
+    query_vector skips embedding q_text when the caller already has its vector
+    limit is how many chunks come back """
+    if query_vector is None:
+        query_vector = embed_query(q_text, embed_model)
+    query_filter = None
+    if source:
+        query_filter = models.Filter(must=[
+            models.FieldCondition(key=schema.SOURCE, match=models.MatchValue(value=source))
+        ])
     search_result = client.search(
     collection_name=collection_name,
-    limit = 15,
-    query_vector = next(embed_model.embed([q_text]))
+    limit = limit,
+    query_vector = query_vector,
+    query_filter = query_filter
     )
     return search_result
 
 if __name__ == "__main__":
+    import embedding
     client = QdrantClient( host='localhost' )
-    embed_model = TextEmbedding()
+    embed_model = embedding.make_model()
     result = search_db(client, "What is the schedule for week 4", embed_model)
-    print(result[0].payload.values())
\ No newline at end of file
+    print(schema.payload_text(result[0].payload))
@@ -1,12 +1,13 @@
+import time
 from  qdrant_client import QdrantClient, models
+import schema
 
 client = QdrantClient(host="localhost")
 
-client.create_collection(collection_name = "690",
-                        vectors_config = models.VectorParams(size=384, distance=models.Distance.DOT))
-client.create_collection(collection_name = "internship2024",
-                        vectors_config = models.VectorParams(size=384, distance=models.Distance.DOT))
-client.create_collection(collection_name = "default",
-                        vectors_config = models.VectorParams(size=384, distance=models.Distance.DOT))
-client.create_collection(collection_name = "893",
-                        vectors_config = models.VectorParams(size=384, distance=models.Distance.DOT))
+# search_db reads the alias, reindex.py later builds new versions and moves it
+version = time.strftime("%Y%m%d%H%M%S")
+# internship2024 is the original test collection, tests/sample_test_docs still reads it
+for name in schema.COLLECTIONS + ["internship2024"]:
+    collection = schema.versioned_name(name, version)
+    schema.create_collection(client, collection)
+    schema.point_aliases(client, {name: collection})
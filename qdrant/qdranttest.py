@@ -1,6 +1,6 @@
 import os
 from  qdrant_client import QdrantClient, models
-from fastembed import TextEmbedding
+import embedding
 
 
 docs = ["The internship class requires 80 on field hours", "On field hours may be remote or in person"]
@@ -11,10 +11,10 @@ store_path = os.path.join(exec_path, "qdrant_data" )
  #   os.mkdir(store_path)
 
 client = QdrantClient( host='localhost' )
-embed_model = TextEmbedding()
+embed_model = embedding.make_model()
 
 embeds = embed_model.embed(docs)
-embeds = models.Batch( ids=[1,2], vectors = list(embeds), payloads = [{"1" : docs[0]}, {"2" : docs[1]}] )
+embeds = models.Batch( ids=[1,2], vectors = list(embeds), payloads = [{"text" : docs[0]}, {"text" : docs[1]}] )
 
 #client.create_collection(collection_name = "test_collection2",
 #vectors_config = models.VectorParams(size=384, distance=models.Distance.DOT) )
@@ -0,0 +1,159 @@
+""" Rebuilds aliased collections without a partial-index window
+
+Each collection in corpus.txt is built into a new <alias>__<version> collection,
+waited on until qdrant has finished optimizing it, and smoke-queried. Only when
+every build passes are all aliases switched in one atomic update, so search_db
+sees either the old corpus or the new one, never a mix. Old versions beyond
+--keep are then deleted. Course builds leave out chunks default already holds,
+so rebuilding default rebuilds every course along with it.
+
+    python reindex.py
+    python reindex.py 690 893 --keep 2
+"""
+import time
+import argparse
+import configparser
+from  qdrant_client import QdrantClient, models
+import schema
+import load_pdf
+import qdrantsearch
+import embedding
+
+CORPUS_FILE = load_pdf.path_from_name("corpus.txt")
+# old versions kept around for a quick rollback
+KEEP = 1
+READY_TIMEOUT = 300
+
+
+def read_corpus(path=CORPUS_FILE):
+    """ Returns {alias: {"pdfs": [...], "smoke_query": str}} """
+    corpus = configparser.ConfigParser()
+    corpus.read(path)
+    return {alias: {"pdfs": corpus.get(alias, "pdfs").split(),
+                    "smoke_query": corpus.get(alias, "smoke_query", fallback="internship")}
+            for alias in corpus.sections()}
+
+
+def wait_ready(client, collection, timeout=READY_TIMEOUT):
+    """ Waits until qdrant has finished indexing a collection, so the switch causes no slow searches """
+    deadline = time.time() + timeout
+    while client.get_collection(collection).status != models.CollectionStatus.GREEN:
+        if time.time() > deadline:
+            raise RuntimeError(f"{collection} not ready after {timeout}s")
+        time.sleep(1)
+
+
+def smoke_check(client, embed_model, collection, query):
+    """ Raises if the new build has no points or can't answer a basic search """
+    if client.count(collection, exact=True).count == 0:
+        raise RuntimeError(f"{collection} is empty")
+    results = qdrantsearch.search_db(client, query, embed_model, collection)
+    if not results or not schema.payload_text(results[0].payload).strip():
+        raise RuntimeError(f"{collection} returned no usable results for {query!r}")
+
+
+def build_version(client, embed_model, alias, pdfs, version, dedup_against, parallel=None, deferred=None):
+    """ Loads the pdfs of one alias into a new versioned collection, returns its name.
+    A failed build is deleted again. Duplicate refs for other collections go to deferred, see load_pdf.dedup_chunks """
+    collection = schema.versioned_name(alias, version)
+    if client.collection_exists(collection):
+        raise RuntimeError(f"{collection} already exists, is another reindex running?")
+    schema.create_collection(client, collection)
+    try:
+        for pdf in pdfs:
+            load_pdf.load_pdf(client, embed_model, load_pdf.path_from_name(pdf), collection,
+                              load_pdf.course_from_collection(alias), version, dedup_against=dedup_against,
+                              parallel=parallel, deferred=deferred, alias=alias)
+        wait_ready(client, collection)
+    except Exception:
+        client.delete_collection(collection)
+        raise
+    return collection
+
+
+def apply_refs(client, deferred):
+    """ Writes the duplicate refs build_version deferred """
+    for (name, point_id), refs in deferred.items():
+        client.set_payload(collection_name = name, payload = {schema.DUPLICATES: refs}, points = [point_id])
+
+
+def versions(client, alias):
+    """ Versioned collections of an alias, oldest first; only timestamped builds count, not scratch collections """
+    prefix = schema.versioned_name(alias, "")
+    return sorted(description.name for description in client.get_collections().collections
+                  if description.name.startswith(prefix) and description.name[len(prefix):].isdigit())
+
+
+def garbage_collect(client, alias, keep=KEEP):
+    """ Deletes all but the newest keep versions that the alias no longer points at """
+    live = schema.alias_target(client, alias)
+    old = [name for name in versions(client, alias) if name != live]
+    stale = old[:len(old) - keep] if keep else old
+    for name in stale:
+        client.delete_collection(name)
+    return stale
+
+
+def reindex(client, embed_model, corpus, aliases, keep=KEEP, parallel=None):
+    """ Builds, checks and switches the given aliases, returns {alias: new collection} """
+    version = time.strftime("%Y%m%d%H%M%S")
+    if "default" in aliases:
+        # the courses were deduped against the old default, chunks it no longer has would vanish from their answers
+        aliases = list(dict.fromkeys(list(aliases) + list(corpus)))
+    # default goes first so the course collections dedup against its new build
+    aliases = sorted(aliases, key=lambda alias: alias != "default")
+    built = {}
+    # refs to chunks of other collections, live ones included, are only written once the new builds are in use
+    deferred = {}
+    try:
+        for alias in aliases:
+            dedup_against = [] if alias == "default" else [built.get("default", "default")]
+            built[alias] = build_version(client, embed_model, alias, corpus[alias]["pdfs"], version, dedup_against,
+                                          parallel, deferred)
+            smoke_check(client, embed_model, built[alias], corpus[alias]["smoke_query"])
+    except Exception:
+        for collection in built.values():
+            client.delete_collection(collection)
+        raise
+
+    for alias in aliases:
+        if schema.alias_target(client, alias) is None and client.collection_exists(alias):
+            # pre-alias install: the plain collection has to go before the alias can take its name
+            print(f"replacing unversioned collection {alias} with an alias")
+            client.delete_collection(alias)
+    schema.point_aliases(client, built)
+    apply_refs(client, deferred)
+
+    for alias in aliases:
+        removed = garbage_collect(client, alias, keep)
+        if removed:
+            print(f"{alias}: deleted old versions {', '.join(removed)}")
+    return built
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("aliases", nargs = "*", help = "collections to rebuild, defaults to all in corpus.txt; default takes the courses along")
+    parser.add_argument("--keep", type = int, default = KEEP, help = "old versions to keep for rollback")
+    parser.add_argument("--host", default = "localhost", help = "qdrant server host")
+    parser.add_argument("--model-dir", default = "", help = "local embedding model folder, defaults to $EMBED_MODEL_DIR")
+    parser.add_argument("--int8", action = "store_true", help = "embed with the int8 copy of the model (embedding.py quantize)")
+    parser.add_argument("--threads", type = int, default = None, help = "onnxruntime threads, defaults to every core")
+    parser.add_argument("--parallel", type = int, default = None,
+                        help = "embed in this many processes, 0 for one per core; large pdfs only")
+    args = parser.parse_args()
+
+    corpus = read_corpus()
+    aliases = args.aliases or list(corpus)
+    unknown = [alias for alias in aliases if alias not in corpus]
+    if unknown:
+        parser.error(f"not in corpus.txt: {', '.join(unknown)}")
+
+    client = QdrantClient(host = args.host)
+    start = time.perf_counter()
+    embed_model = embedding.make_model(args.model_dir, int8 = args.int8, threads = args.threads)
+    built = reindex(client, embed_model, corpus, aliases, args.keep, args.parallel)
+    for alias, collection in built.items():
+        print(f"{alias} -> {collection}")
+    print(f"reindexed in {time.perf_counter() - start:.1f}s")
+    client.close()
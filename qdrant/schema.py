@@ -0,0 +1,112 @@
+""" Fixed payload schema for chunks stored in qdrant, and the payload indexes that back it """
+from  qdrant_client import models
+
+# collections the chatbot searches, each one is an alias pointing at a versioned collection
+COLLECTIONS = ["default", "690", "893"]
+VECTOR_SIZE = 384
+DISTANCE = models.Distance.DOT
+# versioned collections are named <alias>__<version>
+VERSION_SEPARATOR = "__"
+
+# payload keys, every point in every collection carries all of these
+TEXT = "text"
+SOURCE = "source"
+PAGE = "page"
+COURSE = "course"
+SECTION = "section"
+CHAR_START = "char_start"
+CHAR_END = "char_end"
+TOKEN_COUNT = "token_count"
+CORPUS_VERSION = "corpus_version"
+# other places the same chunk text was found, filled in by the dedup pass
+DUPLICATES = "duplicates"
+# embedding model and variant the vector was made with, e.g. BAAI/bge-small-en-v1.5:int8, set by load_pdf;
+# points loaded before it was recorded lack it and were made with the original model
+EMBEDDING = "embedding"
+
+# fields that get a qdrant payload index so searches can filter on them server side
+PAYLOAD_INDEXES = {
+    SOURCE: models.PayloadSchemaType.KEYWORD,
+    COURSE: models.PayloadSchemaType.KEYWORD,
+    SECTION: models.PayloadSchemaType.KEYWORD,
+    CORPUS_VERSION: models.PayloadSchemaType.KEYWORD,
+    PAGE: models.PayloadSchemaType.INTEGER,
+    TOKEN_COUNT: models.PayloadSchemaType.INTEGER,
+}
+
+
+def estimate_tokens(text):
+    """ Rough LLM token count, ~4 characters per token for english text """
+    return (len(text) + 3) // 4
+
+
+def make_payload(text, source, page, course, section, char_start, char_end, corpus_version):
+    """ Builds the payload dict for one chunk """
+    return {
+        TEXT: text,
+        SOURCE: source,
+        PAGE: page,
+        COURSE: str(course),
+        SECTION: section,
+        CHAR_START: char_start,
+        CHAR_END: char_end,
+        TOKEN_COUNT: estimate_tokens(text),
+        CORPUS_VERSION: corpus_version,
+        DUPLICATES: [],
+    }
+
+
+def duplicate_ref(payload, collection):
+    """ Short reference to a chunk, stored on the canonical copy when this one is dropped """
+    return {SOURCE: payload[SOURCE], PAGE: payload[PAGE], "collection": collection}
+
+
+def payload_text(payload):
+    """ Returns the chunk text of a payload, also handles old {index: text} payloads """
+    if TEXT in payload:
+        return payload[TEXT]
+    return " ".join(str(value) for value in payload.values())
+
+
+def create_payload_indexes(client, collection_name):
+    """ Creates the keyword/integer payload indexes for a collection """
+    for field_name, field_schema in PAYLOAD_INDEXES.items():
+        client.create_payload_index(collection_name = collection_name,
+                                    field_name = field_name,
+                                    field_schema = field_schema)
+
+
+def create_collection(client, collection_name):
+    """ Creates a collection with the chatbot's vector params and payload indexes """
+    client.create_collection(collection_name = collection_name,
+                             vectors_config = models.VectorParams(size=VECTOR_SIZE, distance=DISTANCE))
+    create_payload_indexes(client, collection_name)
+
+
+def versioned_name(alias, version):
+    """ Name of one build of an aliased collection """
+    return f"{alias}{VERSION_SEPARATOR}{version}"
+
+
+def alias_target(client, alias):
+    """ Collection an alias currently points at, None if there is no such alias """
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+
+def collection_exists(client, name):
+    """ True for a collection or an alias """
+    return alias_target(client, name) is not None or client.collection_exists(name)
+
+
+def point_aliases(client, targets):
+    """ Points every alias in targets {alias: collection} at its collection in one atomic update """
+    operations = []
+    for alias, collection_name in targets.items():
+        if alias_target(client, alias) is not None:
+            operations.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+        operations.append(models.CreateAliasOperation(
+            create_alias=models.CreateAlias(collection_name=collection_name, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations = operations)
@@ -0,0 +1,145 @@
+""" Snapshot all configured collections to a local folder and restore them elsewhere
+
+A snapshot folder always holds portable artifacts (see artifacts.py), which any
+qdrant can load. When taken from a qdrant server it also holds native .snapshot
+files, which a server restores faster since they include the built index.
+Restores go into a new versioned collection and then switch the alias, like
+reindex.py. Embedded qdrant (--path) has no native snapshots and always uses
+the artifacts.
+
+    python snapshots.py snapshot ../snapshots
+    python snapshots.py restore ../snapshots --host newvm
+    python snapshots.py restore ../snapshots --path ./qdrant_local --compare-ingest
+"""
+import os
+import json
+import time
+import argparse
+import httpx
+from  qdrant_client import QdrantClient, models
+import schema
+import artifacts
+
+PORT = 6333
+MANIFEST = "snapshots.json"
+
+
+def base_url(host):
+    return f"http://{host}:{PORT}"
+
+
+def download_snapshot(client, host, collection, path):
+    """ Takes a native snapshot on the server and streams it into path """
+    description = client.create_snapshot(collection)
+    url = f"{base_url(host)}/collections/{collection}/snapshots/{description.name}"
+    try:
+        with httpx.stream("GET", url, timeout=None) as response, open(path, "wb") as file:
+            response.raise_for_status()
+            for block in response.iter_bytes():
+                file.write(block)
+    finally:
+        client.delete_snapshot(collection, description.name)
+
+
+def upload_snapshot(host, collection, path):
+    """ Restores a native snapshot file into a (new) collection on the server """
+    url = f"{base_url(host)}/collections/{collection}/snapshots/upload?priority=snapshot"
+    with open(path, "rb") as file:
+        response = httpx.post(url, files={"snapshot": (os.path.basename(path), file)}, timeout=None)
+    response.raise_for_status()
+
+
+def take_snapshot(client, host, out_dir, aliases, server):
+    """ Writes artifacts and, for a server, native snapshots of every alias, returns the manifest """
+    os.makedirs(out_dir, exist_ok=True)
+    aliases = [alias for alias in aliases if schema.collection_exists(client, alias)]
+    artifacts.export_artifacts(client, aliases, os.path.join(out_dir, "artifacts"))
+    manifest = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "collections": {}}
+    for alias in aliases:
+        entry = {"collection": schema.alias_target(client, alias) or alias}
+        if server:
+            entry["snapshot"] = f"{alias}.snapshot"
+            download_snapshot(client, host, entry["collection"], os.path.join(out_dir, entry["snapshot"]))
+        manifest["collections"][alias] = entry
+    with open(os.path.join(out_dir, MANIFEST), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
+
+
+def restore_snapshot(client, host, snap_dir, server):
+    """ Restores every alias of a snapshot folder into new versions and switches the aliases """
+    with open(os.path.join(snap_dir, MANIFEST), encoding="utf-8") as file:
+        manifest = json.load(file)
+    version = time.strftime("%Y%m%d%H%M%S")
+    built = {}
+    try:
+        for alias, entry in manifest["collections"].items():
+            collection = schema.versioned_name(alias, version)
+            # recorded first, so a partly restored collection is deleted too
+            built[alias] = collection
+            if server and "snapshot" in entry:
+                upload_snapshot(host, collection, os.path.join(snap_dir, entry["snapshot"]))
+            else:
+                art_dir = os.path.join(snap_dir, "artifacts")
+                art_manifest = artifacts.read_manifest(art_dir)
+                client.create_collection(collection_name = collection, vectors_config = models.VectorParams(
+                    size=art_manifest["dim"], distance=models.Distance(art_manifest["distance"])))
+                schema.create_payload_indexes(client, collection)
+                artifacts.upsert_vectors(client, art_dir, art_manifest["collections"][alias], collection)
+    except Exception:
+        for collection in built.values():
+            if client.collection_exists(collection):
+                client.delete_collection(collection)
+        raise
+
+    for alias in built:
+        if schema.alias_target(client, alias) is None and client.collection_exists(alias):
+            client.delete_collection(alias)
+    schema.point_aliases(client, built)
+    return built
+
+
+def time_full_ingest(client, aliases):
+    """ Seconds a full re-embed of the same aliases takes, built into scratch collections """
+    import reindex
+    import embedding
+    corpus = reindex.read_corpus()
+    start = time.perf_counter()
+    embed_model = embedding.make_model()
+    for alias in aliases:
+        if alias not in corpus:
+            continue
+        # not a timestamp, so reindex.versions() never takes it for a build
+        scratch = schema.versioned_name(alias, "ingest_timing")
+        try:
+            reindex.build_version(client, embed_model, alias, corpus[alias]["pdfs"], "ingest_timing", [])
+        finally:
+            if client.collection_exists(scratch):
+                client.delete_collection(scratch)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices = ["snapshot", "restore"])
+    parser.add_argument("dir", help = "snapshot folder")
+    parser.add_argument("--host", default = "localhost", help = "qdrant server host")
+    parser.add_argument("--path", default = None, help = "use an embedded qdrant stored in this folder instead of a server")
+    parser.add_argument("--compare-ingest", action = "store_true",
+                        help = "also time a full re-ingest of the same collections for comparison")
+    args = parser.parse_args()
+
+    server = args.path is None
+    client = QdrantClient(host = args.host) if server else QdrantClient(path = args.path)
+    start = time.perf_counter()
+    if args.command == "snapshot":
+        manifest = take_snapshot(client, args.host, args.dir, schema.COLLECTIONS, server)
+        aliases = list(manifest["collections"])
+        print(f"snapshot of {', '.join(aliases)} written in {time.perf_counter() - start:.2f}s")
+    else:
+        built = restore_snapshot(client, args.host, args.dir, server)
+        aliases = list(built)
+        print(f"restored {', '.join(aliases)} in {time.perf_counter() - start:.2f}s")
+    if args.compare_ingest:
+        print(f"full re-ingest of the same collections: {time_full_ingest(client, aliases):.2f}s")
+    client.close()
@@ -0,0 +1,230 @@
+""" Background log writer, keeps disk I/O off the request thread
+
+write() only puts the row on a queue. A writer thread collects rows into
+batches, appends each batch with a single write under an exclusive file lock
+(so workers sharing a file never interleave partial rows), fsyncs it, and
+rotates the file by size or by period. Rotated files are gzip compressed, or
+for jsonl logs optionally converted to parquet (needs pyarrow).
+
+Rows are lists written as csv, or records (see make_record) written as jsonl.
+"""
+import io
+import os
+import csv
+import gzip
+import json
+import time
+import queue
+import shutil
+import atexit
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import fcntl
+except ImportError:
+    # windows, no cross-process lock, fine for a single dev server
+    fcntl = None
+
+PERIODS = {"hourly": "%Y%m%d%H", "daily": "%Y%m%d", "": None}
+FORMATS = ["csv", "jsonl"]
+ARCHIVES = ["gzip", "parquet"]
+STAGES = ["classify", "embed", "search", "llm", "total"]
+
+
+@contextmanager
+def timed(timings, stage):
+    """ Records the seconds spent in the block as timings[stage] """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+def make_record(question, course, chunks, timings, answer=None, cache_hit=False, saved_tokens=0):
+    """ One request log record: ids and scores of the retrieved chunks instead of their text,
+    and the model and token usage instead of the whole completion """
+    usage = getattr(answer, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    record = {
+        "ts": datetime.now().isoformat(timespec="milliseconds"),
+        "question": question,
+        "course": str(course) if course else None,
+        "cache_hit": cache_hit,
+        "chunks": [{"id": str(point.id), "score": round(point.score, 4)} for result in chunks for point in result],
+        "model": getattr(answer, "model", None),
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+        "cached_tokens": getattr(details, "cached_tokens", None),
+        "saved_tokens": saved_tokens,
+    }
+    for stage in STAGES:
+        record[f"{stage}_s"] = round(timings[stage], 4) if stage in timings else None
+    return record
+
+
+def arrow_schema():
+    import pyarrow as pa
+    fields = [("ts", pa.string()), ("question", pa.string()), ("course", pa.string()), ("cache_hit", pa.bool_()),
+              ("chunks", pa.list_(pa.struct([("id", pa.string()), ("score", pa.float32())]))),
+              ("model", pa.string()), ("prompt_tokens", pa.int32()), ("completion_tokens", pa.int32()),
+              ("cached_tokens", pa.int32()), ("saved_tokens", pa.int32())]
+    fields += [(f"{stage}_s", pa.float32()) for stage in STAGES]
+    return pa.schema(fields)
+
+
+def iter_jsonl(path):
+    """ Streams the records of a jsonl log, plain or gzipped """
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_jsonl(path):
+    return list(iter_jsonl(path))
+
+
+def write_parquet(records, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    pq.write_table(pa.Table.from_pylist(records, schema=arrow_schema()), path, compression="zstd")
+
+
+def archive_parquet(path):
+    """ Replaces a rotated jsonl file by a parquet file, falls back to gzip without pyarrow """
+    try:
+        write_parquet(read_jsonl(path), path + ".parquet")
+    except ImportError:
+        print("pyarrow is not installed, archiving the log with gzip instead")
+        archive_gzip(path)
+        return
+    os.remove(path)
+
+
+def archive_gzip(path):
+    with open(path, "rb") as source, gzip.open(path + ".gz", "wb") as target:
+        shutil.copyfileobj(source, target)
+    os.remove(path)
+
+
+class LogWriter:
+    def __init__(self, path, max_bytes=50 * 1024 * 1024, rotate="daily", batch_size=200,
+                 flush_seconds=1.0, queue_size=10000, fmt="csv", archive="gzip"):
+        if fmt not in FORMATS or archive not in ARCHIVES:
+            raise ValueError(f"unknown log format {fmt} or archive {archive}")
+        if archive == "parquet" and fmt != "jsonl":
+            raise ValueError("only jsonl logs can be archived as parquet")
+        self.path = path
+        self.fmt = fmt
+        self.archive = archive_parquet if archive == "parquet" else archive_gzip
+        self.max_bytes = max_bytes
+        self.period_format = PERIODS[rotate]
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.thread = threading.Thread(target=self._run, name=f"log-{os.path.basename(path)}", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def write(self, row):
+        """ Queues a row or record, never blocks; it is dropped and counted if the writer falls far behind """
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """ Flushes what is queued and stops the writer thread """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_seconds
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    row = self.queue.get(timeout=max(deadline - time.monotonic(), 0.001))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                batch.append(row)
+            if batch:
+                try:
+                    self._append(batch)
+                except OSError as error:
+                    print(f"log write to {self.path} failed: {error}")
+            if stop:
+                return
+
+    def _encode(self, batch):
+        if self.fmt == "jsonl":
+            return "".join(json.dumps(record, separators=(",", ":"), default=str) + "\n" for record in batch)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows(batch)
+        return buffer.getvalue()
+
+    def _append(self, batch):
+        data = self._encode(batch).encode("utf-8")
+
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._rotate_if_needed()
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, data)
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            finally:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _period_file(self):
+        return self.path + ".period"
+
+    def _rotate_if_needed(self):
+        """ Called with the lock held """
+        period = time.strftime(self.period_format) if self.period_format else None
+        stored_period = None
+        if period and os.path.exists(self._period_file()):
+            with open(self._period_file()) as file:
+                stored_period = file.read().strip()
+
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        too_big = self.max_bytes and size >= self.max_bytes
+        new_period = period and stored_period and stored_period != period
+        if size and (too_big or new_period):
+            stamp = f"{self.path}.{time.strftime('%Y%m%d-%H%M%S')}"
+            rotated, n = stamp, 0
+            while os.path.exists(rotated + ".gz") or os.path.exists(rotated + ".parquet"):
+                n += 1
+                rotated = f"{stamp}-{n}"
+            os.replace(self.path, rotated)
+            self.archive(rotated)
+
+        if period and stored_period != period:
+            with open(self._period_file(), "w") as file:
+                file.write(period)
+
+
+def make_writer(config, file_name, fmt="csv", archive=None):
+    """ Builds a writer for a file in data_dir using the log_* settings,
+    log_archive only applies to jsonl request logs unless archive is given """
+    return LogWriter(config.get("settings", "data_dir") + file_name,
+                     max_bytes = config.getint("settings", "log_max_bytes", fallback=50 * 1024 * 1024),
+                     rotate = config.get("settings", "log_rotate", fallback="daily"),
+                     flush_seconds = config.getfloat("settings", "log_flush_seconds", fallback=1.0),
+                     fmt = fmt,
+                     archive = archive or (config.get("settings", "log_archive", fallback="gzip") if fmt == "jsonl" else "gzip"))
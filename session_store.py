@@ -0,0 +1,70 @@
+""" Server-side conversation store
+
+The flask session cookie only carries an opaque session id, the conversation
+itself (history and detected course) is kept in the shared state backend as zlib
+compressed compact json, and expires after session_ttl seconds idle.
+
+The rolling summary history.py writes (summary, summarized) is kept under its own
+key and merged in by get(). The summariser then never writes the conversation, so
+a turn the request path stores while the summary is being made can't be lost, and
+put() never writes the summary back. It is rewritten as older turns leave the
+window, which keeps it alive as long as the conversation is in use.
+"""
+import json
+import zlib
+import secrets
+
+SUMMARY_FIELDS = ("summary", "summarized")
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+def new_conversation():
+    """ History holds only user/assistant turns, the system prompt is added when the model is called """
+    return {"history": [], "course": ""}
+
+
+def encode(conversation):
+    return zlib.compress(json.dumps(conversation, separators=(",", ":")).encode("utf-8"))
+
+
+def decode(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class SessionStore:
+    def __init__(self, backend, ttl=3600):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, session_id):
+        blob = self.backend.get(f"session:{session_id}")
+        if blob is None:
+            return None
+        conversation = decode(blob)
+        summary = self.backend.get(f"summary:{session_id}")
+        if summary is not None:
+            conversation.update(decode(summary))
+        return conversation
+
+    def put(self, session_id, conversation):
+        conversation = {key: value for key, value in conversation.items() if key not in SUMMARY_FIELDS}
+        self.backend.set(f"session:{session_id}", encode(conversation), self.ttl)
+
+    def put_summary(self, session_id, summary, summarized):
+        self.backend.set(f"summary:{session_id}", encode({"summary": summary, "summarized": summarized}), self.ttl)
+
+    def reset(self, session_id):
+        """ Starts the session over with an empty conversation """
+        self.backend.delete(f"summary:{session_id}")
+        self.put(session_id, new_conversation())
+
+    def delete(self, session_id):
+        self.backend.delete(f"session:{session_id}")
+        self.backend.delete(f"summary:{session_id}")
+
+
+def make_store(config, backend):
+    return SessionStore(backend, config.getint("settings", "session_ttl", fallback=3600))
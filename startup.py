@@ -0,0 +1,71 @@
+""" Startup phases, warm-up and the startup timing report
+
+main() runs each step of starting the bot inside a timer phase. Before the
+server accepts requests the warm-up runs a dummy embed (builds the onnx session),
+a search on every collection (opens the qdrant connection, loads the segments)
+and lists the OpenAI models (TLS handshake, the connection then stays in the
+client's pool), so the first real question doesn't pay for any of it.
+The report prints every phase and warns when imports went over budget.
+"""
+import time
+from contextlib import contextmanager
+import metrics
+from qdrant import qdrantsearch, schema
+
+STARTUP = metrics.Gauge("chatbot_startup_seconds", "Seconds each startup phase took", ["phase"], multiprocess_mode="max")
+
+
+class StartupTimer:
+    def __init__(self, import_seconds=None):
+        self.phases = []
+        self.failures = []
+        if import_seconds is not None:
+            self.add("imports", import_seconds)
+
+    def add(self, name, seconds):
+        self.phases.append((name, seconds))
+        STARTUP.labels(name).set(seconds)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    @contextmanager
+    def optional_phase(self, name):
+        """ A phase whose failure is reported instead of stopping startup """
+        try:
+            with self.phase(name):
+                yield
+        except Exception as error:
+            self.failures.append((name, f"{type(error).__name__}: {error}"))
+
+    def total(self):
+        return sum(seconds for _, seconds in self.phases)
+
+    def report(self, import_budget=0):
+        lines = ["startup:"]
+        lines += [f"  {name:<24}{seconds:>8.2f}s" for name, seconds in self.phases]
+        lines.append(f"  {'total':<24}{self.total():>8.2f}s")
+        imports = dict(self.phases).get("imports")
+        if import_budget and imports and imports > import_budget:
+            lines.append(f"  imports took {imports:.2f}s, over the {import_budget:.2f}s budget; "
+                         "see python -X importtime chatbot_fat.py")
+        lines += [f"  {name} failed: {error}" for name, error in self.failures]
+        return "\n".join(lines)
+
+
+def warm_up(timer, embed_model, qdrant_client, open_client, collections):
+    """ Exercises the embedding model, every existing collection and the OpenAI connection once """
+    vector = None
+    with timer.optional_phase("warm-up embed"):
+        vector = qdrantsearch.embed_query("warm up", embed_model)
+    if vector is not None:
+        with timer.optional_phase("warm-up search"):
+            for collection in [name for name in collections if schema.collection_exists(qdrant_client, name)]:
+                qdrant_client.search(collection_name = collection, query_vector = vector, limit = 1)
+    with timer.optional_phase("warm-up openai"):
+        open_client.models.list()
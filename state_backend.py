@@ -0,0 +1,179 @@
+""" Shared key/value state for sessions, the answer cache and counters
+
+Three backends with the same small interface (get, set, delete, incr, all
+with optional ttl in seconds):
+    memory - in-process LRU, state is lost on restart and not shared
+    sqlite - one database file shared by every worker on a host
+    redis  - shared by every node, needs the redis package
+Values are bytes, counters are ints read back with count().
+"""
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class InProcessBackend:
+    def __init__(self, max_items=10000):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        item = self.items.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires < time.time():
+            del self.items[key]
+            return None
+        self.items.move_to_end(key)
+        return value
+
+    def _store(self, key, value, ttl):
+        self.items[key] = (time.time() + ttl if ttl else None, value)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            return self._live(key)
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def incr(self, key, amount=1, ttl=None):
+        """ Adds to a counter, the ttl only applies when the counter is created """
+        with self.lock:
+            value = self._live(key)
+            if value is None:
+                self._store(key, amount, ttl)
+                return amount
+            expires = self.items[key][0]
+            self.items[key] = (expires, value + amount)
+            return value + amount
+
+    def count(self, key):
+        return self.get(key) or 0
+
+    def evict_expired(self):
+        now = time.time()
+        with self.lock:
+            expired = [key for key, (expires, _) in self.items.items() if expires is not None and expires < now]
+            for key in expired:
+                del self.items[key]
+        return len(expired)
+
+
+class SQLiteBackend:
+    # sweep expired keys every this many writes
+    EVICT_EVERY = 500
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.writes = 0
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB, expires REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS state_expires ON state (expires)")
+
+    def _connect(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _wrote(self):
+        self.writes += 1
+        if self.writes % self.EVICT_EVERY == 0:
+            self.evict_expired()
+
+    def get(self, key):
+        row = self._connect().execute("SELECT value FROM state WHERE key = ? AND (expires IS NULL OR expires >= ?)",
+                                      (key, time.time())).fetchone()
+        return None if row is None else row[0]
+
+    def set(self, key, value, ttl=None):
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO state (key, value, expires) VALUES (?, ?, ?)",
+                         (key, value, time.time() + ttl if ttl else None))
+        self._wrote()
+
+    def delete(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def incr(self, key, amount=1, ttl=None):
+        """ Adds to a counter, the ttl only applies when the counter is created """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "INSERT INTO state (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = CASE WHEN expires IS NOT NULL AND expires < ? THEN excluded.value ELSE value + excluded.value END, "
+                "expires = CASE WHEN expires IS NOT NULL AND expires < ? THEN excluded.expires ELSE expires END "
+                "RETURNING value",
+                (key, amount, now + ttl if ttl else None, now, now)).fetchone()
+        self._wrote()
+        return row[0]
+
+    def count(self, key):
+        return self.get(key) or 0
+
+    def evict_expired(self):
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM state WHERE expires < ?", (time.time(),)).rowcount
+
+
+class RedisBackend:
+    def __init__(self, url=None, client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=ttl)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        """ Adds to a counter, the ttl only applies when the counter is created.
+        One MULTI transaction, so a counter never exists without its ttl (EXPIRE NX needs redis 7) """
+        with self.client.pipeline() as pipe:
+            pipe.incrby(key, amount)
+            if ttl:
+                pipe.expire(key, ttl, nx=True)
+            return pipe.execute()[0]
+
+    def count(self, key):
+        return int(self.client.get(key) or 0)
+
+    def evict_expired(self):
+        # redis expires keys itself
+        return 0
+
+
+def make_backend(config):
+    """ Builds the backend selected by state_backend in config.txt """
+    backend = config.get("settings", "state_backend", fallback="memory")
+    if backend == "memory":
+        return InProcessBackend(config.getint("settings", "state_max_items", fallback=10000))
+    if backend == "sqlite":
+        return SQLiteBackend(config.get("settings", "state_db", fallback="./chatbot_data/state.db"))
+    if backend == "redis":
+        return RedisBackend(config.get("settings", "redis_url", fallback="redis://localhost:6379/0"))
+    raise ValueError(f"unknown state_backend {backend}")
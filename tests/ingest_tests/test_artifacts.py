@@ -0,0 +1,43 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import artifacts
+import schema
+
+
+@pytest.fixture
+def populated_client():
+    client = QdrantClient(":memory:")
+    client.create_collection("690", vectors_config=models.VectorParams(size=384, distance=models.Distance.DOT))
+    vectors = np.random.RandomState(0).rand(5, 384).astype(np.float32)
+    payloads = [schema.make_payload(f"chunk {i}", "690_edited.pdf", 1, "690", "", 0, 7, "v1") for i in range(5)]
+    client.upsert("690", points=models.Batch(ids=list(range(5)), vectors=vectors.tolist(), payloads=payloads))
+    yield client
+    client.close()
+
+
+def test_round_trip_without_embedding_model(populated_client, tmp_path):
+    manifest = artifacts.export_artifacts(populated_client, ["690"], str(tmp_path))
+    assert manifest["dim"] == 384
+    assert manifest["collections"]["690"]["count"] == 5
+
+    fresh = QdrantClient(":memory:")
+    assert artifacts.load_artifacts(fresh, str(tmp_path), model_name=artifacts.DEFAULT_MODEL) == 5
+
+    original = populated_client.retrieve("690", [3], with_vectors=True)[0]
+    restored = fresh.retrieve("690", [3], with_vectors=True)[0]
+    assert np.allclose(original.vector, restored.vector)
+    assert original.payload == restored.payload
+
+
+def test_model_mismatch_is_rejected(populated_client, tmp_path):
+    artifacts.export_artifacts(populated_client, ["690"], str(tmp_path))
+
+    with pytest.raises(ValueError):
+        artifacts.load_artifacts(QdrantClient(":memory:"), str(tmp_path), model_name="some/other-model")
@@ -0,0 +1,29 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import dedup
+
+POLICY = ("Late submissions are very strict and only granted in exceptional documented cases "
+          "of illness accident or emergency, contact the instructor before the deadline")
+
+
+def test_near_duplicate_is_found():
+    index = dedup.MinHashIndex()
+    index.add("690", POLICY)
+    index.add("other", "Week 4 sprint planning and scrum meetings on Monday Wednesday and Friday")
+
+    assert index.query(POLICY.replace("very strict", "very  strict") + " .") == "690"
+
+
+def test_different_text_is_kept():
+    index = dedup.MinHashIndex()
+    index.add("690", POLICY)
+
+    assert index.query("Register your internship experience on Handshake under Career Center") is None
+
+
+def test_signatures_are_stable():
+    assert dedup.similarity(dedup.signature(POLICY), dedup.signature(POLICY)) == 1.0
+    assert len(dedup.signature(POLICY)) == dedup.NUM_PERM
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import embed_service
+import schema
+
+
+class FakeEmbed:
+    """ Vectors carry the text length and the size of the batch they were embedded in """
+    model_name = "fake-model"
+
+    def embed(self, texts, batch_size=None):
+        if "boom" in texts:
+            raise ValueError("cannot embed boom")
+        time.sleep(0.01)
+        for text in texts:
+            vector = np.zeros(schema.VECTOR_SIZE, dtype=np.float32)
+            vector[:2] = len(text), len(texts)
+            yield vector
+
+
+def serve(socket_path):
+    embed_service.EmbedServer(FakeEmbed(), socket_path, max_batch=32, wait_ms=20).serve_forever()
+
+
+@pytest.fixture
+def client(tmp_path):
+    socket_path = str(tmp_path / "embed.sock")
+    server = multiprocessing.get_context("fork").Process(target=serve, args=(socket_path,), daemon=True)
+    server.start()
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            client = embed_service.EmbeddingClient(socket_path)
+            client.model_name
+            break
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+    yield client
+    client.close()
+    # let the server free the connection's block before it is stopped
+    time.sleep(0.1)
+    server.terminate()
+    server.join()
+
+
+def test_concurrent_queries_share_a_batch(client):
+    vectors = {}
+
+    def ask(n):
+        vectors[n] = next(client.embed(["x" * n]))
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.model_name == "fake-model"
+    assert all(vectors[n][0] == n for n in vectors)
+    assert max(vector[1] for vector in vectors.values()) > 1
+
+
+def test_long_inputs_are_split_in_order(client):
+    texts = ["x" * n for n in range(1, embed_service.SLOTS * 2 + 3)]
+    vectors = list(client.embed(texts))
+    assert [vector[0] for vector in vectors] == [len(text) for text in texts]
+
+
+def test_embedding_errors_reach_the_worker(client):
+    with pytest.raises(RuntimeError, match="cannot embed boom"):
+        list(client.embed(["boom"]))
+    assert next(client.embed(["fine"]))[0] == 4
+
+
+def test_client_connects_on_first_use(tmp_path):
+    client = embed_service.EmbeddingClient(str(tmp_path / "not-started.sock"))
+    assert getattr(client.local, "connection", None) is None
+    with pytest.raises(OSError):
+        client.model_name
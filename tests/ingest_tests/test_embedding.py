@@ -0,0 +1,193 @@
+import os
+import sys
+import time
+import threading
+
+import fastembed
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import embedding
+import schema
+
+
+class FakeEmbed:
+    """ Stands in for TextEmbedding, remembers how it was built """
+    built = []
+
+    def __init__(self, model_name, size=schema.VECTOR_SIZE, **kwargs):
+        self.model_name = model_name
+        self.size = size
+        FakeEmbed.built.append(kwargs)
+
+    def embed(self, texts, **kwargs):
+        for _ in texts:
+            yield np.zeros(self.size, dtype=np.float32)
+
+
+@pytest.fixture
+def fake_embed(monkeypatch):
+    FakeEmbed.built = []
+    monkeypatch.setattr(fastembed, "TextEmbedding", FakeEmbed)
+    monkeypatch.delenv(embedding.MODEL_DIR_ENV, raising=False)
+    return FakeEmbed
+
+
+@pytest.fixture
+def model_dir(tmp_path):
+    (tmp_path / "models--qdrant--bge-small-en-v1.5-onnx-q").mkdir()
+    return str(tmp_path)
+
+
+def test_model_dir_is_read_without_network(fake_embed, model_dir):
+    embedding.make_model(model_dir)
+    assert fake_embed.built == [{"cache_dir": model_dir, "local_files_only": True}]
+
+
+def test_model_dir_falls_back_to_the_environment(fake_embed, model_dir, monkeypatch):
+    monkeypatch.setenv(embedding.MODEL_DIR_ENV, model_dir)
+    embedding.make_model("")
+    monkeypatch.delenv(embedding.MODEL_DIR_ENV)
+    embedding.make_model("")
+    assert fake_embed.built == [{"cache_dir": model_dir, "local_files_only": True}, {}]
+
+
+def test_empty_model_dir_fails_fast(fake_embed, tmp_path):
+    with pytest.raises(FileNotFoundError, match="embedding.py download"):
+        embedding.make_model(str(tmp_path))
+    assert fake_embed.built == []
+
+
+def test_dimension_mismatch_is_refused(fake_embed):
+    assert embedding.check_dimension(FakeEmbed(embedding.MODEL_NAME)) == schema.VECTOR_SIZE
+    with pytest.raises(ValueError, match="768"):
+        embedding.check_dimension(FakeEmbed("BAAI/bge-base-en-v1.5", size=768))
+
+
+def test_int8_reads_the_quantized_copy(fake_embed, model_dir):
+    with pytest.raises(FileNotFoundError):
+        embedding.make_model(model_dir, int8=True)
+    with pytest.raises(ValueError, match="quantize"):
+        embedding.make_model("", int8=True)
+
+    os.makedirs(os.path.join(model_dir, "int8", "models--qdrant--bge-small-en-v1.5-onnx-q"))
+    quantized = embedding.make_model(model_dir, int8=True, threads=2)
+    assert embedding.model_id(quantized) == embedding.MODEL_NAME + embedding.INT8_SUFFIX
+    assert fake_embed.built == [{"cache_dir": os.path.join(model_dir, "int8"), "local_files_only": True, "threads": 2}]
+
+
+def test_collections_are_checked_against_the_model_variant():
+    original, quantized = FakeEmbed(embedding.MODEL_NAME), FakeEmbed(embedding.MODEL_NAME)
+    quantized.model_id = embedding.MODEL_NAME + embedding.INT8_SUFFIX
+    client = QdrantClient(":memory:")
+    schema.create_collection(client, "690")
+    assert embedding.check_collection(client, "690", quantized) is None
+    # points loaded before the variant was recorded were made with the original model
+    payload = schema.make_payload("office hours", "690_edited.pdf", 1, "690", "", 0, 12, "v1")
+    client.upsert("690", points=[models.PointStruct(id=1, vector=[0.1] * schema.VECTOR_SIZE, payload=payload)])
+    assert embedding.check_collection(client, "690", original) == embedding.MODEL_NAME
+    with pytest.raises(ValueError, match="int8"):
+        embedding.check_collection(client, "690", quantized)
+    assert embedding.check_collection(client, "690", quantized, exclude_source="690_edited.pdf") is None
+
+
+def test_parse_cpus():
+    assert embedding.parse_cpus("") == []
+    assert embedding.parse_cpus("0-3, 6,2") == [0, 1, 2, 3, 6]
+    for spec in ["3-1", "a", "1-"]:
+        with pytest.raises(ValueError):
+            embedding.parse_cpus(spec)
+
+
+def test_quantize_writes_int8_weights(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    ort = pytest.importorskip("onnxruntime")
+    pytest.importorskip("onnxruntime.quantization")
+    from onnx import TensorProto, helper, numpy_helper
+
+    weights = np.random.RandomState(0).rand(64, 64).astype(np.float32) - 0.5
+    graph = helper.make_graph([helper.make_node("MatMul", ["x", "w"], ["y"])], "matmul",
+                              [helper.make_tensor_value_info("x", TensorProto.FLOAT, [None, 64])],
+                              [helper.make_tensor_value_info("y", TensorProto.FLOAT, [None, 64])],
+                              [numpy_helper.from_array(weights, "w")])
+    # laid out like the huggingface cache, the snapshot file links to a blob
+    snapshot = tmp_path / "models--qdrant--model" / "snapshots" / "abc"
+    snapshot.mkdir(parents=True)
+    (tmp_path / "models--qdrant--model" / "blobs").mkdir()
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)], ir_version=8)
+    onnx.save(model, str(tmp_path / "models--qdrant--model" / "blobs" / "1234"))
+    os.symlink("../../blobs/1234", snapshot / "model_optimized.onnx")
+
+    [path] = embedding.quantize(str(tmp_path))
+    assert path == str(tmp_path / "int8" / "models--qdrant--model" / "snapshots" / "abc" / "model_optimized.onnx")
+    assert not os.path.islink(path) and os.listdir(tmp_path / "int8" / "models--qdrant--model" / "blobs") == []
+    assert "MatMulInteger" in [node.op_type for node in onnx.load(path).graph.node]
+    assert [node.op_type for node in onnx.load(str(snapshot / "model_optimized.onnx")).graph.node] == ["MatMul"]
+
+    x = np.random.RandomState(1).rand(8, 64).astype(np.float32)
+    y = ort.InferenceSession(path, providers=["CPUExecutionProvider"]).run(None, {"x": x})[0]
+    assert np.allclose(y, x @ weights, atol=0.1)
+
+    # an absolute link points at the original model, which has to stay
+    os.remove(snapshot / "model_optimized.onnx")
+    os.symlink(tmp_path / "models--qdrant--model" / "blobs" / "1234", snapshot / "model_optimized.onnx")
+    [path] = embedding.quantize(str(tmp_path))
+    assert "MatMulInteger" in [node.op_type for node in onnx.load(path).graph.node]
+    assert [node.op_type for node in onnx.load(str(snapshot / "model_optimized.onnx")).graph.node] == ["MatMul"]
+
+
+class SlowEmbed:
+    """ Vectors hold the text length, every inference takes 20ms """
+    model_name = "slow"
+
+    def embed(self, texts, batch_size=None):
+        time.sleep(0.02)
+        if "boom" in texts:
+            raise ValueError("boom")
+        for text in texts:
+            yield np.full(4, len(text), dtype=np.float32)
+
+
+def test_batcher_fans_concurrent_calls_out_of_shared_batches():
+    batches = []
+    batcher = embedding.EmbeddingBatcher(SlowEmbed(), max_batch=32, wait_ms=50,
+                                         on_batch=lambda size, wait, run: batches.append(size))
+    results = {}
+
+    def ask(n):
+        results[n] = next(batcher.embed(["x" * n]))[0]
+
+    threads = [threading.Thread(target=ask, args=(n,)) for n in range(1, 9)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {n: n for n in range(1, 9)}
+    assert sum(batches) == 8 and max(batches) > 1
+    assert sum(batcher.stats()["sizes"].values()) == len(batches)
+
+
+def test_lone_caller_does_not_wait():
+    batcher = embedding.EmbeddingBatcher(SlowEmbed(), wait_ms=500)
+    start = time.perf_counter()
+    assert [vector[0] for vector in batcher.embed(["ab", "abc"])] == [2, 3]
+    assert time.perf_counter() - start < 0.4
+    assert batcher.stats()["sizes"] == {2: 1}
+
+
+def test_failing_callback_does_not_stop_the_batcher():
+    def on_batch(size, wait, run):
+        raise RuntimeError("metrics down")
+    batcher = embedding.EmbeddingBatcher(SlowEmbed(), on_batch=on_batch)
+    assert next(batcher.embed(["ab"]))[0] == 2
+    assert next(batcher.embed(["abc"]))[0] == 3
+
+
+def test_batcher_raises_model_errors_in_the_caller():
+    batcher = embedding.EmbeddingBatcher(SlowEmbed())
+    with pytest.raises(ValueError, match="boom"):
+        list(batcher.embed(["boom"]))
+    assert next(batcher.embed(["fine"]))[0] == 4
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import extract
+
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "..", "sample_test_docs", "sample_pdf.pdf")
+
+
+def test_cache_skips_second_extraction(tmp_path, monkeypatch):
+    calls = []
+
+    def fake_backend(pdf_path):
+        calls.append(pdf_path)
+        return ["page one", "page two"]
+
+    monkeypatch.setitem(extract.BACKENDS, "fake", fake_backend)
+
+    first = extract.extract_pages(SAMPLE_PDF, "fake", str(tmp_path))
+    second = extract.extract_pages(SAMPLE_PDF, "fake", str(tmp_path))
+
+    assert first == second == ["page one", "page two"]
+    assert len(calls) == 1
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_cache_is_keyed_by_file_contents(tmp_path):
+    copy = tmp_path / "renamed.pdf"
+    with open(SAMPLE_PDF, 'rb') as file:
+        copy.write_bytes(file.read())
+
+    assert extract.cache_path(SAMPLE_PDF, "pypdf2", "c") == extract.cache_path(str(copy), "pypdf2", "c")
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        extract.extract_pages(SAMPLE_PDF, "nope")
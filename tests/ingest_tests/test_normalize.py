@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import normalize
+
+
+def test_collapse_whitespace_keeps_line_breaks():
+    assert normalize.collapse_whitespace("Credits:   4 \n \n\nTerm:    Fall 2024 ") == "Credits: 4\nTerm: Fall 2024"
+
+
+def test_fix_hyphenation_across_line_break():
+    assert normalize.fix_hyphenation("the intern-\nship course") == "the internship course"
+    assert normalize.fix_hyphenation("M2-\nM3") == "M2-\nM3"
+
+
+def test_strips_repeated_headers_and_page_numbers():
+    topics = ["kickoff", "sprint planning", "retrospective", "final report"]
+    pages = [f" \n  Comp 690\nWeek {week} {topic}\n{topic} details\nbring your {topic} notes\nPage {week}\n"
+             for week, topic in enumerate(topics, 1)]
+    cleaned, stats = normalize.normalize_pages(pages)
+
+    text = "".join(cleaned)
+    assert "Comp 690" not in text
+    assert "Page" not in text
+    assert "Week 3 retrospective" in text
+    assert stats["chars_removed"] > 0
+    assert stats["tokens_removed"] > 0
+
+
+def test_single_page_keeps_its_header():
+    cleaned, _ = normalize.normalize_pages(["Comp 690\nsyllabus"])
+    assert cleaned == ["Comp 690\nsyllabus\n"]
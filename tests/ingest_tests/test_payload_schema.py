@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import schema
+from load_pdf import build_payloads, point_id, course_from_collection
+
+
+def test_payload_has_fixed_schema():
+    pages = ["COURSE SCHEDULE\nWeek 1 intro\n", "Week 2 kickoff\n"]
+    payloads = build_payloads(["Week 1 intro", "Week 2 kickoff"], pages, "690_edited.pdf", "690", "v1")
+
+    for payload in payloads:
+        assert set(payload) == {schema.TEXT, schema.SOURCE, schema.PAGE, schema.COURSE, schema.SECTION,
+                                schema.CHAR_START, schema.CHAR_END, schema.TOKEN_COUNT, schema.CORPUS_VERSION,
+                                schema.DUPLICATES}
+        assert payload[schema.SOURCE] == "690_edited.pdf"
+        assert payload[schema.CORPUS_VERSION] == "v1"
+
+    assert payloads[0][schema.PAGE] == 1
+    assert payloads[1][schema.PAGE] == 2
+    assert payloads[0][schema.SECTION] == "COURSE SCHEDULE"
+
+
+def test_char_span_points_back_into_document():
+    pages = ["alpha beta\ngamma delta\n", "epsilon\n"]
+    docs = "".join(pages)
+    payloads = build_payloads(["alpha beta", "gamma delta", "epsilon"], pages, "a.pdf", "", "v1")
+
+    for payload in payloads:
+        assert docs[payload[schema.CHAR_START]:payload[schema.CHAR_END]] == payload[schema.TEXT]
+
+
+def test_payload_text_reads_old_payloads():
+    assert schema.payload_text({"3": "old style chunk"}) == "old style chunk"
+    assert schema.payload_text({schema.TEXT: "new chunk", schema.PAGE: 1}) == "new chunk"
+
+
+def test_point_ids_differ_per_source():
+    assert point_id("690_edited.pdf", 0) != point_id("893_edited.pdf", 0)
+    assert point_id("690_edited.pdf", 0) == point_id("690_edited.pdf", 0)
+    assert course_from_collection("893") == "893"
+    assert course_from_collection("default") == ""
@@ -0,0 +1,96 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import load_pdf
+import reindex
+import schema
+
+
+class FakeEmbed:
+    """ Stands in for TextEmbedding, random unit vectors are enough for alias bookkeeping """
+    model_name = "BAAI/bge-small-en-v1.5"
+
+    def embed(self, texts, **kwargs):
+        rng = np.random.RandomState(len(texts))
+        for _ in texts:
+            yield rng.rand(schema.VECTOR_SIZE).astype(np.float32)
+
+
+@pytest.fixture
+def corpus():
+    return {"default": {"pdfs": ["chatbox.pdf"], "smoke_query": "handshake"},
+            "690": {"pdfs": ["690_edited.pdf"], "smoke_query": "office hours"}}
+
+
+def test_reindex_switches_aliases_and_collects_old_versions(corpus, monkeypatch):
+    client = QdrantClient(":memory:")
+    versions = iter(["20250101000000", "20250601000000", "20260101000000"])
+    monkeypatch.setattr(reindex.time, "strftime", lambda fmt: next(versions))
+
+    for _ in range(3):
+        built = reindex.reindex(client, FakeEmbed(), corpus, ["690"], keep=1)
+
+    assert schema.alias_target(client, "690") == built["690"] == "690__20260101000000"
+    assert reindex.versions(client, "690") == ["690__20250601000000", "690__20260101000000"]
+
+
+def test_reindexing_default_rebuilds_the_courses_deduped_against_it(corpus, monkeypatch):
+    client = QdrantClient(":memory:")
+    versions = iter(["20250101000000", "20250601000000"])
+    monkeypatch.setattr(reindex.time, "strftime", lambda fmt: next(versions))
+    reindex.reindex(client, FakeEmbed(), corpus, ["default", "690"])
+
+    built = reindex.reindex(client, FakeEmbed(), corpus, ["default"])
+    assert built == {"default": "default__20250601000000", "690": "690__20250601000000"}
+    assert schema.alias_target(client, "690") == "690__20250601000000"
+
+
+def test_failed_smoke_check_keeps_old_alias(corpus, monkeypatch):
+    client = QdrantClient(":memory:")
+    versions = iter(["20250101000000", "20250601000000"])
+    monkeypatch.setattr(reindex.time, "strftime", lambda fmt: next(versions))
+    live = reindex.reindex(client, FakeEmbed(), corpus, ["690"])["690"]
+
+    corpus["690"]["pdfs"] = []
+    with pytest.raises(RuntimeError):
+        reindex.reindex(client, FakeEmbed(), corpus, ["690"])
+
+    assert schema.alias_target(client, "690") == live
+    assert reindex.versions(client, "690") == [live]
+
+
+def test_failed_build_is_deleted(corpus, monkeypatch):
+    client = QdrantClient(":memory:")
+
+    def not_ready(client, collection):
+        raise RuntimeError(f"{collection} not ready")
+    monkeypatch.setattr(reindex, "wait_ready", not_ready)
+    with pytest.raises(RuntimeError, match="not ready"):
+        reindex.reindex(client, FakeEmbed(), corpus, ["690"])
+    assert reindex.versions(client, "690") == []
+
+
+def test_refs_to_live_collections_wait_for_the_switch():
+    client = QdrantClient(":memory:")
+    schema.create_collection(client, "default")
+    text = "Register your internship in Handshake before the first day of work, then email the instructor."
+    payload = schema.make_payload(text, "chatbox.pdf", 1, "", "", 0, len(text), "v1")
+    client.upsert("default", points=[models.PointStruct(id=1, vector=[0.1] * schema.VECTOR_SIZE, payload=payload)])
+    schema.create_collection(client, "690__v2")
+    payloads = [schema.make_payload(text, "690_edited.pdf", 3, "690", "", 0, len(text), "v2")]
+
+    deferred = {}
+    assert load_pdf.dedup_chunks(client, [text], payloads, "690__v2", "690_edited.pdf", ["default"], deferred,
+                                 alias="690") == []
+    assert client.retrieve("default", [1])[0].payload[schema.DUPLICATES] == []
+    # the ref names the alias, the build it was made in is garbage collected later
+    assert deferred == {("default", 1): [{schema.SOURCE: "690_edited.pdf", schema.PAGE: 3, "collection": "690"}]}
+
+    reindex.apply_refs(client, deferred)
+    assert client.retrieve("default", [1])[0].payload[schema.DUPLICATES] == deferred[("default", 1)]
@@ -0,0 +1,59 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "qdrant"))
+
+import reindex
+import schema
+import snapshots
+
+
+def test_embedded_snapshot_round_trip(tmp_path):
+    source = QdrantClient(path=str(tmp_path / "source"))
+    schema.create_collection(source, "690__1")
+    schema.point_aliases(source, {"690": "690__1"})
+    vectors = np.random.RandomState(1).rand(3, schema.VECTOR_SIZE).astype(np.float32)
+    payloads = [schema.make_payload(f"chunk {i}", "690_edited.pdf", 1, "690", "", 0, 7, "v1") for i in range(3)]
+    source.upsert("690", points=models.Batch(ids=[1, 2, 3], vectors=vectors.tolist(), payloads=payloads))
+
+    manifest = snapshots.take_snapshot(source, "localhost", str(tmp_path / "snap"), schema.COLLECTIONS, server=False)
+    source.close()
+    assert list(manifest["collections"]) == ["690"]
+
+    target = QdrantClient(path=str(tmp_path / "target"))
+    built = snapshots.restore_snapshot(target, "localhost", str(tmp_path / "snap"), server=False)
+
+    assert schema.alias_target(target, "690") == built["690"]
+    assert target.count("690").count == 3
+    assert target.retrieve("690", [2])[0].payload == payloads[1]
+    target.close()
+
+
+def test_failed_restore_leaves_nothing_behind(tmp_path, monkeypatch):
+    source = QdrantClient(path=str(tmp_path / "source"))
+    schema.create_collection(source, "690__1")
+    schema.point_aliases(source, {"690": "690__1"})
+    payloads = [schema.make_payload("chunk", "690_edited.pdf", 1, "690", "", 0, 5, "v1")]
+    source.upsert("690", points=models.Batch(ids=[1], vectors=[[0.1] * schema.VECTOR_SIZE], payloads=payloads))
+    snapshots.take_snapshot(source, "localhost", str(tmp_path / "snap"), schema.COLLECTIONS, server=False)
+    source.close()
+
+    def broken(*args):
+        raise OSError("truncated vectors file")
+    monkeypatch.setattr(snapshots.artifacts, "upsert_vectors", broken)
+    target = QdrantClient(path=str(tmp_path / "target"))
+    with pytest.raises(OSError):
+        snapshots.restore_snapshot(target, "localhost", str(tmp_path / "snap"), server=False)
+    assert target.get_collections().collections == []
+    target.close()
+
+
+def test_scratch_collections_are_not_versions():
+    client = QdrantClient(":memory:")
+    for name in ["690__20250101000000", schema.versioned_name("690", "ingest_timing")]:
+        schema.create_collection(client, name)
+    assert reindex.versions(client, "690") == ["690__20250101000000"]
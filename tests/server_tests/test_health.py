@@ -0,0 +1,79 @@
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import health
+from qdrant import schema
+
+
+class FakeEmbed:
+    model_name = "BAAI/bge-small-en-v1.5"
+
+    def embed(self, texts):
+        for _ in texts:
+            yield np.ones(schema.VECTOR_SIZE, dtype=np.float32)
+
+
+class FakeOpenAI:
+    def __init__(self):
+        self.calls = 0
+        self.failing = False
+        self.models = types.SimpleNamespace(list=self.list)
+
+    def with_options(self, **kwargs):
+        return self
+
+    def list(self):
+        self.calls += 1
+        if self.failing:
+            raise ConnectionError("unreachable")
+        return []
+
+
+@pytest.fixture
+def client():
+    client = QdrantClient(":memory:")
+    schema.create_collection(client, "default_v1")
+    schema.point_aliases(client, {"default": "default_v1"})
+    return client
+
+
+def test_ready_when_every_dependency_answers(client):
+    ready, body = health.Readiness(FakeEmbed(), client, FakeOpenAI(), ["default"]).report()
+    assert ready
+    assert body["checks"]["qdrant"]["collections"] == {"default": schema.VECTOR_SIZE}
+    assert body["checks"]["embedding_model"]["dimension"] == schema.VECTOR_SIZE
+    assert all("seconds" in check for check in body["checks"].values())
+
+
+def test_missing_or_wrong_size_collection_is_not_ready(client):
+    assert not health.Readiness(FakeEmbed(), client, FakeOpenAI(), ["default", "690"]).report()[0]
+    client.create_collection("893", vectors_config=models.VectorParams(size=768, distance=models.Distance.COSINE))
+    ready, body = health.Readiness(FakeEmbed(), client, FakeOpenAI(), ["893"]).report()
+    assert not ready and "768" in body["checks"]["qdrant"]["error"]
+
+
+def test_vectors_of_another_model_variant_are_not_ready(client):
+    payload = schema.make_payload("chunk", "chatbox.pdf", 1, "", "", 0, 5, "v1")
+    payload[schema.EMBEDDING] = "BAAI/bge-small-en-v1.5:int8"
+    client.upsert("default", points=[models.PointStruct(id=1, vector=[0.1] * schema.VECTOR_SIZE, payload=payload)])
+    ready, body = health.Readiness(FakeEmbed(), client, FakeOpenAI(), ["default"]).report()
+    assert not ready and ":int8" in body["checks"]["qdrant"]["error"]
+
+
+def test_openai_probe_is_cached(client):
+    open_client = FakeOpenAI()
+    readiness = health.Readiness(FakeEmbed(), client, open_client, ["default"], openai_probe_seconds=60)
+    readiness.report()
+    open_client.failing = True
+    assert readiness.report()[0] and open_client.calls == 1
+
+    readiness.openai_probe_seconds = 0
+    ready, body = readiness.report()
+    assert not ready and "unreachable" in body["checks"]["openai"]["error"] and open_client.calls == 2
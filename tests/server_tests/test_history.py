@@ -0,0 +1,107 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import history
+import session_store
+import state_backend
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = []
+
+    def create(self, model, messages, **kwargs):
+        self.calls.append(messages)
+        message = types.SimpleNamespace(content=f"summary of {len(messages)} messages")
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+
+def make_manager(max_turns=4, token_budget=1000):
+    completions = FakeCompletions()
+    client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=completions))
+    store = session_store.SessionStore(state_backend.InProcessBackend())
+    return history.HistoryManager(client, store, "gpt-4o-mini", max_turns, token_budget), store, completions
+
+
+def conversation_with(turns):
+    conversation = session_store.new_conversation()
+    for turn in range(turns):
+        conversation["history"].append({"role": "user", "content": f"question {turn} about internship hours"})
+        conversation["history"].append({"role": "assistant", "content": f"answer {turn} " + "detail " * 20})
+    return conversation
+
+
+def test_window_keeps_last_turns_and_reports_savings():
+    manager, _, _ = make_manager(max_turns=4)
+    conversation = conversation_with(5)
+
+    messages, stats = manager.window(conversation)
+
+    assert messages == conversation["history"][-4:]
+    assert stats["saved_tokens"] == stats["history_tokens"] - stats["sent_tokens"] > 0
+
+
+def test_window_respects_token_budget_but_keeps_newest_message():
+    manager, _, _ = make_manager(max_turns=10, token_budget=5)
+    conversation = conversation_with(3)
+
+    messages, _ = manager.window(conversation)
+
+    assert messages == conversation["history"][-1:]
+
+
+def test_older_turns_are_folded_into_summary():
+    manager, store, completions = make_manager(max_turns=4)
+    conversation = conversation_with(5)
+    store.put("sid", conversation)
+
+    manager.schedule_summary("sid", conversation)
+    manager.executor.shutdown(wait=True)
+
+    summarized = store.get("sid")
+    assert summarized["summarized"] == 6
+    assert summarized["summary"] == "summary of 7 messages"
+    messages, _ = manager.window(summarized)
+    assert messages[0]["content"].startswith("Summary of the earlier conversation")
+    assert len(completions.calls) == 1
+
+
+def test_turns_stored_while_summarizing_are_kept():
+    manager, store, completions = make_manager(max_turns=4)
+    conversation = conversation_with(5)
+    store.put("sid", conversation)
+    create = completions.create
+
+    def answered_meanwhile(model, messages, **kwargs):
+        # the request path stores the next turn while the summary call is running
+        latest = store.get("sid")
+        latest["history"] += [{"role": "user", "content": "one more question"},
+                              {"role": "assistant", "content": "one more answer"}]
+        store.put("sid", latest)
+        return create(model, messages, **kwargs)
+    completions.create = answered_meanwhile
+
+    manager.schedule_summary("sid", conversation)
+    manager.executor.shutdown(wait=True)
+
+    latest = store.get("sid")
+    assert len(latest["history"]) == 12 and latest["summarized"] == 6
+
+
+def test_summary_is_dropped_after_a_reset():
+    manager, store, completions = make_manager(max_turns=4)
+    conversation = conversation_with(5)
+    store.put("sid", conversation)
+    create = completions.create
+
+    def reset_meanwhile(model, messages, **kwargs):
+        store.reset("sid")
+        return create(model, messages, **kwargs)
+    completions.create = reset_meanwhile
+
+    manager.schedule_summary("sid", conversation)
+    manager.executor.shutdown(wait=True)
+    assert store.get("sid") == session_store.new_conversation()
@@ -0,0 +1,20 @@
+import os
+import runpy
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+gunicorn_config = pytest.importorskip("gunicorn.config")
+
+
+def test_gunicorn_settings_are_valid(monkeypatch):
+    monkeypatch.chdir(ROOT)
+    settings = runpy.run_path("gunicorn.conf.py")
+    config = gunicorn_config.Config()
+    # what gunicorn does with a config file: every name that is a setting must take its value
+    for name, value in settings.items():
+        if name in config.settings:
+            config.set(name, value)
+    assert config.preload_app and config.wsgi_app == "wsgi:app"
+    assert config.max_requests_jitter <= config.max_requests
+    assert callable(config.post_fork)
@@ -0,0 +1,69 @@
+import os
+import csv
+import sys
+import json
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import log_stats
+
+
+def test_latency_quantiles_are_close():
+    random.seed(1)
+    values = sorted(random.expovariate(1) for _ in range(20000))
+    histogram = log_stats.LatencyHistogram()
+    for value in values:
+        histogram.add(value)
+    for q in log_stats.QUANTILES:
+        exact = values[int(q * (len(values) - 1))]
+        assert histogram.quantile(q) == pytest.approx(exact, rel=0.02)
+
+
+def test_space_saving_keeps_heavy_hitters():
+    random.seed(2)
+    counter = log_stats.SpaceSaving(k=20)
+    stream = ["office hours"] * 500 + ["credits"] * 300 + [f"rare {i}" for i in range(2000)]
+    random.shuffle(stream)
+    for item in stream:
+        counter.add(item)
+    top = counter.top(2)
+    assert [item for item, _ in top] == ["office hours", "credits"]
+    assert top[0][1] >= 500
+
+
+def test_hyperloglog_estimate():
+    sketch = log_stats.HyperLogLog()
+    for i in range(50000):
+        sketch.add(f"question {i % 20000}")
+    assert sketch.count() == pytest.approx(20000, rel=0.05)
+
+
+def test_report_from_every_format(tmp_path):
+    records = [{"ts": "2025-01-06T09:15:00.000", "question": "How many credits?", "course": "690",
+                "cache_hit": i == 1, "total_s": 1.0 + i, "llm_s": 0.8} for i in range(3)]
+    jsonl = tmp_path / "log.jsonl"
+    jsonl.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+    old = tmp_path / "log.csv"
+    with open(old, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerow(["office hours?", "[]", "ChatCompletion(model='gpt-4o-mini')", "2.5", "none",
+                                   "2024-11-27 18:44:53.379347"])
+    rag = tmp_path / "raglog.csv"
+    with open(rag, "w", newline="", encoding="utf-8") as file:
+        csv.writer(file).writerows([["q", "Comp 690", "690"], ["q", "Comp 690", "690"], ["q", "not sure", ""]])
+
+    stats = log_stats.LogStats()
+    for path in (jsonl, old, rag):
+        log_stats.read_file(stats, str(path))
+    report = stats.report()
+
+    assert report["requests"] == 4
+    assert report["by_course"]["690"][3] == 3 and report["by_course"]["none"][3] == 1
+    assert set(report["by_hour"]) == {9, 18}
+    assert report["by_stage"]["llm"][0] == pytest.approx(0.8, rel=0.02)
+    assert report["top_questions"][0] == ("how many credits", 3)
+    assert report["cache_hit_rate"] == 0.25
+    assert report["repeat_rate"] == pytest.approx(0.5, abs=0.01)
+    assert report["labels"] == [("Comp 690", 2), ("not sure", 1)]
@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import memory_stats
+import metrics
+
+
+def test_memory_gauges_on_scrape():
+    text = metrics.render().decode()
+    rss = [line for line in text.splitlines() if line.startswith("chatbot_memory_rss_bytes ")]
+    assert rss and float(rss[0].split()[1]) > 10_000_000
+    assert 'chatbot_python_gc_collections{generation="0"}' in text
+
+
+def test_measure_records_growth():
+    with memory_stats.measure("test_component"):
+        blob = bytearray(50_000_000)
+    assert metrics.REGISTRY.get_sample_value("chatbot_component_rss_bytes", {"component": "test_component"}) > 40_000_000
+    del blob
+
+
+def test_snapshots_report_growth():
+    snapshots = memory_stats.Snapshots()
+    try:
+        assert "baseline taken" in snapshots.take()
+        leak = [str(i) * 10 for i in range(50_000)]
+        report = snapshots.take(top=5)
+        assert "test_memory_stats.py" in report.splitlines()[2]
+        assert len(report.splitlines()) <= 7
+    finally:
+        assert snapshots.stop() == "tracemalloc stopped\n"
+    assert leak
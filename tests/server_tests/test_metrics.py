@@ -0,0 +1,82 @@
+import os
+import sys
+import subprocess
+
+import pytest
+from prometheus_client import CollectorRegistry
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import metrics
+
+
+@pytest.fixture
+def registry():
+    return CollectorRegistry()
+
+
+def test_counter_and_gauge_render(registry):
+    requests = metrics.Counter("requests_total", "Requests", ["outcome"], registry=registry)
+    in_flight = metrics.Gauge("in_flight", "In flight", registry=registry)
+    requests.labels("answered").inc()
+    requests.labels("answered").inc(2)
+    requests.labels('say "hi"').inc()
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    text = metrics.render(registry).decode()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{outcome="answered"} 3.0' in text
+    assert 'requests_total{outcome="say \\"hi\\""} 1.0' in text
+    assert "in_flight 1.0" in text.splitlines()
+
+
+def test_track_times_and_counts_errors():
+    timings = {}
+    errors = metrics.REGISTRY.get_sample_value("chatbot_errors_total", {"stage": "test_stage"}) or 0
+    with pytest.raises(RuntimeError):
+        with metrics.track(timings, "test_stage"):
+            raise RuntimeError("search down")
+    assert metrics.REGISTRY.get_sample_value("chatbot_errors_total", {"stage": "test_stage"}) == errors + 1
+    assert timings["test_stage"] >= 0
+    assert 'chatbot_stage_seconds_count{stage="test_stage"}' in metrics.render().decode()
+
+
+def test_collectors_run_on_scrape(registry, monkeypatch):
+    monkeypatch.setattr(metrics, "COLLECTORS", [])
+    dropped = metrics.Gauge("dropped", "Dropped", registry=registry)
+    values = iter([4, 7])
+    metrics.add_collector(lambda: [(dropped, next(values))])
+    assert "dropped 4.0" in metrics.render(registry).decode().splitlines()
+    assert "dropped 7.0" in metrics.render(registry).decode().splitlines()
+
+
+WORKER = """
+import sys
+sys.path.insert(0, {root!r})
+import metrics
+metrics.REQUESTS.labels("answered").inc(int(sys.argv[1]))
+metrics.IN_FLIGHT.inc()
+metrics.STAGE_SECONDS.labels("llm").observe(0.5)
+if sys.argv[2] == "scrape":
+    sys.stdout.write(metrics.render().decode())
+"""
+
+
+def test_multiprocess_mode_sums_workers_and_keeps_exited_ones(tmp_path):
+    from prometheus_client import multiprocess
+    script = tmp_path / "worker.py"
+    script.write_text(WORKER.format(root=os.path.join(os.path.dirname(__file__), "..", "..")))
+    env = dict(os.environ, **{metrics.MULTIPROC_ENV: str(tmp_path)})
+    exited = subprocess.Popen([sys.executable, str(script), "3", "-"], env=env)
+    assert exited.wait() == 0
+    # the launcher does this when gunicorn replaces a worker
+    multiprocess.mark_process_dead(exited.pid, str(tmp_path))
+
+    lines = subprocess.run([sys.executable, str(script), "2", "scrape"], env=env, capture_output=True,
+                           text=True, check=True).stdout.splitlines()
+    assert 'chatbot_requests_total{outcome="answered"} 5.0' in lines
+    assert 'chatbot_stage_seconds_count{stage="llm"} 2.0' in lines
+    # only live workers are in flight
+    assert "chatbot_requests_in_flight 1.0" in lines
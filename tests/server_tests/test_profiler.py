@@ -0,0 +1,54 @@
+import os
+import sys
+import time
+
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import profiler
+
+
+def busy_embedding(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += sum(range(100))
+    return total
+
+
+def test_samples_the_profiled_thread(tmp_path):
+    with profiler.SamplingProfiler(interval=0.001) as profile:
+        busy_embedding(0.2)
+
+    assert profile.samples > 20
+    path = profile.dump(str(tmp_path))
+    lines = open(path, encoding="utf-8").read().splitlines()
+    stack, count = lines[0].rsplit(" ", 1)
+    assert "busy_embedding (test_profiler.py:" in stack.split(";")[-1]
+    assert sum(int(line.rsplit(" ", 1)[1]) for line in lines) == profile.samples
+
+
+def test_only_operator_requests_are_profiled(tmp_path, monkeypatch):
+    monkeypatch.setitem(profiler.settings, "token", "s3cret")
+    monkeypatch.setitem(profiler.settings, "interval", 0.001)
+    monkeypatch.setitem(profiler.settings, "out_dir", str(tmp_path))
+    app = Flask(__name__)
+
+    @app.route("/llm_response", methods=["POST"])
+    @profiler.on_demand
+    def handle_post():
+        busy_embedding(0.05)
+        return "answer"
+
+    client = app.test_client()
+    assert "X-Profile-File" not in client.post("/llm_response").headers
+    assert "X-Profile-File" not in client.post("/llm_response", headers={"X-Profile": "guess"}).headers
+    non_ascii = client.post("/llm_response", headers={"X-Profile": "s3cr\u00e9t"})
+    assert non_ascii.status_code == 200 and "X-Profile-File" not in non_ascii.headers
+    response = client.post("/llm_response", headers={"X-Profile": "s3cret"})
+    assert response.get_data(as_text=True) == "answer"
+    assert os.listdir(tmp_path) == [response.headers["X-Profile-File"]]
+
+    monkeypatch.setitem(profiler.settings, "token", "")
+    assert "X-Profile-File" not in client.post("/llm_response", headers={"X-Profile": ""}).headers
@@ -0,0 +1,147 @@
+import os
+import csv
+import sys
+import gzip
+import multiprocessing
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import convert_log
+import request_log
+
+
+def read_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+def test_rows_are_written_in_order(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = request_log.LogWriter(path, flush_seconds=0.05)
+    for i in range(500):
+        writer.write([f"question {i}", "chunk, with comma\nand newline", i])
+    writer.close()
+
+    rows = read_rows(path)
+    assert len(rows) == 500
+    assert rows[0] == ["question 0", "chunk, with comma\nand newline", "0"]
+    assert rows[-1][2] == "499"
+
+
+def test_rotates_by_size_and_compresses(tmp_path):
+    path = str(tmp_path / "log.csv")
+    writer = request_log.LogWriter(path, max_bytes=1000, rotate="", batch_size=10, flush_seconds=0.05)
+    for i in range(100):
+        writer.write([f"question number {i:03d}", "x" * 40])
+    writer.close()
+
+    rotated = [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+    assert rotated
+    rows = read_rows(path)
+    for name in rotated:
+        with gzip.open(tmp_path / name, "rt", encoding="utf-8", newline="") as file:
+            rows += list(csv.reader(file))
+    assert sorted(row[0] for row in rows) == [f"question number {i:03d}" for i in range(100)]
+
+
+def test_rotates_when_period_changes(tmp_path):
+    path = str(tmp_path / "log.csv")
+    with open(path, "w") as file:
+        file.write("old,row\n")
+    with open(path + ".period", "w") as file:
+        file.write("20000101")
+    writer = request_log.LogWriter(path, rotate="daily", flush_seconds=0.05)
+    writer.write(["new", "row"])
+    writer.close()
+
+    assert read_rows(path) == [["new", "row"]]
+    assert len([name for name in os.listdir(tmp_path) if name.endswith(".gz")]) == 1
+
+
+def write_from_process(path, worker):
+    writer = request_log.LogWriter(path, batch_size=7, flush_seconds=0.01)
+    for i in range(200):
+        writer.write([worker, i, "padding " * 50])
+    writer.close()
+
+
+def test_workers_do_not_interleave_rows(tmp_path):
+    path = str(tmp_path / "log.csv")
+    workers = [multiprocessing.Process(target=write_from_process, args=(path, worker)) for worker in range(4)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join()
+
+    rows = read_rows(path)
+    assert len(rows) == 800
+    assert all(len(row) == 3 and row[2] == "padding " * 50 for row in rows)
+    for worker in range(4):
+        assert [int(row[1]) for row in rows if row[0] == str(worker)] == list(range(200))
+
+
+class Point:
+    def __init__(self, id, score):
+        self.id = id
+        self.score = score
+
+
+class Usage:
+    prompt_tokens = 900
+    completion_tokens = 40
+    prompt_tokens_details = None
+
+
+class Answer:
+    model = "gpt-4o-mini"
+    usage = Usage()
+
+
+def test_record_keeps_ids_and_usage_not_text():
+    timings = {}
+    with request_log.timed(timings, "search"):
+        pass
+    record = request_log.make_record("how many credits?", 690, [[Point("a", 0.81234)], [Point("b", 0.5)]],
+                                     timings, Answer())
+    assert record["course"] == "690"
+    assert record["chunks"] == [{"id": "a", "score": 0.8123}, {"id": "b", "score": 0.5}]
+    assert (record["model"], record["prompt_tokens"], record["cached_tokens"]) == ("gpt-4o-mini", 900, None)
+    assert record["search_s"] >= 0 and record["llm_s"] is None
+
+
+def test_jsonl_rotation_archives_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "log.jsonl")
+    writer = request_log.LogWriter(path, max_bytes=2000, rotate="", batch_size=5, flush_seconds=0.05,
+                                   fmt="jsonl", archive="parquet")
+    for i in range(50):
+        writer.write(request_log.make_record(f"question {i}", "", [[Point(str(i), 0.5)]], {"total": 0.1}))
+    writer.close()
+
+    rows = request_log.read_jsonl(path)
+    for name in os.listdir(tmp_path):
+        if name.endswith(".parquet"):
+            rows += pq.read_table(tmp_path / name).to_pylist()
+    assert sorted(int(row["question"].split()[1]) for row in rows) == list(range(50))
+    assert all(row["chunks"][0]["score"] == 0.5 for row in rows)
+
+
+def test_convert_old_log(tmp_path):
+    old = tmp_path / "log.csv"
+    answer = ("ChatCompletion(id='x', model='gpt-4o-mini-2024-07-18', usage=CompletionUsage(completion_tokens=58, "
+              "prompt_tokens=4337, total_tokens=4395, prompt_tokens_details=PromptTokensDetails(cached_tokens=4096)))")
+    with open(old, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(["what is on week 7", "[dict_values(['text'])]", answer, "1.69453", "893", "2024-11-27 18:44:53.379347"])
+        writer.writerow(["hi", "[]", "answer cache hit", "0.01", "none", "2024-11-28 10:00:00.000001", "12"])
+        writer.writerow(["broken row"])
+    out = str(tmp_path / "log.jsonl")
+
+    assert convert_log.convert_log(str(old), out) == (2, 1)
+    first, second = request_log.read_jsonl(out)
+    assert (first["model"], first["prompt_tokens"], first["completion_tokens"], first["cached_tokens"]) == \
+        ("gpt-4o-mini-2024-07-18", 4337, 58, 4096)
+    assert first["total_s"] == 1.6945 and first["course"] == "893" and first["ts"] == "2024-11-27T18:44:53.379"
+    assert second["cache_hit"] and second["course"] is None and second["saved_tokens"] == 12
@@ -0,0 +1,58 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import session_store
+import state_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return session_store.SessionStore(state_backend.InProcessBackend(), ttl=60)
+    return session_store.SessionStore(state_backend.SQLiteBackend(str(tmp_path / "state.db")), ttl=60)
+
+
+def test_round_trip(store):
+    conversation = session_store.new_conversation()
+    conversation["history"].append({"role": "user", "content": "How many credits?"})
+    conversation["course"] = 690
+    store.put("abc", conversation)
+
+    assert store.get("abc") == conversation
+    assert store.get("missing") is None
+
+    store.delete("abc")
+    assert store.get("abc") is None
+
+
+def test_idle_conversations_expire(store, monkeypatch):
+    store.put("abc", session_store.new_conversation())
+    now = state_backend.time.time()
+    monkeypatch.setattr(state_backend.time, "time", lambda: now + 120)
+
+    assert store.get("abc") is None
+
+
+def test_long_history_stays_compact():
+    conversation = session_store.new_conversation()
+    conversation["history"] = [{"role": "user", "content": "What are the office hours for COMP690?"}] * 200
+    assert len(session_store.encode(conversation)) < 1000
+
+
+def test_summary_is_kept_apart_from_the_conversation(store):
+    store.put("abc", session_store.new_conversation())
+    store.put_summary("abc", "asked about credits", 4)
+    conversation = store.get("abc")
+    assert conversation["summary"] == "asked about credits" and conversation["summarized"] == 4
+
+    # a put of an older copy doesn't roll the summary back
+    conversation["summary"], conversation["summarized"] = "", 0
+    store.put("abc", conversation)
+    assert store.get("abc")["summarized"] == 4
+
+    store.reset("abc")
+    assert store.get("abc") == session_store.new_conversation()
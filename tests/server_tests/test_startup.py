@@ -0,0 +1,64 @@
+import os
+import sys
+import types
+import subprocess
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient, models
+
+ROOT = os.path.join(os.path.dirname(__file__), "..", "..")
+sys.path.insert(0, ROOT)
+
+import startup
+
+
+class FakeEmbed:
+    def embed(self, texts):
+        for _ in texts:
+            yield np.ones(4, dtype=np.float32)
+
+
+def test_report_lists_phases_and_import_budget():
+    timer = startup.StartupTimer(import_seconds=3.0)
+    with timer.phase("embedding model"):
+        pass
+    report = timer.report(import_budget=2)
+    assert "imports" in report and "embedding model" in report and "total" in report
+    assert "over the 2.00s budget" in report
+    assert "budget" not in timer.report(import_budget=5)
+
+
+def test_warm_up_touches_every_existing_collection():
+    client = QdrantClient(":memory:")
+    client.create_collection("default", vectors_config=models.VectorParams(size=4, distance=models.Distance.DOT))
+    searched = []
+    search = client.search
+    client.search = lambda **kwargs: searched.append(kwargs["collection_name"]) or search(**kwargs)
+    listed = []
+    open_client = types.SimpleNamespace(models=types.SimpleNamespace(list=lambda: listed.append(True)))
+
+    timer = startup.StartupTimer()
+    startup.warm_up(timer, FakeEmbed(), client, open_client, ["default", "690"])
+
+    assert searched == ["default"] and listed
+    assert [name for name, _ in timer.phases] == ["warm-up embed", "warm-up search", "warm-up openai"]
+    assert not timer.failures
+
+
+def test_warm_up_failures_do_not_stop_startup():
+    def unreachable():
+        raise ConnectionError("no route to api.openai.com")
+
+    timer = startup.StartupTimer()
+    startup.warm_up(timer, FakeEmbed(), QdrantClient(":memory:"), types.SimpleNamespace(
+        models=types.SimpleNamespace(list=unreachable)), ["default"])
+    assert timer.failures == [("warm-up openai", "ConnectionError: no route to api.openai.com")]
+    assert "warm-up openai failed" in timer.report()
+
+
+def test_bot_import_skips_unused_modules():
+    pytest.importorskip("fastembed")
+    code = "import sys, chatbot_fat; print(sorted({'PyPDF2', 'qdrant.artifacts', 'pyarrow'} & set(sys.modules)))"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert output.stdout.strip() == "[]"
@@ -0,0 +1,112 @@
+import os
+import sys
+
+import pytest
+from qdrant_client import QdrantClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import answer_cache
+import state_backend
+from qdrant import schema
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return state_backend.InProcessBackend(max_items=100)
+    if request.param == "sqlite":
+        return state_backend.SQLiteBackend(str(tmp_path / "state.db"))
+    fakeredis = pytest.importorskip("fakeredis")
+    return state_backend.RedisBackend(client=fakeredis.FakeRedis())
+
+
+def test_get_set_delete(backend):
+    backend.set("key", b"value")
+    assert backend.get("key") == b"value"
+    backend.delete("key")
+    assert backend.get("key") is None
+
+
+def test_counters(backend):
+    assert backend.incr("hits") == 1
+    assert backend.incr("hits", 4) == 5
+    assert backend.count("hits") == 5
+    assert backend.count("never") == 0
+
+
+def test_sqlite_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "state.db")
+    first, second = state_backend.SQLiteBackend(path), state_backend.SQLiteBackend(path)
+
+    first.set("session:abc", b"conversation")
+    first.incr("requests")
+    second.incr("requests")
+
+    assert second.get("session:abc") == b"conversation"
+    assert first.count("requests") == 2
+
+
+def test_expired_counter_starts_over(tmp_path, monkeypatch):
+    backend = state_backend.SQLiteBackend(str(tmp_path / "state.db"))
+    backend.incr("rate", ttl=60)
+    backend.incr("rate", ttl=60)
+    now = state_backend.time.time()
+    monkeypatch.setattr(state_backend.time, "time", lambda: now + 61)
+
+    assert backend.incr("rate", ttl=60) == 1
+
+
+def test_in_process_backend_evicts_least_recently_used():
+    backend = state_backend.InProcessBackend(max_items=2)
+    backend.set("a", b"1")
+    backend.set("b", b"2")
+    backend.get("a")
+    backend.set("c", b"3")
+
+    assert backend.get("b") is None
+    assert backend.get("a") == b"1"
+
+
+def test_answer_cache_shares_normalized_questions(backend):
+    cache = answer_cache.AnswerCache(backend, ttl=60)
+    assert cache.get("Office hours?") is None
+
+    cache.put("Office hours?", "Monday 1-4pm", 690)
+
+    assert cache.get("  office HOURS ") == {"answer": "Monday 1-4pm", "course": 690}
+    assert backend.count("stats:answer_cache:hits") == 1
+    assert backend.count("stats:answer_cache:misses") == 1
+
+
+def test_answers_from_before_a_reindex_are_not_served(backend):
+    client = QdrantClient(":memory:")
+    schema.create_collection(client, "690__1")
+    schema.point_aliases(client, {"690": "690__1"})
+    cache = answer_cache.AnswerCache(backend, ttl=60, corpus_version=answer_cache.CorpusVersion(client, ["690"], 0))
+    cache.put("Office hours?", "Monday 1-4pm", 690)
+    assert cache.get("Office hours?") is not None
+
+    schema.create_collection(client, "690__2")
+    schema.point_aliases(client, {"690": "690__2"})
+    assert cache.get("Office hours?") is None
+
+
+def test_unreachable_qdrant_is_a_cache_miss(backend):
+    class Down:
+        def get_aliases(self):
+            raise ConnectionError("qdrant down")
+    cache = answer_cache.AnswerCache(backend, ttl=60, corpus_version=answer_cache.CorpusVersion(Down(), ["690"], 0))
+    cache.put("Office hours?", "Monday 1-4pm", 690)
+    assert cache.get("Office hours?") is None
+    assert backend.count("stats:answer_cache:misses") == 1
+
+
+def test_redis_counter_always_gets_its_ttl():
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeRedis()
+    backend = state_backend.RedisBackend(client=client)
+    assert backend.incr("rate", ttl=60) == 1 and client.ttl("rate") == 60
+    # a counter left without a ttl gets one on its next increment
+    client.set("orphan", 3)
+    assert backend.incr("orphan", ttl=60) == 4 and client.ttl("orphan") == 60
@@ -0,0 +1,50 @@
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import state_backend
+import token_usage
+
+
+def completion(prompt, completion_tokens, cached=None):
+    details = None if cached is None else types.SimpleNamespace(cached_tokens=cached)
+    usage = types.SimpleNamespace(prompt_tokens=prompt, completion_tokens=completion_tokens,
+                                  prompt_tokens_details=details)
+    return types.SimpleNamespace(usage=usage)
+
+
+def test_usage_counts_handles_missing_fields():
+    assert token_usage.usage_counts(completion(900, 40, 512)) == {"prompt": 900, "completion": 40, "cached": 512}
+    assert token_usage.usage_counts(completion(900, 40)) == {"prompt": 900, "completion": 40, "cached": 0}
+    assert token_usage.usage_counts(types.SimpleNamespace()) == {"prompt": 0, "completion": 0, "cached": 0}
+
+
+def test_record_adds_to_session_and_day_totals():
+    accounting = token_usage.TokenAccounting(state_backend.InProcessBackend())
+    accounting.record("sid", "", "gpt-4o-mini", completion(100, 10), day="2025-01-06")
+    accounting.record("sid", 690, "gpt-4o-mini", completion(4000, 60, 3000), day="2025-01-06")
+    accounting.record("sid", 690, "gpt-4.1-nano", completion(2000, 30), day="2025-01-07")
+
+    assert accounting.session_tokens("sid") == 6200 and accounting.session_tokens("other") == 0
+    totals = accounting.day_totals("2025-01-06", ["690", "893", "none"], ["gpt-4o-mini", "gpt-4.1-nano"])
+    assert totals == {("none", "gpt-4o-mini"): {"prompt": 100, "completion": 10, "cached": 0},
+                      ("690", "gpt-4o-mini"): {"prompt": 4000, "completion": 60, "cached": 3000}}
+
+
+def test_session_limit():
+    backend = state_backend.InProcessBackend()
+    accounting = token_usage.TokenAccounting(backend, session_limit=1000)
+    assert not accounting.over_limit("sid")
+    accounting.record("sid", "", "gpt-4o-mini", completion(950, 50))
+    assert accounting.over_limit("sid")
+    assert not token_usage.TokenAccounting(backend).over_limit("sid")
+
+
+def test_cost():
+    counts = {"prompt": 1_000_000, "completion": 1_000_000, "cached": 500_000}
+    assert token_usage.cost(counts, "gpt-4o-mini") == pytest.approx(0.5 * 0.15 + 0.5 * 0.075 + 0.60)
+    assert token_usage.cost(counts, "unknown-model") is None
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import configparser
+
+import pytest
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.trace import StatusCode
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+
+import tracing
+
+
+@pytest.fixture
+def exported(monkeypatch):
+    exporter, slow = InMemorySpanExporter(), InMemorySpanExporter()
+    monkeypatch.setattr(tracing.TAIL, "exporter", exporter)
+    monkeypatch.setattr(tracing.TAIL, "slow_exporter", slow)
+    monkeypatch.setattr(tracing.TAIL, "sample_rate", 1.0)
+    monkeypatch.setattr(tracing.TAIL, "slow_seconds", 0)
+    return exporter, slow
+
+
+def test_nested_spans_export_one_trace(exported):
+    exporter, _ = exported
+    with tracing.span("handle_post") as root:
+        with tracing.span("search_db", {"db.collection": "690"}) as search:
+            search.set_attribute("db.hits", 15)
+        assert not exporter.get_finished_spans()
+
+    search, post = exporter.get_finished_spans()
+    assert (post.name, search.name) == ("handle_post", "search_db")
+    assert search.parent.span_id == post.context.span_id == root.get_span_context().span_id
+    assert search.context.trace_id == post.context.trace_id
+    assert dict(search.attributes) == {"db.collection": "690", "db.hits": 15}
+    assert post.resource.attributes["service.name"] == tracing.SERVICE_NAME
+
+
+def test_errors_mark_the_span(exported):
+    exporter, _ = exported
+    with pytest.raises(ConnectionError):
+        with tracing.span("openai.answer"):
+            raise ConnectionError("timed out")
+
+    [span] = exporter.get_finished_spans()
+    assert span.status.status_code == StatusCode.ERROR
+    assert span.events[0].name == "exception"
+
+
+def test_slow_traces_are_kept_when_not_sampled(exported, monkeypatch):
+    exporter, slow = exported
+    monkeypatch.setattr(tracing.TAIL, "sample_rate", 0)
+    monkeypatch.setattr(tracing.TAIL, "slow_seconds", 0.5)
+    with tracing.span("fast"):
+        pass
+    with tracing.span("slow") as span:
+        # started a second ago
+        span._start_time -= 10**9
+
+    assert not exporter.get_finished_spans()
+    assert [span.name for span in slow.get_finished_spans()] == ["slow"]
+
+
+def test_traced_decorator_and_set_attribute(exported):
+    exporter, _ = exported
+
+    @tracing.traced("get_context")
+    def get_context():
+        tracing.set_attribute("chatbot.course", "893")
+        return "893"
+
+    assert get_context() == "893"
+    tracing.set_attribute("outside", "ignored")
+    [span] = exporter.get_finished_spans()
+    assert span.name == "get_context" and dict(span.attributes) == {"chatbot.course": "893"}
+
+
+def test_file_exporter_writes_a_span_per_line(tmp_path, monkeypatch):
+    config = configparser.ConfigParser()
+    config.read_dict({"settings": {"data_dir": f"{tmp_path}/", "trace_exporter": "file", "trace_sample_rate": "1"}})
+    monkeypatch.setattr(tracing.TAIL, "exporter", None)
+    tracing.configure(config)
+    with tracing.span("handle_post"):
+        with tracing.span("get_rag"):
+            pass
+    tracing.TAIL.exporter.out.writer.close()
+
+    lines = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    assert [line["name"] for line in lines] == ["get_rag", "handle_post"]
+    assert lines[0]["context"]["trace_id"] == lines[1]["context"]["trace_id"]
@@ -0,0 +1,120 @@
+""" Token accounting from the usage OpenAI returns with every completion
+
+Each call's prompt, completion and cached tokens are added to daily counters in
+the shared state backend, keyed by course and model, so every worker adds to the
+same totals. The session's prompt and completion tokens go to a counter keyed by
+its session id, checked against session_token_limit; it outlives the conversation,
+so reloading the page or switching course doesn't start the session over. Run this file for a daily report with estimated cost.
+
+    python token_usage.py
+    python token_usage.py --days 30
+"""
+import time
+import argparse
+import configparser
+
+KINDS = ["prompt", "completion", "cached"]
+# seconds a session's token count is kept, from its first call
+SESSION_WINDOW = 86400
+# US$ per million tokens: prompt, cached prompt, completion
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+
+def usage_counts(response):
+    """ {"prompt", "completion", "cached"} tokens of a chat completion, zeros when usage is missing """
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt": getattr(usage, "prompt_tokens", None) or 0,
+        "completion": getattr(usage, "completion_tokens", None) or 0,
+        "cached": getattr(details, "cached_tokens", None) or 0,
+    }
+
+
+def cost(counts, model):
+    """ Estimated US$ for token counts of one model, None for a model without a price """
+    if model not in PRICES:
+        return None
+    prompt, cached, completion = PRICES[model]
+    return ((counts["prompt"] - counts["cached"]) * prompt + counts["cached"] * cached
+            + counts["completion"] * completion) / 1e6
+
+
+def course_label(course):
+    return str(course) if course else "none"
+
+
+class TokenAccounting:
+    def __init__(self, backend, session_limit=0, retention_days=90):
+        self.backend = backend
+        self.session_limit = session_limit
+        self.ttl = retention_days * 86400
+
+    def key(self, day, course, model, kind):
+        return f"tokens:{day}:{course}:{model}:{kind}"
+
+    def session_key(self, session_id):
+        return f"session_tokens:{session_id}"
+
+    def record(self, session_id, course, model, response, day=None):
+        """ Adds a completion's usage to the session's and the day's totals, returns the counts """
+        counts = usage_counts(response)
+        day = day or time.strftime("%Y-%m-%d")
+        for kind, count in counts.items():
+            if count:
+                self.backend.incr(self.key(day, course_label(course), model, kind), count, self.ttl)
+        if counts["prompt"] + counts["completion"]:
+            self.backend.incr(self.session_key(session_id), counts["prompt"] + counts["completion"], SESSION_WINDOW)
+        return counts
+
+    def session_tokens(self, session_id):
+        return self.backend.count(self.session_key(session_id))
+
+    def over_limit(self, session_id):
+        """ True once the session has used session_token_limit tokens, 0 means no limit """
+        return bool(self.session_limit) and self.session_tokens(session_id) >= self.session_limit
+
+    def day_totals(self, day, courses, models):
+        """ {(course, model): counts} for every pair that used tokens that day """
+        totals = {}
+        for course in courses:
+            for model in models:
+                counts = {kind: self.backend.count(self.key(day, course, model, kind)) for kind in KINDS}
+                if any(counts.values()):
+                    totals[(course, model)] = counts
+        return totals
+
+
+def make_accounting(config, backend):
+    return TokenAccounting(backend, config.getint("settings", "session_token_limit", fallback=0),
+                           config.getint("settings", "token_retention_days", fallback=90))
+
+
+if __name__ == "__main__":
+    import state_backend
+    from qdrant import schema
+
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type = int, default = 7, help = "how many days back to report")
+    args = parser.parse_args()
+
+    config = configparser.ConfigParser()
+    config.read("config.txt")
+    if config.get("settings", "state_backend", fallback="memory") == "memory":
+        print("state_backend is memory, token totals only live inside the bot process")
+    accounting = make_accounting(config, state_backend.make_backend(config))
+    courses = [course for course in schema.COLLECTIONS if course != "default"] + ["none"]
+    models = set(PRICES) | {config.get("settings", name, fallback="gpt-4o-mini")
+                            for name in ("answer_model", "degraded_model", "summary_model")}
+
+    print(f"{'day':<12}{'course':<16}{'model':<16}{'prompt':>10}{'cached':>10}{'completion':>12}{'cost $':>10}")
+    for back in range(args.days - 1, -1, -1):
+        day = time.strftime("%Y-%m-%d", time.localtime(time.time() - back * 86400))
+        for (course, model), counts in sorted(accounting.day_totals(day, courses, sorted(models)).items()):
+            spent = cost(counts, model)
+            print(f"{day:<12}{course:<16}{model:<16}{counts['prompt']:>10}{counts['cached']:>10}{counts['completion']:>12}"
+                  f"{'-' if spent is None else f'{spent:.4f}':>10}")
@@ -0,0 +1,111 @@
+""" Per-request traces of the RAG pipeline, kept with the OpenTelemetry sdk
+
+Spans nest through the OpenTelemetry context, so a span opened inside another
+joins its trace. The spans of a trace are held until its outermost span ends
+(TailSampling), then a trace_sample_rate share of traces (TraceIdRatioBased)
+is exported, one span as json per line, to traces.jsonl in data_dir or the
+console. Any trace slower than slow_request_seconds is always written to
+slow.jsonl as well, so slow requests are kept whatever the sample rate.
+"""
+import sys
+import json
+import functools
+import threading
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider, SpanProcessor
+from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+from opentelemetry.sdk.trace.sampling import TraceIdRatioBased
+import request_log
+
+SERVICE_NAME = "unh-internship-chatbot"
+EXPORTERS = ["file", "console", "none"]
+
+
+class TailSampling(SpanProcessor):
+    """ Exports whole traces once their root span ends: a sample_rate share to exporter, and every
+    trace slower than slow_seconds to slow_exporter """
+    def __init__(self, exporter=None, slow_exporter=None, sample_rate=1.0, slow_seconds=0):
+        self.exporter = exporter
+        self.slow_exporter = slow_exporter
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_seconds
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        with self.lock:
+            spans = self.pending.setdefault(trace_id, [])
+            spans.append(span)
+            if span.parent is not None:
+                return
+            del self.pending[trace_id]
+        if self.exporter and TraceIdRatioBased(self.sample_rate).should_sample(None, trace_id, span.name).decision.is_sampled():
+            self.exporter.export(spans)
+        if self.slow_exporter and self.slow_seconds and (span.end_time - span.start_time) / 1e9 > self.slow_seconds:
+            self.slow_exporter.export(spans)
+
+
+class WriterStream:
+    """ File-like front of a request_log writer, so ConsoleSpanExporter can write to a log file """
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, line):
+        self.writer.write(json.loads(line))
+
+    def flush(self):
+        pass
+
+
+def span_line(span):
+    return span.to_json(indent=None) + "\n"
+
+
+def make_exporter(out=None):
+    return ConsoleSpanExporter(out=out or sys.stdout, formatter=span_line)
+
+
+# every span is recorded, TailSampling decides what is exported
+PROVIDER = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+TAIL = TailSampling()
+PROVIDER.add_span_processor(TAIL)
+TRACER = PROVIDER.get_tracer("chatbot")
+
+
+def span(name, attributes=None):
+    return TRACER.start_as_current_span(name, attributes=attributes)
+
+
+def set_attribute(key, value):
+    """ Sets an attribute on the innermost open span, if there is one """
+    trace.get_current_span().set_attribute(key, value)
+
+
+def traced(name):
+    """ Runs the decorated function in a span """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def configure(config):
+    """ Sets up the exporters from the trace_* and slow_request_seconds settings """
+    exporter = config.get("settings", "trace_exporter", fallback="none")
+    if exporter not in EXPORTERS:
+        raise ValueError(f"unknown trace_exporter {exporter}")
+    if exporter == "file":
+        TAIL.exporter = make_exporter(WriterStream(request_log.make_writer(config, "traces.jsonl", "jsonl", "gzip")))
+    elif exporter == "console":
+        TAIL.exporter = make_exporter()
+    else:
+        TAIL.exporter = None
+    TAIL.sample_rate = config.getfloat("settings", "trace_sample_rate", fallback=1.0)
+    TAIL.slow_seconds = config.getfloat("settings", "slow_request_seconds", fallback=0)
+    TAIL.slow_exporter = (make_exporter(WriterStream(request_log.make_writer(config, "slow.jsonl", "jsonl", "gzip")))
+                          if TAIL.slow_seconds else None)
@@ -0,0 +1,12 @@
+""" Entry point for the gunicorn launcher, see gunicorn.conf.py
+
+    gunicorn
+
+Loads what the workers share in the master; each worker connects after the fork.
+"""
+import chatbot_fat
+
+# onnxruntime's intra-op thread pool doesn't survive a fork (workers crash on exit),
+# and with a worker process per core one inference thread each is all the cores allow anyway
+chatbot_fat.load(embed_threads=1)
+app = chatbot_fat.app